@@ -0,0 +1,204 @@
+import math
+import random
+import threading
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import database
+import shards
+
+# Computerized adaptive testing (exams with exam_type 'adaptive'). Each student
+# gets test_length questions from the exam subject's whole bank, one at a
+# time: after every answer the ability estimate is updated and the next
+# question is the most informative one at that ability.
+#
+# Items follow the three-parameter logistic model,
+#     P(correct | theta) = c + (1 - c) / (1 + exp(-D * a * (theta - b))),
+# with a, b, c from item_params (imported, or calibrated from past answers by
+# calibrate_item_params) and defaults from difficulty_level otherwise.
+#
+# ItemBank precomputes, over a fixed ability grid, the information of every
+# distinct (a, b, c) and the items ranked by it at each grid point, plus
+# log P and log(1 - P) tables for scoring. Picking the next item is then a walk
+# down one precomputed ranking until an unused item turns up, and an estimate
+# is one table lookup per answer and grid point. Banks are cached per storage
+# and subject until questions or item parameters change.
+#
+# Abilities are EAP estimates (posterior mean over the grid, standard normal
+# prior) with the posterior SD as standard error. The score is the prior
+# percentile of the final estimate on the usual 0-10 scale, scaled down by the
+# share of the test left unanswered so that stopping early never pays.
+
+D = 1.7
+GRID = tuple(-4.0 + 0.1 * i for i in range(81))
+PRIOR = array("d", (-0.5 * t * t for t in GRID))  # log N(0, 1) up to a constant
+RANDOMESQUE = 3  # pick among this many of the best unused items, so equal abilities do not all see the same question
+
+# Used for questions without a row in item_params
+DEFAULT_A = 1.0
+DEFAULT_C = 0.2
+DEFAULT_B = {"easy": -1.0, "medium": 0.0, "hard": 1.0}
+
+Params = Tuple[float, float, float]  # (a, b, c)
+
+
+def probability(params: Params, theta: float) -> float:
+    a, b, c = params
+    return c + (1.0 - c) / (1.0 + math.exp(-D * a * (theta - b)))
+
+
+def information(params: Params, theta: float) -> float:
+    a, b, c = params
+    p = probability(params, theta)
+    return (D * a) ** 2 * ((1.0 - p) / p) * ((p - c) / (1.0 - c)) ** 2
+
+
+def grid_index(theta: float) -> int:
+    return min(len(GRID) - 1, max(0, round((theta - GRID[0]) / (GRID[1] - GRID[0]))))
+
+
+def ability_score(theta: float) -> float:
+    # 0-10, the share of a standard normal population below theta
+    return 10.0 * 0.5 * (1.0 + math.erf(theta / math.sqrt(2.0)))
+
+
+def attempt_score(bank: "ItemBank", responses: Sequence[Tuple[int, bool]], test_length: int) -> float:
+    # responses: the answered steps only
+    if not responses: return 0.0
+    theta, _ = bank.estimate(responses)
+    return ability_score(theta) * min(1.0, len(responses) / test_length if test_length else 1.0)
+
+
+class ItemBank:
+    def __init__(self, subject_id: int, items: Sequence[Tuple[int, Params]]):
+        self.subject_id = subject_id
+        # Items sharing (a, b, c) share every table row (uncalibrated banks have three)
+        self.params: List[Params] = []
+        self.members: List[array] = []
+        self.group_of: Dict[int, int] = {}
+        index: Dict[Params, int] = {}
+        for question_id, params in items:
+            k = index.get(params)
+            if k is None:
+                k = index[params] = len(self.params)
+                self.params.append(params)
+                self.members.append(array("q"))
+            self.members[k].append(question_id)
+            self.group_of[question_id] = k
+        # Per grid point: groups best first, and information / log P / log(1 - P) per group
+        self.ranking: List[array] = []
+        self.info: List[array] = []
+        self.log_p: List[array] = []
+        self.log_q: List[array] = []
+        for theta in GRID:
+            prob = [probability(p, theta) for p in self.params]
+            info = array("d", ((D * a) ** 2 * ((1.0 - x) / x) * ((x - c) / (1.0 - c)) ** 2
+                               for (a, _, c), x in zip(self.params, prob)))  # information() from prob
+            self.info.append(info)
+            self.ranking.append(array("l", sorted(range(len(info)), key=info.__getitem__, reverse=True)))
+            self.log_p.append(array("d", map(math.log, prob)))
+            self.log_q.append(array("d", (math.log(1.0 - x) for x in prob)))
+
+    def __len__(self):
+        return len(self.group_of)
+
+    def select(self, theta: float, administered: Set[int], rnd: random.Random = random) -> Optional[int]:
+        # Most informative unused item at theta; ties and near ties are spread over RANDOMESQUE items
+        candidates: List[int] = []
+        for k in self.ranking[grid_index(theta)]:
+            members = self.members[k]
+            if len(members) > 4 * RANDOMESQUE:
+                # Large group (uncalibrated bank): draw instead of filtering it all
+                for _ in range(8 * RANDOMESQUE):
+                    q = members[rnd.randrange(len(members))]
+                    if q not in administered and q not in candidates:
+                        candidates.append(q)
+                        if len(candidates) == RANDOMESQUE: break
+            if len(candidates) < RANDOMESQUE:
+                candidates.extend(q for q in members if q not in administered and q not in candidates)
+            if len(candidates) >= RANDOMESQUE: break
+        return rnd.choice(candidates[:RANDOMESQUE]) if candidates else None
+
+    def estimate(self, responses: Iterable[Tuple[int, bool]]) -> Tuple[float, float]:
+        # EAP and posterior SD; items no longer in the bank are left out
+        groups = [(self.group_of[q], correct) for q, correct in responses if q in self.group_of]
+        log_post = []
+        for g in range(len(GRID)):
+            log_p, log_q = self.log_p[g], self.log_q[g]
+            log_post.append(PRIOR[g] + sum(log_p[k] if correct else log_q[k] for k, correct in groups))
+        top = max(log_post)
+        weights = [math.exp(x - top) for x in log_post]
+        total = sum(weights)
+        mean = sum(w * t for w, t in zip(weights, GRID)) / total
+        var = sum(w * (t - mean) ** 2 for w, t in zip(weights, GRID)) / total
+        return mean, math.sqrt(var)
+
+
+def default_params(difficulty_level: str) -> Params:
+    return (DEFAULT_A, DEFAULT_B.get((difficulty_level or "").strip().lower(), 0.0), DEFAULT_C)
+
+
+def load_item_bank(cursor, subject_id: int) -> ItemBank:
+    cursor.execute("""
+        SELECT q.question_id, q.difficulty_level, p.a, p.b, p.c
+        FROM questions q LEFT JOIN item_params p ON p.question_id = q.question_id
+        WHERE q.subject_id = ?
+        ORDER BY q.question_id
+    """, (subject_id,))
+    return ItemBank(subject_id, [(r[0], (r[2], r[3], r[4]) if r[2] is not None else default_params(r[1]))
+                                 for r in cursor.fetchall()])
+
+
+class ItemBankCache:
+    # Keyed by storage and subject, like grading.AnswerKeyCache
+    def __init__(self):
+        self._banks: Dict[Tuple[str, int], ItemBank] = {}
+        self._lock = threading.Lock()
+
+    def get(self, cursor, subject_id: int) -> ItemBank:
+        key = (database.current_storage().name, subject_id)
+        bank = self._banks.get(key)
+        if bank is None:
+            bank = load_item_bank(cursor, subject_id)
+            with self._lock:
+                self._banks[key] = bank
+        return bank
+
+    def invalidate(self, subject_id: int = None):
+        name = database.current_storage().name
+        with self._lock:
+            for key in [k for k in self._banks if k[0] == name and subject_id in (None, k[1])]:
+                del self._banks[key]
+
+
+item_banks = ItemBankCache()
+
+
+def calibrate_item_params(conn, min_responses: int = 30) -> List[tuple]:
+    # Rough calibration from classical statistics: b from the proportion correct
+    # (guessing removed), a and c left at their defaults. Only questions answered
+    # in at least min_responses graded attempts. Returns item_params rows for
+    # save_item_params; the scan runs on a reader, the upsert on the writer.
+    rows = conn.execute(f"""
+        SELECT d.question_id, AVG(d.is_correct), COUNT(*)
+        FROM {shards.details()} d JOIN {shards.results()} r ON r.result_id = d.result_id
+        WHERE r.status = 'completed' AND COALESCE(d.selected_answer, '') <> ''
+          AND d.question_id NOT IN (SELECT question_id FROM item_params WHERE source = 'import')
+        GROUP BY d.question_id HAVING COUNT(*) >= ?
+    """, (min_responses,)).fetchall()
+    params = []
+    for question_id, p, n in rows:
+        p_true = min(0.98, max(0.02, (p - DEFAULT_C) / (1.0 - DEFAULT_C)))
+        params.append((question_id, DEFAULT_A, -math.log(p_true / (1.0 - p_true)) / (D * DEFAULT_A), DEFAULT_C, "pvalue", n))
+    return params
+
+
+def save_item_params(cursor, params: List[tuple]) -> int:
+    # Imported parameters are kept, including ones imported since the scan
+    cursor.executemany("""
+        INSERT INTO item_params (question_id, a, b, c, source, responses) VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (question_id) DO UPDATE SET a = excluded.a, b = excluded.b, c = excluded.c,
+            source = excluded.source, responses = excluded.responses
+        WHERE item_params.source <> 'import'
+    """, params)
+    return len(params)
@@ -0,0 +1,173 @@
+import ast
+import json
+import mmap
+import os
+import struct
+from typing import Dict, List, Tuple
+
+import readpool
+import shards
+from grading import encode_option
+
+# Columnar export of the attempts x questions response matrix for analysts.
+# Each export is a directory of NumPy .npy files (format 1.0, written without
+# NumPy) that load with numpy.load(path, mmap_mode="r") and no parsing:
+#   options.npy      uint8 [attempts, questions]  0 = no answer, 1-4 = a-d
+#   correct.npy      int8  [attempts, questions]  1 / 0, -1 = not in attempt
+#   result_ids.npy, student_ids.npy, exam_ids.npy   int64 [attempts]
+#   scores.npy       float64 [attempts]
+#   question_ids.npy int64 [questions]
+# The matrices are filled through mmap while rows stream from the cursor, so
+# memory use does not grow with the number of attempts.
+
+NPY_MAGIC = b"\x93NUMPY"
+NOT_ASKED = -1
+
+
+def _npy_header(descr: str, shape: Tuple[int, ...]) -> bytes:
+    text = "{'descr': '%s', 'fortran_order': False, 'shape': %r, }" % (descr, tuple(shape))
+    # Magic + version + length prefix + header + newline padded to a 64-byte boundary
+    pad = -(len(NPY_MAGIC) + 4 + len(text) + 1) % 64
+    text = text + " " * pad + "\n"
+    return NPY_MAGIC + b"\x01\x00" + struct.pack("<H", len(text)) + text.encode("latin1")
+
+
+class NpyWriter:
+    # Preallocates the file and exposes the data area as a writable mmap slice
+    def __init__(self, path: str, descr: str, shape: Tuple[int, ...], fill: int = 0):
+        self.path = path
+        self.shape = tuple(shape)
+        itemsize = int(descr[2:])
+        header = _npy_header(descr, self.shape)
+        size = itemsize
+        for dim in self.shape: size *= dim
+        self.offset = len(header)
+        self._file = open(path, "w+b")
+        self._file.write(header)
+        self._file.truncate(self.offset + size)
+        self._map = mmap.mmap(self._file.fileno(), 0) if size else None
+        if size and fill:
+            self._map[self.offset:] = bytes([fill & 0xFF]) * size
+        self.data = memoryview(self._map)[self.offset:] if size else memoryview(b"")
+
+    def close(self):
+        self.data.release()
+        if self._map is not None:
+            self._map.flush()
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_npy(path: str) -> Tuple[str, Tuple[int, ...], memoryview]:
+    # Minimal reader for consumers without NumPy: (descr, shape, raw data)
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if mm[:6] != NPY_MAGIC: raise ValueError(f"{path} is not an .npy file")
+    major = mm[6]
+    if major == 1:
+        (hlen,), start = struct.unpack_from("<H", mm, 8), 10
+    else:
+        (hlen,), start = struct.unpack_from("<I", mm, 8), 12
+    header = ast.literal_eval(mm[start:start + hlen].decode("latin1"))
+    return header["descr"], tuple(header["shape"]), memoryview(mm)[start + hlen:]
+
+
+def _scope(cursor, exam_id: int = None, subject_id: int = None) -> Tuple[str, tuple, List[int]]:
+    # WHERE clause over results r plus the exam-defined question order
+    if exam_id is not None:
+        cursor.execute("SELECT question_id FROM exam_details WHERE exam_id = ? ORDER BY exam_detail_id", (exam_id,))
+        return "r.exam_id = ?", (exam_id,), [row[0] for row in cursor.fetchall()]
+    if subject_id is not None:
+        cursor.execute("""
+            SELECT DISTINCT ed.question_id FROM exam_details ed
+            JOIN exams e ON e.exam_id = ed.exam_id
+            WHERE e.subject_id = ? ORDER BY ed.question_id
+        """, (subject_id,))
+        return ("r.exam_id IN (SELECT exam_id FROM exams WHERE subject_id = ?)", (subject_id,),
+                [row[0] for row in cursor.fetchall()])
+    raise ValueError("exam_id or subject_id is required")
+
+
+def export_response_matrix(out_dir: str, exam_id: int = None, subject_id: int = None,
+                           progress=None) -> Dict:
+    os.makedirs(out_dir, exist_ok=True)
+    conn = readpool.connection(stale_ok=True)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN")  # one read snapshot for the counts and the row stream
+        where, params, qids = _scope(cursor, exam_id, subject_id)
+        # Answers to questions since removed from the exam still get a column
+        cursor.execute(f"""
+            SELECT DISTINCT r.question_id FROM {shards.answers()} r
+            WHERE {where} AND r.status = 'completed' AND r.question_id IS NOT NULL
+        """, params)
+        known = set(qids)
+        qids += sorted(row[0] for row in cursor.fetchall() if row[0] not in known)
+        cursor.execute(f"SELECT COUNT(*) FROM {shards.results()} r WHERE {where} AND r.status = 'completed'", params)
+        n_rows, n_cols = cursor.fetchone()[0], len(qids)
+        column = {qid: i for i, qid in enumerate(qids)}
+
+        path = lambda name: os.path.join(out_dir, name)
+        with NpyWriter(path("question_ids.npy"), "<i8", (n_cols,)) as w:
+            if n_cols: struct.pack_into(f"<{n_cols}q", w.data, 0, *qids)
+
+        writers = [
+            NpyWriter(path("options.npy"), "|u1", (n_rows, n_cols)),
+            NpyWriter(path("correct.npy"), "|i1", (n_rows, n_cols), fill=NOT_ASKED),
+            NpyWriter(path("result_ids.npy"), "<i8", (n_rows,)),
+            NpyWriter(path("student_ids.npy"), "<i8", (n_rows,)),
+            NpyWriter(path("exam_ids.npy"), "<i8", (n_rows,)),
+            NpyWriter(path("scores.npy"), "<f8", (n_rows,)),
+        ]
+        options, correct, result_ids, student_ids, exam_ids, scores = (w.data for w in writers)
+        try:
+            cursor.execute(f"""
+                SELECT r.result_id, r.student_id, r.exam_id, r.score, r.question_id, r.selected_answer, r.is_correct
+                FROM {shards.answers()} r
+                WHERE {where} AND r.status = 'completed'
+                ORDER BY r.result_id
+            """, params)
+            row, current = -1, None
+            while True:
+                batch = cursor.fetchmany(5000)
+                if not batch: break
+                for rid, sid, eid, score, qid, answer, ok in batch:
+                    if rid != current:
+                        row += 1
+                        current = rid
+                        struct.pack_into("<q", result_ids, row * 8, rid)
+                        struct.pack_into("<q", student_ids, row * 8, sid)
+                        struct.pack_into("<q", exam_ids, row * 8, eid)
+                        struct.pack_into("<d", scores, row * 8, score or 0.0)
+                        base = row * n_cols
+                    if qid is None: continue
+                    cell = base + column[qid]
+                    options[cell] = encode_option(answer)
+                    correct[cell] = 1 if ok else 0
+                if progress: progress(row + 1, n_rows)
+        finally:
+            del options, correct, result_ids, student_ids, exam_ids, scores
+            for w in writers: w.close()
+        conn.commit()
+    finally:
+        conn.close()
+
+    meta = {
+        "format": "npy",
+        "exam_id": exam_id,
+        "subject_id": subject_id,
+        "attempts": n_rows,
+        "questions": n_cols,
+        "option_codes": {"": 0, "a": 1, "b": 2, "c": 3, "d": 4},
+        "not_asked": NOT_ASKED,
+        "files": sorted(name for name in os.listdir(out_dir) if name.endswith(".npy")),
+    }
+    with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    return meta
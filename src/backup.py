@@ -0,0 +1,176 @@
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional, Tuple
+
+import database
+from jobs import PeriodicJob
+
+# Online snapshots through the SQLite backup API. Pages are copied in small
+# steps with a short pause between them so exam writers are never held up; a
+# snapshot is verified with integrity_check before it is moved into place.
+
+PAGES_PER_STEP = 256
+STEP_PAUSE = 0.002  # seconds yielded to other connections between steps
+MAX_RESTARTS = 3    # writes during a stepped copy restart it; after this, copy in one step
+
+_NAME = re.compile(r"^(?P<stem>.+)-(?P<stamp>\d{8}-\d{6})(?:-(?P<label>[\w-]+))?\.db$")
+
+
+class BackupError(Exception):
+    pass
+
+
+class _Restarted(Exception):
+    pass
+
+
+def _db_path() -> str:
+    path = database.current_storage().path
+    if path is None: raise BackupError("An in-memory database has no file to back up")
+    return path
+
+
+def backup_dir() -> str:
+    return os.path.join(os.path.dirname(_db_path()), "backups")
+
+
+def _stem() -> str:
+    return os.path.splitext(os.path.basename(_db_path()))[0]
+
+
+def _copy(src: sqlite3.Connection, dst: sqlite3.Connection, progress=None):
+    # A write to the source between steps makes SQLite restart the copy. Under
+    # sustained writes fall back to a single step, which in WAL mode reads one
+    # consistent snapshot without blocking writers.
+    for _ in range(MAX_RESTARTS):
+        seen = [None]
+
+        def step(status, remaining, total):
+            if seen[0] is not None and remaining >= seen[0]: raise _Restarted()
+            seen[0] = remaining
+            if progress: progress(total - remaining, total)
+            time.sleep(STEP_PAUSE)
+
+        try:
+            src.backup(dst, pages=PAGES_PER_STEP, progress=step)
+            return
+        except _Restarted:
+            continue
+    src.backup(dst, pages=-1)
+
+
+def integrity_errors(path: str) -> List[str]:
+    # Empty list when the file is a healthy database
+    if not os.path.exists(path): return [f"{path} does not exist"]
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            rows = [r[0] for r in conn.execute("PRAGMA integrity_check").fetchall()]
+            conn.execute("SELECT COUNT(*) FROM results").fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        return [str(e)]
+    return [] if rows == ["ok"] else rows
+
+
+def create_snapshot(dest: str = None, label: str = None, directory: str = None,
+                    progress: Optional[Callable[[int, int], object]] = None) -> str:
+    if dest is None:
+        directory = directory or backup_dir()
+        os.makedirs(directory, exist_ok=True)
+        name = f"{_stem()}-{datetime.now().strftime('%Y%m%d-%H%M%S')}{'-' + label if label else ''}.db"
+        dest = os.path.join(directory, name)
+    tmp = dest + ".part"
+    if os.path.exists(tmp): os.remove(tmp)
+
+    src = database.get_connection()
+    dst = sqlite3.connect(tmp)
+    try:
+        _copy(src, dst, progress)
+        # Snapshots are standalone files: no -wal/-shm next to them
+        dst.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        dst.close()
+        src.close()
+
+    errors = integrity_errors(tmp)
+    if errors:
+        os.remove(tmp)
+        raise BackupError(f"Snapshot failed verification: {'; '.join(errors[:5])}")
+    with open(tmp, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, dest)
+    return dest
+
+
+def list_snapshots(directory: str = None) -> List[Tuple[str, datetime, int]]:
+    # (path, taken_at, size) newest first
+    directory = directory or backup_dir()
+    if not os.path.isdir(directory): return []
+    snapshots = []
+    for name in os.listdir(directory):
+        m = _NAME.match(name)
+        if not m: continue
+        path = os.path.join(directory, name)
+        taken = datetime.strptime(m.group("stamp"), "%Y%m%d-%H%M%S")
+        snapshots.append((path, taken, os.path.getsize(path)))
+    snapshots.sort(key=lambda s: (s[1], os.path.getmtime(s[0])), reverse=True)
+    return snapshots
+
+
+def prune_snapshots(directory: str = None, keep: int = 24, max_age_days: float = None) -> List[str]:
+    # Keeps the newest `keep` snapshots (never fewer than one) and drops any older than max_age_days
+    snapshots = list_snapshots(directory)
+    cutoff = datetime.now() - timedelta(days=max_age_days) if max_age_days is not None else None
+    removed = []
+    for i, (path, taken, _) in enumerate(snapshots):
+        if i == 0: continue
+        if i >= keep or (cutoff is not None and taken < cutoff):
+            os.remove(path)
+            removed.append(path)
+    return removed
+
+
+def restore_snapshot(path: str, safety_snapshot: bool = True) -> Optional[str]:
+    # Copies a verified snapshot over the live database (through the backup API,
+    # so open connections see the change atomically). Returns the pre-restore
+    # snapshot path when one was taken.
+    errors = integrity_errors(path)
+    if errors: raise BackupError(f"Refusing to restore {path}: {'; '.join(errors[:5])}")
+    saved = create_snapshot(label="pre-restore") if safety_snapshot and os.path.exists(_db_path()) else None
+
+    src = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    dst = database.get_connection()
+    try:
+        src.backup(dst, pages=-1)
+        dst.execute("PRAGMA journal_mode=WAL")
+    finally:
+        dst.close()
+        src.close()
+
+    # Everything cached from the old contents: compiled answer keys and payloads,
+    # blueprint question indexes, adaptive item banks, pooled readers and their snapshot
+    from adaptive import item_banks
+    from blueprint import question_indexes
+    from grading import answer_keys
+    from payloads import exam_payloads
+    import readpool
+    answer_keys.clear()
+    exam_payloads.invalidate()
+    question_indexes.invalidate()
+    item_banks.invalidate()
+    readpool.drain()
+    return saved
+
+
+def start_scheduled_backups(interval: float = 3600, keep: int = 24, max_age_days: float = None,
+                            directory: str = None) -> PeriodicJob:
+    def snapshot_and_prune():
+        path = create_snapshot(directory=directory)
+        prune_snapshots(directory, keep, max_age_days)
+        return path
+    return PeriodicJob(interval, snapshot_and_prune, name="scheduled-backup", run_immediately=False).start()
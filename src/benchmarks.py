@@ -0,0 +1,764 @@
+import gc
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import database
+from countdown import Countdown
+from grading import AnswerKey
+
+
+def _timed(fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - t0
+
+
+def _best_of(repeat: int, fn, *args):
+    # Fastest of `repeat` runs with the collector off, like timeit
+    best, out = None, None
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            out, seconds = _timed(fn, *args)
+            best = seconds if best is None else min(best, seconds)
+    finally:
+        if gc_was_enabled: gc.enable()
+    return out, best
+
+
+def bench_grading(submissions: int = 10000, questions: int = 50, seed: int = 1, repeat: int = 5):
+    rnd = random.Random(seed)
+    qids = list(range(1, questions + 1))
+    correct = [rnd.choice("abcd") for _ in qids]
+    key = AnswerKey(1, qids, correct)
+    print(f"grading {submissions} submissions x {questions} questions (best of {repeat})")
+    # Blanks as stored by the answer sheet ("") and as a one-character placeholder
+    for blank in (" ", ""):
+        answer_dicts = [{qid: rnd.choice(["a", "b", "c", "d", blank]) for qid in qids} for _ in range(submissions)]
+
+        # Old approach: walk the Question list per submission
+        def per_question():
+            totals = []
+            for answers in answer_dicts:
+                totals.append(sum(1 for qid, c in zip(qids, correct) if answers.get(qid, "") == c))
+            return totals
+
+        def compiled():
+            return key.grade_many([key.answer_sheet(a) for a in answer_dicts])
+
+        sheets = [key.answer_sheet(a) for a in answer_dicts]
+        baseline, t_base = _best_of(repeat, per_question)
+        packed, t_packed = _best_of(repeat, compiled)
+        pre_encoded, t_compare = _best_of(repeat, key.grade_many, sheets)
+        assert baseline == packed == pre_encoded
+
+        print(f"  blanks {blank!r}:")
+        print(f"    per-question loop      : {t_base * 1000:8.1f} ms")
+        print(f"    compiled key (+encode) : {t_packed * 1000:8.1f} ms  ({t_base / t_packed:.2f}x)")
+        print(f"    compiled key (compare) : {t_compare * 1000:8.1f} ms")
+
+
+def bench_timer_drift(duration: int = 3600, max_stall_ms: int = 400, seed: int = 1):
+    # Simulated Tk loop on a fake clock: every callback fires late by up to
+    # max_stall_ms (busy loop, modal dialogs). Compare how late each timer
+    # declares time up against the real duration.
+    rnd = random.Random(seed)
+    now = [0.0]
+    clock = lambda: now[0]
+
+    remaining = duration
+    while remaining > 0:
+        now[0] += 1.0 + rnd.uniform(0, max_stall_ms) / 1000
+        remaining -= 1
+    old_overrun = now[0] - duration
+
+    now[0] = 0.0
+    countdown = Countdown(duration, clock=clock)
+    redraws, shown = 0, None
+    while not countdown.expired():
+        text = countdown.display()
+        if text != shown: redraws, shown = redraws + 1, text
+        now[0] += countdown.ms_until_next_tick() / 1000 + rnd.uniform(0, max_stall_ms) / 1000
+    new_overrun = now[0] - duration
+
+    print(f"timer over {duration}s with callbacks up to {max_stall_ms}ms late")
+    print(f"  decrement per tick : exam ends {old_overrun:8.1f} s late")
+    print(f"  monotonic deadline : exam ends {new_overrun:8.3f} s late ({redraws} redraws)")
+
+
+def _temp_database():
+    # Point the app at a scratch database file so benchmarks never touch quiz_app.db
+    path = os.path.join(tempfile.mkdtemp(prefix="quiz_bench_"), "bench.db")
+    database.DB_NAME = path
+    database.init_db()
+    database.seed_data()
+    return path
+
+
+def _vocabulary(rnd, size=20000):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rnd.choice(letters) for _ in range(rnd.randint(4, 10))) for _ in range(size)]
+
+
+def bench_search(questions: int = 200000, queries: int = 200, seed: int = 1):
+    from services import MasterDataService
+    rnd = random.Random(seed)
+    words = _vocabulary(rnd)
+    _temp_database()
+    conn = database.get_connection()
+    rows = []
+    for i in range(questions):
+        text = " ".join(rnd.choice(words) for _ in range(12))
+        rows.append((1 + i % 3, text, rnd.choice(words), rnd.choice(words), rnd.choice(words), rnd.choice(words),
+                     "a", rnd.choice(("easy", "medium", "hard"))))
+    _, t_load = _timed(conn.executemany, """
+        INSERT INTO questions (subject_id, content, option_a, option_b, option_c, option_d, correct_answer, difficulty_level)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+    conn.commit()
+    conn.close()
+
+    service = MasterDataService()
+    terms = [f"{rnd.choice(words)} {rnd.choice(words)[:3]}" for _ in range(queries)]
+    t0 = time.perf_counter()
+    for term in terms:
+        service.search_questions(term, subject_id=1, limit=50)
+    per_query = (time.perf_counter() - t0) / queries
+
+    print(f"search over {questions} questions (load + index: {t_load:.1f} s)")
+    print(f"  search_questions: {per_query * 1000:8.2f} ms/query")
+
+
+_STARTUP_PROBE = r"""
+import sys, time
+t0 = time.perf_counter()
+import database
+database.DB_NAME = sys.argv[1]
+import gui_app
+t_import = time.perf_counter()
+migrated = database.init_db()
+t_schema = time.perf_counter()
+try:
+    app = gui_app.QuizApp()
+    app.update()  # first paint of the login screen
+    t_paint = time.perf_counter()
+    app.destroy()
+except Exception:
+    t_paint = None  # no display available
+print(t_import - t0, t_schema - t_import, migrated, (t_paint - t0) if t_paint else -1)
+"""
+
+
+def bench_startup(runs: int = 5, target_ms: float = 500):
+    # Fresh interpreter per run against an already migrated scratch DB (the normal lab-machine case)
+    path = _temp_database()
+    here = os.path.dirname(os.path.abspath(__file__))
+    print(f"startup over {runs} runs (target: first paint < {target_ms:.0f} ms)")
+    for i in range(runs):
+        out = subprocess.run([sys.executable, "-c", _STARTUP_PROBE, path], cwd=here,
+                             capture_output=True, text=True, check=True).stdout.split()
+        t_import, t_schema, migrated, t_paint = float(out[0]), float(out[1]), out[2] == "True", float(out[3])
+        paint = f"{t_paint * 1000:7.1f} ms" if t_paint >= 0 else "   (no display)"
+        verdict = "" if t_paint < 0 else ("  OK" if t_paint * 1000 < target_ms else "  SLOW")
+        print(f"  run {i + 1}: import {t_import * 1000:6.1f} ms  init_db {t_schema * 1000:6.1f} ms"
+              f"{' (migrated)' if migrated else ''}  first paint {paint}{verdict}")
+
+
+def bench_writes(students: int = 40, answers: int = 50):
+    # Exam-room burst: every student clicks through their answers at once.
+    # Old path: one connection + commit per click. New path: the writer queue.
+    import threading
+    import writer
+    from services import ResultService
+    path = _temp_database()
+    conn = database.get_connection()
+    cur = conn.cursor()
+    cur.executemany("INSERT INTO questions (subject_id, content, option_a, option_b, option_c, option_d, correct_answer) VALUES (1, ?, 'a', 'b', 'c', 'd', 'a')",
+                    [(f"question {q}",) for q in range(answers)])
+    cur.execute("INSERT INTO exams (subject_id, exam_name, duration, created_by, status) VALUES (1, 'bench', 60, 1, 'published')")
+    exam_id = cur.lastrowid
+    result_ids = []
+    for s in range(students):
+        cur.execute("INSERT INTO results (exam_id, student_id, score, status, start_time) VALUES (?, 2, 0, 'in_progress', '')", (exam_id,))
+        result_ids.append(cur.lastrowid)
+        cur.executemany("INSERT INTO result_details (result_id, question_id, selected_answer, is_correct) VALUES (?, ?, '', 0)",
+                        [(result_ids[-1], q) for q in range(1, answers + 1)])
+    conn.commit()
+    conn.close()
+
+    def per_connection(rid):
+        for q in range(1, answers + 1):
+            c = database.get_connection()
+            c.execute("UPDATE result_details SET selected_answer = 'a' WHERE result_id = ? AND question_id = ?", (rid, q))
+            c.commit()
+            c.close()
+
+    service = ResultService()
+
+    def queued(rid):
+        futures = [service.save_answer_progress(rid, q, "b") for q in range(1, answers + 1)]
+        for f in futures: f.result()
+
+    def burst(fn):
+        threads = [threading.Thread(target=fn, args=(rid,)) for rid in result_ids]
+        t0 = time.perf_counter()
+        for t in threads: t.start()
+        for t in threads: t.join()
+        return time.perf_counter() - t0
+
+    total = students * answers
+    t_old = burst(per_connection)
+    t_new = burst(queued)
+    m = writer.metrics()
+    print(f"{total} answer saves from {students} concurrent students ({path})")
+    print(f"  connection per write : {t_old * 1000:8.1f} ms  ({total / t_old:8.0f} writes/s)")
+    print(f"  writer queue         : {t_new * 1000:8.1f} ms  ({total / t_new:8.0f} writes/s)")
+    print(f"  batches {m['batches']}, largest {m['max_batch']}, lock wait {m['lock_wait_seconds_total'] * 1000:.1f} ms total / "
+          f"{m['lock_wait_seconds_max'] * 1000:.1f} ms max, queue wait max {m['queue_wait_seconds_max'] * 1000:.1f} ms")
+    writer.shutdown()
+
+
+def bench_shards(terms: int = 6, history: int = 10000, questions: int = 20, probe: int = 200, seed: int = 1):
+    # Attempt write latency (start + finish) as past terms pile up: one results
+    # table that keeps growing vs a fresh shard per term with old ones archived.
+    import shards
+    import writer
+    from services import ExamService, ResultService
+    rnd = random.Random(seed)
+    service = ResultService()
+    timings = {}
+    for sharded in (False, True):
+        path = _temp_database()
+        conn = database.get_connection()
+        cur = conn.cursor()
+        cur.executemany("INSERT INTO questions (subject_id, content, option_a, option_b, option_c, option_d, correct_answer) VALUES (1, ?, 'a', 'b', 'c', 'd', 'a')",
+                        [(f"question {q}",) for q in range(questions)])
+        qids = [r[0] for r in cur.execute("SELECT question_id FROM questions WHERE content LIKE 'question %'")]
+        cur.executemany("INSERT INTO users (username, password_hash, full_name, role) VALUES (?, 'x', ?, 'student')",
+                        [(f"bench{i}", f"Bench {i}") for i in range(probe)])
+        students = [type("BenchStudent", (), {"user_id": r[0]})() for r in cur.execute("SELECT user_id FROM users WHERE username LIKE 'bench%'")]
+        cur.execute("INSERT INTO exams (subject_id, exam_name, duration, created_by, status) VALUES (1, 'history', 60, 1, 'closed')")
+        history_exam = cur.lastrowid
+        conn.commit()
+        conn.close()
+
+        timings[sharded] = []
+        current = None
+        for term in range(terms):
+            if sharded:
+                if current: shards.archive_shard(current.shard_id)
+                current = shards.create_shard(f"term{term}", starts_on="2000-01-01")
+            conn = database.get_connection()
+            cur = conn.cursor()
+            schema = shards.write_schema()
+            first = max(cur.execute(f"SELECT COALESCE(MAX(result_id), 0) FROM {schema}.results").fetchone()[0],
+                        (current.shard_id * shards.SHARD_SPAN) if sharded else 0) + 1
+            ids = range(first, first + history)
+            cur.executemany(f"INSERT INTO {schema}.results (result_id, exam_id, student_id, score, submit_time, status, start_time) VALUES (?, ?, ?, 5, '', 'completed', '')",
+                            [(rid, history_exam, rnd.choice(students).user_id) for rid in ids])
+            cur.executemany(f"INSERT INTO {schema}.result_details (result_id, question_id, selected_answer, is_correct) VALUES (?, ?, 'a', 1)",
+                            [(rid, q) for rid in ids for q in qids])
+            cur.execute("INSERT INTO exams (subject_id, exam_name, duration, created_by, status) VALUES (1, ?, 60, 1, 'published')", (f"term {term}",))
+            exam_id = cur.lastrowid
+            cur.executemany("INSERT INTO exam_details (exam_id, question_id) VALUES (?, ?)", [(exam_id, q) for q in qids])
+            conn.commit()
+            conn.close()
+            exam = next(e for e in ExamService().get_exams_by_subject(1) if e.exam_id == exam_id)
+
+            latencies = []
+            for student in students:
+                t0 = time.perf_counter()
+                info = service.start_exam(student, exam)
+                service.finish_exam(info["result_id"], exam)
+                latencies.append(time.perf_counter() - t0)
+            latencies.sort()
+            timings[sharded].append((sum(latencies) / len(latencies), latencies[int(len(latencies) * 0.95)]))
+        writer.shutdown()
+
+    print(f"start + finish latency per attempt, {probe} attempts after each term of {history} attempts x {questions} answers")
+    print("  term  history   single file (mean / p95)     sharded (mean / p95)")
+    for term, (single, split) in enumerate(zip(timings[False], timings[True])):
+        print(f"  {term:4d} {history * (term + 1):8d}   {single[0] * 1000:7.2f} / {single[1] * 1000:7.2f} ms     "
+              f"{split[0] * 1000:7.2f} / {split[1] * 1000:7.2f} ms")
+
+
+def bench_readpool(attempts: int = 20000, questions: int = 20, scanners: int = 2, saves: int = 1500):
+    # Answer-save latency while admin report scans run, by where the scans read
+    import threading
+    import readpool
+    import writer
+    from services import ResultService
+    path = _temp_database()
+    conn = database.get_connection()
+    cur = conn.cursor()
+    cur.executemany("INSERT INTO questions (subject_id, content, option_a, option_b, option_c, option_d, correct_answer) VALUES (1, ?, 'a', 'b', 'c', 'd', 'a')",
+                    [(f"question {q}",) for q in range(questions)])
+    qids = [r[0] for r in cur.execute("SELECT question_id FROM questions WHERE content LIKE 'question %'")]
+    cur.execute("INSERT INTO exams (subject_id, exam_name, duration, created_by, status) VALUES (1, 'bench', 60, 1, 'published')")
+    exam_id = cur.lastrowid
+    cur.executemany("INSERT INTO results (result_id, exam_id, student_id, score, submit_time, status, start_time) VALUES (?, ?, 2, 5, '', 'completed', '')",
+                    [(rid, exam_id) for rid in range(1, attempts + 1)])
+    cur.executemany("INSERT INTO result_details (result_id, question_id, selected_answer, is_correct) VALUES (?, ?, 'a', 1)",
+                    [(rid, q) for rid in range(1, attempts + 1) for q in qids])
+    cur.execute("INSERT INTO results (exam_id, student_id, score, status, start_time) VALUES (?, 2, 0, 'in_progress', '')", (exam_id,))
+    live_id = cur.lastrowid
+    cur.executemany("INSERT INTO result_details (result_id, question_id, selected_answer, is_correct) VALUES (?, ?, '', 0)",
+                    [(live_id, q) for q in qids])
+    conn.commit()
+    conn.close()
+    scan_sql = """
+        SELECT r.result_id, u.full_name, r.score, rd.question_id, rd.selected_answer, rd.is_correct
+        FROM results r JOIN users u ON u.user_id = r.student_id
+        JOIN result_details rd ON rd.result_id = r.result_id
+        WHERE r.status = 'completed' ORDER BY r.result_id
+    """
+    service = ResultService()
+
+    def run(open_scan):
+        stop = threading.Event()
+        scans = [0]
+
+        def scanner():
+            while not stop.is_set():
+                c = open_scan()
+                cursor = c.execute(scan_sql)
+                while not stop.is_set() and cursor.fetchmany(5000): pass
+                c.close()
+                scans[0] += 1
+
+        threads = [threading.Thread(target=scanner) for _ in range(scanners if open_scan else 0)]
+        for t in threads: t.start()
+        latencies = []
+        for i in range(saves):
+            t0 = time.perf_counter()
+            service.save_answer_progress(live_id, qids[i % len(qids)], "abcd"[i % 4]).result()
+            latencies.append(time.perf_counter() - t0)
+        stop.set()
+        for t in threads: t.join()
+        latencies.sort()
+        return latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)], latencies[-1], scans[0]
+
+    print(f"{saves} answer saves with {scanners} report scans of {attempts} x {questions} answers running ({path})")
+    print("  scans on                     p50        p99        max    scans")
+    modes = [("none", None), ("write-path connections", database.get_connection),
+             ("read pool (live)", lambda: readpool.connection(stale_ok=True))]
+    for label, open_scan in modes + [("read pool (snapshot)", None)]:
+        if label == "read pool (snapshot)":
+            readpool.get_pool().refresh_snapshot()
+            open_scan = lambda: readpool.connection(stale_ok=True)
+        p50, p99, worst, scans = run(open_scan)
+        print(f"  {label:24s} {p50 * 1000:7.2f} ms {p99 * 1000:7.2f} ms {worst * 1000:7.2f} ms {scans:6d}")
+    readpool.shutdown()
+    writer.shutdown()
+
+
+def _exam_world(storage, world: int, students: int, questions: int):
+    # One complete exam session against `storage`, driven through the services
+    from models import Question
+    from services import ExamService, MasterDataService, ResultService, UserService
+    users, exams, results, master = UserService(storage), ExamService(storage), ResultService(storage), MasterDataService(storage)
+    subject = master.get_all_subjects()[0]
+    for q in range(questions):
+        master.add_question(Question(None, subject.subject_id, f"world {world} question {q}", "a", "b", "c", "d", "abcd"[q % 4], "Easy"))
+    admin = users.login("teacher", "teacher@1234")
+    exams.create_exam(admin, subject, f"world {world}", 30, master.get_questions_by_subject(subject.subject_id))
+    exam_id = exams.get_all_exams_for_admin()[0].exam_id
+    exams.update_exam_status(exam_id, "published")
+    exam = next(e for e in exams.get_exams_by_subject(subject.subject_id) if e.exam_id == exam_id)
+    for s in range(students):
+        student = users.register_student(f"w{world}s{s}", "abc123", "abc123", f"Student {s}", "2000-01-01")
+        info = results.start_exam(student, exam)
+        saves = [results.save_answer_progress(info["result_id"], q.question_id, "a") for q in exam.questions]
+        for f in saves: f.result()
+        results.finish_exam(info["result_id"], exam)
+    return len(results.get_results_by_exam_id(exam_id))
+
+
+def bench_storage(worlds: int = 4, students: int = 50, questions: int = 20):
+    # Isolated exam sessions: a temp file each, one after another, vs in-memory storages in parallel
+    import threading
+    import readpool
+    import writer
+    from storage import FileStorage, MemoryStorage
+
+    def session(storage, world, out):
+        out[world] = _exam_world(storage, world, students, questions)
+
+    def run(make, parallel):
+        storages = [database.open_storage(make(w)) for w in range(worlds)]
+        out = {}
+        t0 = time.perf_counter()
+        if parallel:
+            threads = [threading.Thread(target=session, args=(storages[w], w, out)) for w in range(worlds)]
+            for t in threads: t.start()
+            for t in threads: t.join()
+        else:
+            for w in range(worlds): session(storages[w], w, out)
+        elapsed = time.perf_counter() - t0
+        for st in storages:
+            writer.shutdown(storage=st)
+            readpool.shutdown(st)
+            st.close()
+        assert all(n == students for n in out.values()), out
+        return elapsed
+
+    directory = tempfile.mkdtemp(prefix="quiz_bench_")
+    t_file = run(lambda w: FileStorage(os.path.join(directory, f"world{w}.db")), parallel=False)
+    t_file_par = run(lambda w: FileStorage(os.path.join(directory, f"par{w}.db")), parallel=True)
+    t_mem = run(lambda w: MemoryStorage(f"world{w}"), parallel=False)
+    t_mem_par = run(lambda w: MemoryStorage(f"par{w}"), parallel=True)
+    print(f"{worlds} isolated exam sessions ({students} students x {questions} questions each, all through the services)")
+    print(f"  file storage, sequential   : {t_file * 1000:8.1f} ms")
+    print(f"  file storage, parallel     : {t_file_par * 1000:8.1f} ms")
+    print(f"  memory storage, sequential : {t_mem * 1000:8.1f} ms")
+    print(f"  memory storage, parallel   : {t_mem_par * 1000:8.1f} ms")
+
+
+def bench_journal(clicks: int = 500, questions: int = 50):
+    # Click latency: waiting for the database save vs appending to the local answer journal
+    import journal
+    import writer
+    from services import ResultService
+    path = _temp_database()
+    conn = database.get_connection()
+    cur = conn.cursor()
+    cur.executemany("INSERT INTO questions (subject_id, content, option_a, option_b, option_c, option_d, correct_answer) VALUES (1, ?, 'a', 'b', 'c', 'd', 'a')",
+                    [(f"question {q}",) for q in range(questions)])
+    cur.execute("INSERT INTO exams (subject_id, exam_name, duration, created_by, status) VALUES (1, 'bench', 60, 1, 'published')")
+    cur.execute("INSERT INTO results (exam_id, student_id, score, status, start_time) VALUES (?, 2, 0, 'in_progress', '')", (cur.lastrowid,))
+    rid = cur.lastrowid
+    cur.executemany("INSERT INTO result_details (result_id, question_id, selected_answer, is_correct) VALUES (?, ?, '', 0)",
+                    [(rid, q) for q in range(1, questions + 1)])
+    conn.commit()
+    conn.close()
+    service = ResultService()
+    directory = tempfile.mkdtemp(prefix="quiz_journal_")
+
+    def timed(click):
+        samples = []
+        for i in range(clicks):
+            t0 = time.perf_counter()
+            click(i % questions + 1, "abcd"[i % 4])
+            samples.append(time.perf_counter() - t0)
+        samples.sort()
+        return samples[len(samples) // 2] * 1000, samples[int(len(samples) * 0.99)] * 1000
+
+    def make(**kwargs):
+        return journal.AnswerJournal(os.path.join(directory, f"{len(os.listdir(directory))}.journal"), rid, **kwargs)
+
+    waited = timed(lambda q, a: service.save_answer_progress(rid, q, a).result())
+    strict = make(fsync_every=1)
+    per_record = timed(strict.append)
+    batched_journal = make()
+    batched = timed(batched_journal.append)
+    t0 = time.perf_counter()
+    service.sync_answer_journal(batched_journal)
+    t_replay = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    service.sync_answer_journal(journal.AnswerJournal(batched_journal.path, rid))  # reopened after a crash: already applied
+    t_noop = time.perf_counter() - t0
+    writer.shutdown()
+    print(f"{clicks} answer clicks on one attempt ({path})")
+    print(f"  wait for database save : p50 {waited[0]:6.3f} ms  p99 {waited[1]:6.3f} ms")
+    print(f"  journal, fsync each    : p50 {per_record[0]:6.3f} ms  p99 {per_record[1]:6.3f} ms")
+    print(f"  journal, batched fsync : p50 {batched[0]:6.3f} ms  p99 {batched[1]:6.3f} ms")
+    print(f"  replay of {clicks} records: {t_replay * 1000:.1f} ms, repeated after reopen: {t_noop * 1000:.1f} ms")
+
+
+def bench_monitor(students: int = 2000, questions: int = 40, changes: int = 50):
+    # Live monitor refresh: reloading every open attempt vs applying the changelog since the last poll
+    import writer
+    from services import ResultService
+    path = _temp_database()
+    conn = database.get_connection()
+    cur = conn.cursor()
+    cur.executemany("INSERT INTO questions (subject_id, content, option_a, option_b, option_c, option_d, correct_answer) VALUES (1, ?, 'a', 'b', 'c', 'd', 'a')",
+                    [(f"question {q}",) for q in range(questions)])
+    cur.execute("INSERT INTO exams (subject_id, exam_name, duration, created_by, status) VALUES (1, 'bench', 60, 1, 'published')")
+    exam_id = cur.lastrowid
+    result_ids = []
+    for s in range(students):
+        cur.execute("INSERT INTO results (exam_id, student_id, score, status, start_time, deadline) VALUES (?, 2, 0, 'in_progress', '', '2099-01-01T00:00:00')", (exam_id,))
+        result_ids.append(cur.lastrowid)
+        cur.executemany("INSERT INTO result_details (result_id, question_id, selected_answer, is_correct) VALUES (?, ?, '', 0)",
+                        [(result_ids[-1], q) for q in range(1, questions + 1)])
+    conn.commit()
+    conn.close()
+    service = ResultService()
+    last = service.last_change_id()
+    for i in range(changes):
+        service.save_answer_progress(result_ids[i * 37 % students], i % questions + 1, "b")
+    writer.run(lambda cursor: None)  # wait for the saves
+
+    t0 = time.perf_counter()
+    full = service.get_live_attempts(exam_id)
+    t_full = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    rows = service.get_exam_changes(exam_id, last)
+    touched = service.get_live_attempts(exam_id, sorted({r[1] for r in rows}))
+    t_poll = time.perf_counter() - t0
+    writer.shutdown()
+    print(f"live monitor, {students} open attempts x {questions} questions, {changes} answer clicks since last poll ({path})")
+    print(f"  full reload      : {t_full * 1000:8.1f} ms  ({len(full)} attempts)")
+    print(f"  changelog poll   : {t_poll * 1000:8.1f} ms  ({len(rows)} changes, {len(touched)} attempts refreshed)")
+
+
+def bench_prewarm(students: int = 300, questions: int = 50):
+    # Start storm: every enrolled student presses Start at once, cold vs after the pre-warm job
+    import threading
+    import writer
+    from models import Student
+    from payloads import exam_payloads
+    from services import ClassService, ExamService, ResultService
+
+    def storm(prewarm):
+        path = _temp_database()
+        conn = database.get_connection()
+        cur = conn.cursor()
+        cur.executemany("INSERT INTO questions (subject_id, content, option_a, option_b, option_c, option_d, correct_answer) VALUES (1, ?, 'a', 'b', 'c', 'd', 'a')",
+                        [(f"question {q}",) for q in range(questions)])
+        cur.execute("INSERT INTO exams (subject_id, exam_name, duration, created_by, status) VALUES (1, 'bench', 60, 1, 'published')")
+        exam_id = cur.lastrowid
+        cur.executemany("INSERT INTO exam_details (exam_id, question_id) VALUES (?, ?)", [(exam_id, q) for q in range(1, questions + 1)])
+        cur.executemany("INSERT INTO users (username, password_hash, full_name, role) VALUES (?, '', ?, 'student')",
+                        [(f"bench{s}", f"Student {s}") for s in range(students)])
+        conn.commit()
+        ids = [r[0] for r in cur.execute("SELECT user_id FROM users WHERE username LIKE 'bench%' ORDER BY user_id")]
+        conn.close()
+        classes = ClassService()
+        class_id = classes.add_class("bench")
+        classes.set_members(class_id, ids)
+        classes.set_exam_classes(exam_id, [class_id])
+        exam_payloads.invalidate()
+        service = ResultService()
+        t_prewarm = 0.0
+        if prewarm:
+            t0 = time.perf_counter()
+            service.prewarm_exam(exam_id)
+            t_prewarm = time.perf_counter() - t0
+        latencies = []
+
+        def press_start(student_id):
+            t0 = time.perf_counter()
+            exam = ExamService().get_exams_for_student(student_id)[0]
+            service.start_exam(Student(student_id, "", "", "", None), exam)
+            latencies.append(time.perf_counter() - t0)
+
+        threads = [threading.Thread(target=press_start, args=(i,)) for i in ids]
+        t0 = time.perf_counter()
+        for t in threads: t.start()
+        for t in threads: t.join()
+        elapsed = time.perf_counter() - t0
+        writer.shutdown()
+        latencies.sort()
+        assert len(latencies) == students
+        return path, t_prewarm, elapsed, latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.99)] * 1000
+
+    path, _, t_cold, cold_p50, cold_p99 = storm(False)
+    _, t_prewarm, t_warm, warm_p50, warm_p99 = storm(True)
+    print(f"{students} enrolled students press Start together, {questions} questions ({path})")
+    print(f"  cold start storm     : {t_cold * 1000:8.1f} ms  (per student p50 {cold_p50:6.1f} ms, p99 {cold_p99:6.1f} ms)")
+    print(f"  after pre-warm       : {t_warm * 1000:8.1f} ms  (per student p50 {warm_p50:6.1f} ms, p99 {warm_p99:6.1f} ms)")
+    print(f"  pre-warm job itself  : {t_prewarm * 1000:8.1f} ms  (runs minutes before start_date)")
+
+
+def bench_blueprint(bank: int = 1000000, tags: int = 200, subjects: int = 4, exams: int = 20, seen: int = 5000, seed: int = 1):
+    # Blueprint assembly over a large bank: ORDER BY RANDOM() per section vs the in-memory tag index.
+    # Only the tables assembly reads, so loading the bank skips the FTS and changelog triggers.
+    import sqlite3
+    import blueprint
+    rnd = random.Random(seed)
+    path = os.path.join(tempfile.mkdtemp(prefix="quiz_bench_"), "bank.db")
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE questions (question_id INTEGER PRIMARY KEY, subject_id INTEGER, difficulty_level TEXT);
+        CREATE TABLE tags (tag_id INTEGER PRIMARY KEY, tag_name TEXT UNIQUE COLLATE NOCASE);
+        CREATE TABLE question_tags (tag_id INTEGER, question_id INTEGER, PRIMARY KEY (tag_id, question_id)) WITHOUT ROWID;
+    """)
+    levels = ("easy", "medium", "hard")
+    conn.executemany("INSERT INTO questions VALUES (?, ?, ?)",
+                     ((q, rnd.randrange(subjects) + 1, levels[rnd.randrange(3)]) for q in range(1, bank + 1)))
+    conn.executemany("INSERT INTO tags VALUES (?, ?)", ((t, f"topic{t}") for t in range(1, tags + 1)))
+    # Skewed topics: a few big ones, a long tail of small ones
+    conn.executemany("INSERT OR IGNORE INTO question_tags VALUES (?, ?)",
+                     ((min(tags, int(rnd.paretovariate(0.7))), q) for q in range(1, bank + 1) for _ in range(rnd.randint(1, 3))))
+    conn.execute("CREATE INDEX idx_questions_subject ON questions (subject_id, difficulty_level)")
+    conn.commit()
+    text = "10 easy topic1\n5 hard topic2\n5 medium topic3, topic1\n3 topic40\n7 medium"
+    sections = blueprint.parse_blueprint(text)
+    excluded = set(rnd.sample(range(1, bank + 1), seen))
+
+    def sql_exam():
+        # One random-order scan per section (no dedup between sections or exclusion: a lower bound)
+        picked = []
+        for sec in sections:
+            sql = "SELECT q.question_id FROM questions q WHERE q.subject_id = 1"
+            params = []
+            if sec.level:
+                sql += " AND q.difficulty_level = ?"
+                params.append(sec.level)
+            for tag in sec.tags:
+                sql += " AND q.question_id IN (SELECT question_id FROM question_tags qt JOIN tags t ON t.tag_id = qt.tag_id WHERE t.tag_name = ?)"
+                params.append(tag)
+            picked += [r[0] for r in conn.execute(sql + " ORDER BY RANDOM() LIMIT ?", params + [sec.count])]
+        return picked
+
+    t_sql = min(_timed(sql_exam)[1] for _ in range(3))
+    index, t_build = _timed(blueprint.build_question_index, conn)
+    t0 = time.perf_counter()
+    for _ in range(exams):
+        ids = index.assemble(sections, 1, excluded, rnd)
+    t_assemble = (time.perf_counter() - t0) / exams
+    assert len(ids) == len(set(ids)) == sum(sec.count for sec in sections) and not excluded & set(ids)
+    infeasible = blueprint.parse_blueprint(text + "\n400 hard topic150")
+    t0 = time.perf_counter()
+    try:
+        index.assemble(infeasible, 1, excluded, rnd)
+    except blueprint.InfeasibleBlueprint as e:
+        report = e.shortfalls
+    t_infeasible = time.perf_counter() - t0
+    conn.close()
+    print(f"blueprint exams from a {bank}-question bank, {tags} topics, {len(sections)} sections, {seen} excluded ({path})")
+    print(f"  SQL, ORDER BY RANDOM() : {t_sql * 1000:8.1f} ms/exam")
+    print(f"  index build (once)     : {t_build * 1000:8.1f} ms")
+    print(f"  index assembly         : {t_assemble * 1000:8.2f} ms/exam")
+    print(f"  infeasible blueprint   : {t_infeasible * 1000:8.2f} ms  ({report[0].section.describe()}: {report[0].available} available)")
+
+
+def bench_adaptive(bank: int = 20000, examinees: int = 200, length: int = 20, seed: int = 1):
+    # Adaptive item selection: information computed for the whole bank at every step vs the
+    # precomputed per-grid-point rankings, and how well the EAP estimate recovers simulated abilities
+    import adaptive
+    rnd = random.Random(seed)
+    items = [(q, (round(rnd.lognormvariate(0, 0.3), 2), round(rnd.gauss(0, 1), 2), round(rnd.uniform(0.1, 0.25), 2)))
+             for q in range(1, bank + 1)]
+    params = dict(items)
+    item_bank, t_build = _timed(adaptive.ItemBank, 1, items)
+
+    def naive_select(theta, administered):
+        return max((q for q in params if q not in administered), key=lambda q: adaptive.information(params[q], theta))
+
+    t_naive = t_select = t_estimate = 0.0
+    steps = errors = 0
+    for n in range(examinees):
+        true_theta = rnd.gauss(0, 1)
+        theta, responses, administered = 0.0, [], set()
+        for _ in range(length):
+            if n < 5: t_naive += _timed(naive_select, theta, administered)[1]
+            q, t = _timed(item_bank.select, theta, administered, rnd)
+            t_select += t
+            administered.add(q)
+            responses.append((q, rnd.random() < adaptive.probability(params[q], true_theta)))
+            (theta, se), t = _timed(item_bank.estimate, responses)
+            t_estimate += t
+            steps += 1
+        errors += (theta - true_theta) ** 2
+    print(f"adaptive tests: {bank}-item bank, {examinees} simulated students x {length} questions")
+    print(f"  tables build (once)      : {t_build * 1000:8.1f} ms")
+    print(f"  select, whole-bank argmax: {t_naive / (5 * length) * 1000:8.3f} ms/step")
+    print(f"  select, precomputed table: {t_select / steps * 1000:8.3f} ms/step")
+    print(f"  EAP update               : {t_estimate / steps * 1000:8.3f} ms/step")
+    print(f"  ability RMSE             : {math.sqrt(errors / examinees):8.3f}  (final SE of the last student {se:.3f})")
+
+
+class _ListboxStub:
+    # Listbox stand-in (insert/delete/after) for machines without a display
+    def __init__(self):
+        self.rows = []
+    def insert(self, index, *texts):
+        index = len(self.rows) if index == "end" else index
+        self.rows[index:index] = texts
+    def delete(self, first, last=None):
+        last = len(self.rows) - 1 if last == "end" else (first if last is None else last)
+        del self.rows[first:last + 1]
+    def after(self, ms, fn):
+        fn()
+    def after_cancel(self, job):
+        pass
+    def update(self):
+        pass
+
+
+def bench_picker(pool: int = 50000, clicks: int = 20, per_click: int = 5, seed: int = 1):
+    # Moving questions between the exam pickers' pool and selection lists
+    from listmodel import ListModel, ListboxBinding
+    from models import Question
+    rnd = random.Random(seed)
+    questions = [Question(i, 1, f"Question {i} " + "x" * 40, "a", "b", "c", "d", "a", "easy") for i in range(pool)]
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+        make = lambda: tk.Listbox(root, selectmode=tk.EXTENDED)
+        kind = "Tk Listbox"
+    except Exception:
+        root, make, kind = None, _ListboxStub, "listbox stub (no display)"
+    picks = [sorted(rnd.sample(range(pool - clicks * per_click), per_click), reverse=True) for _ in range(clicks)]
+
+    def refill_everything():
+        lb_pool, lb_sel = make(), make()
+        p_list, s_list = list(questions), []
+        for ids in picks:
+            to_move = [p_list[i] for i in sorted(ids)]
+            for i in ids: del p_list[i]
+            s_list.extend(to_move)
+            lb_pool.delete(0, "end"); lb_sel.delete(0, "end")
+            for q in p_list: lb_pool.insert("end", q.content)
+            for q in s_list: lb_sel.insert("end", q.content)
+            if root: root.update()
+
+    def delta():
+        lb_pool, lb_sel = make(), make()
+        p_model, s_model = ListModel(), ListModel()
+        ListboxBinding(lb_pool, p_model, track_selection=False, chunk=pool)
+        ListboxBinding(lb_sel, s_model, track_selection=False)
+        _, t_fill = _timed(p_model.reset, questions)
+        t0 = time.perf_counter()
+        for ids in picks:
+            p_model.select_indexes(ids)
+            s_model.extend(p_model.take_selected())
+            if root: root.update()
+        assert (len(p_model), len(s_model)) == (pool - clicks * per_click, clicks * per_click)
+        return t_fill, time.perf_counter() - t0
+
+    _, t_old = _timed(refill_everything)
+    t_fill, t_new = delta()
+    print(f"question picker: {clicks} moves of {per_click} questions in a {pool}-question pool ({kind})")
+    print(f"  clear + refill per click : {t_old * 1000:8.1f} ms  ({t_old / clicks * 1000:7.2f} ms/click)")
+    print(f"  list model deltas        : {t_new * 1000:8.1f} ms  ({t_new / clicks * 1000:7.2f} ms/click, "
+          f"initial fill {t_fill * 1000:.1f} ms)")
+    if root: root.destroy()
+
+
+BENCHMARKS = {
+    "grading": bench_grading,
+    "timer": bench_timer_drift,
+    "search": bench_search,
+    "startup": bench_startup,
+    "writes": bench_writes,
+    "picker": bench_picker,
+    "shards": bench_shards,
+    "readpool": bench_readpool,
+    "storage": bench_storage,
+    "journal": bench_journal,
+    "monitor": bench_monitor,
+    "prewarm": bench_prewarm,
+    "blueprint": bench_blueprint,
+    "adaptive": bench_adaptive,
+}
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    unknown = [n for n in names if n not in BENCHMARKS]
+    if unknown:
+        help_only = all(n in ("-h", "--help") for n in unknown)
+        out = sys.stdout if help_only else sys.stderr
+        if not help_only: print(f"unknown benchmark: {', '.join(unknown)}", file=out)
+        print(f"usage: python benchmarks.py [name ...]\navailable: {' '.join(BENCHMARKS)}", file=out)
+        sys.exit(0 if help_only else 2)
+    for name in names:
+        BENCHMARKS[name]()
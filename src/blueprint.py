@@ -0,0 +1,271 @@
+import random
+import re
+import threading
+from array import array
+from bisect import bisect_left
+from itertools import groupby
+from operator import itemgetter
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+import database
+import shards
+
+# Blueprint exams. A blueprint lists sections, one per line:
+#     10 easy Algebra
+#     5 hard Geometry, Proofs     <- questions carrying every listed tag
+#     3 medium                    <- no tags: any question of the subject
+# i.e. "<count> [easy|medium|hard] [tag, tag ...]"; '#' starts a comment.
+# Sections never share a question, and excluded ids (e.g. questions the
+# students already saw) are never picked.
+#
+# The bank is held in memory as a QuestionIndex: a sorted array of question
+# ids per tag and per subject/difficulty, plus subject and difficulty by id,
+# built in one pass and cached per storage until a question or tag changes.
+# A section draws random positions from its smallest array and keeps the ids
+# that pass its other filters, so ten questions out of a 1M bank cost a few
+# dozen lookups; only when most draws are rejected does it compute its whole
+# pool. Sections whose arrays are already too small are reported before
+# anything is picked, and every section that falls short is reported at once.
+
+LEVELS = {"easy": 1, "medium": 2, "hard": 3}
+OTHER_LEVEL = 4  # a difficulty outside LEVELS; no section asks for it
+DRAWS_PER_QUESTION = 8  # random draws per wanted question before computing the whole pool
+
+_EMPTY = array("q")
+
+
+class Section(NamedTuple):
+    line: int
+    count: int
+    level: Optional[str]
+    tags: Tuple[str, ...]
+
+    def describe(self) -> str:
+        words = [str(self.count)] + ([self.level] if self.level else [])
+        return " ".join(words + [", ".join(self.tags) if self.tags else "(any topic)"])
+
+
+class Shortfall(NamedTuple):
+    section: Section
+    available: int
+    overlap: bool = False  # enough on its own, but other sections took some of them
+
+
+class InfeasibleBlueprint(ValueError):
+    def __init__(self, shortfalls: List[Shortfall]):
+        self.shortfalls = shortfalls
+        lines = [f"line {s.section.line}: {s.section.describe()} - only {s.available} "
+                 f"{'left after the other sections' if s.overlap else 'available'}" for s in shortfalls]
+        super().__init__("Not enough questions for this blueprint:\n" + "\n".join(lines))
+
+
+def parse_tags(text: str) -> List[str]:
+    # "Algebra, Functions" or "Algebra; Functions"
+    return [t.strip() for t in re.split(r"[,;]", text or "") if t.strip()]
+
+
+def parse_blueprint(text: str) -> List[Section]:
+    sections = []
+    for line_no, raw in enumerate((text or "").splitlines(), 1):
+        line = raw.split("#", 1)[0].strip()
+        if not line: continue
+        count, _, rest = line.partition(" ")
+        if not count.isdigit() or int(count) <= 0:
+            raise ValueError(f"Blueprint line {line_no}: expected '<count> [easy|medium|hard] [tag, ...]', got '{raw.strip()}'")
+        level, _, tags = rest.strip().partition(" ")
+        if level.lower() in LEVELS:
+            level, rest = level.lower(), tags
+        else:
+            level = None
+        sections.append(Section(line_no, int(count), level, tuple(parse_tags(rest))))
+    if not sections:
+        raise ValueError("Blueprint is empty")
+    return sections
+
+
+def _contains(ids: array, question_id: int) -> bool:
+    i = bisect_left(ids, question_id)
+    return i < len(ids) and ids[i] == question_id
+
+
+class _Plan(NamedTuple):
+    base: array  # smallest candidate array; sampling draws from it
+    checks: Tuple[array, ...]  # other tag arrays every pick must be in
+    subject_id: int
+    level: Optional[int]
+
+
+class QuestionIndex:
+    def __init__(self, subject_of: array, level_of: bytearray, by_subject: Dict[int, array],
+                 by_subject_level: Dict[Tuple[int, int], array], by_tag: Dict[int, array], tag_ids: Dict[str, int]):
+        self.subject_of = subject_of
+        self.level_of = level_of
+        self.by_subject = by_subject
+        self.by_subject_level = by_subject_level
+        self.by_tag = by_tag
+        self.tag_ids = tag_ids
+        self._pool_sizes: Dict[tuple, int] = {}  # exact pool size per (subject, level, tags), counted once
+
+    def tag_size(self, name: str) -> int:
+        return len(self.by_tag.get(self.tag_ids.get(name.lower()), _EMPTY))
+
+    def _plan(self, section: Section, subject_id: int) -> _Plan:
+        level = LEVELS[section.level] if section.level else None
+        tags = [self.by_tag.get(self.tag_ids.get(t.lower()), _EMPTY) for t in section.tags]
+        own = self.by_subject_level.get((subject_id, level), _EMPTY) if level else self.by_subject.get(subject_id, _EMPTY)
+        base = min(tags + [own], key=len)
+        return _Plan(base, tuple(a for a in tags if a is not base), subject_id, level)
+
+    def _accepts(self, plan: _Plan, excluded: Set[int]) -> Callable[[int], bool]:
+        subject_of, level_of, checks = self.subject_of, self.level_of, plan.checks
+        subject_id, level = plan.subject_id, plan.level
+
+        def accepts(question_id):
+            return (question_id not in excluded and subject_of[question_id] == subject_id
+                    and (level is None or level_of[question_id] == level)
+                    and all(_contains(ids, question_id) for ids in checks))
+        return accepts
+
+    def available(self, section: Section, subject_id: int, excluded: Set[int] = frozenset()) -> int:
+        plan = self._plan(section, subject_id)
+        accepts = self._accepts(plan, frozenset())
+        key = (subject_id, plan.level, tuple(sorted(t.lower() for t in section.tags)))
+        size = self._pool_sizes.get(key)
+        if size is None:
+            # No tags: the subject(/difficulty) array is exactly the pool
+            size = len(plan.base) if not section.tags else sum(1 for q in plan.base if accepts(q))
+            self._pool_sizes[key] = size
+        return size - sum(1 for q in excluded if 0 < q < len(self.subject_of) and accepts(q) and _contains(plan.base, q))
+
+    def sample(self, section: Section, subject_id: int, excluded: Set[int], rnd: random.Random) -> List[int]:
+        # Up to section.count ids; fewer only when fewer exist
+        plan = self._plan(section, subject_id)
+        accepts = self._accepts(plan, excluded)
+        base, count = plan.base, section.count
+        picked, drawn = [], set()
+        draws, limit = 0, min(len(base), DRAWS_PER_QUESTION * count + 32)
+        while draws < limit:
+            draws += 1
+            pos = rnd.randrange(len(base))
+            if pos in drawn: continue
+            drawn.add(pos)
+            if accepts(base[pos]):
+                picked.append(base[pos])
+                if len(picked) == count: return picked
+            if draws == limit and picked:
+                # Keep drawing while the acceptance rate so far says that beats a full scan
+                limit = min(len(base) // 2, int(draws * count / len(picked) * 1.5) + 32)
+        # Filters reject most of the base array: take the whole pool once
+        pool = [q for q in base if accepts(q)]
+        return pool if len(pool) <= count else rnd.sample(pool, count)
+
+    def assemble(self, sections: Sequence[Section], subject_id: int, excluded: Iterable[int] = (),
+                 rnd: random.Random = None) -> List[int]:
+        rnd = rnd or random.Random()
+        excluded = set(excluded)
+        # Quick check first: a section whose smallest array is too short cannot be filled.
+        # The others are only sampled (cheap when they can be filled) so the report lists
+        # every short section without counting the large pools
+        if any(len(self._plan(section, subject_id).base) < section.count for section in sections):
+            shortfalls = []
+            for section in sections:
+                if len(self._plan(section, subject_id).base) < section.count:
+                    shortfalls.append(Shortfall(section, self.available(section, subject_id, excluded)))
+                else:
+                    got = self.sample(section, subject_id, excluded, rnd)
+                    if len(got) < section.count: shortfalls.append(Shortfall(section, len(got)))
+            raise InfeasibleBlueprint(shortfalls)
+
+        shortfalls = []
+        used = set(excluded)
+        picks: Dict[int, List[int]] = {}
+        # Narrowest sections first, so a broad one cannot take what a narrow one needs
+        for i in sorted(range(len(sections)), key=lambda i: len(self._plan(sections[i], subject_id).base)):
+            got = self.sample(sections[i], subject_id, used, rnd)
+            if len(got) < sections[i].count:
+                alone = self.available(sections[i], subject_id, excluded)
+                shortfalls.append(Shortfall(sections[i], len(got), overlap=alone >= sections[i].count))
+            used.update(got)
+            picks[i] = got
+        if shortfalls:
+            raise InfeasibleBlueprint(sorted(shortfalls, key=lambda s: s.section.line))
+        return [q for i in range(len(sections)) for q in picks[i]]
+
+
+def build_question_index(conn) -> QuestionIndex:
+    conn.execute("BEGIN")  # questions and tags from the same snapshot
+    try:
+        size = conn.execute("SELECT COALESCE(MAX(question_id), 0) FROM questions").fetchone()[0] + 1
+        subject_of = array("q", [0]) * size
+        level_of = bytearray(size)
+        by_subject: Dict[int, array] = {}
+        by_subject_level: Dict[Tuple[int, int], array] = {}
+        levels = " ".join(f"WHEN '{name}' THEN {code}" for name, code in LEVELS.items())
+        for question_id, subject_id, code in conn.execute(f"""
+                SELECT question_id, subject_id, CASE lower(trim(difficulty_level)) {levels} ELSE {OTHER_LEVEL} END
+                FROM questions ORDER BY question_id"""):
+            subject_of[question_id] = subject_id
+            level_of[question_id] = code
+            ids = by_subject.get(subject_id)
+            if ids is None: ids = by_subject[subject_id] = array("q")
+            ids.append(question_id)
+            ids = by_subject_level.get((subject_id, code))
+            if ids is None: ids = by_subject_level[(subject_id, code)] = array("q")
+            ids.append(question_id)
+        tag_ids = {name.lower(): tag_id for tag_id, name in conn.execute("SELECT tag_id, tag_name FROM tags")}
+        # The primary key order: each tag's ids come out sorted
+        rows = conn.execute("SELECT tag_id, question_id FROM question_tags ORDER BY tag_id, question_id")
+        by_tag = {tag_id: array("q", map(itemgetter(1), group)) for tag_id, group in groupby(rows, key=itemgetter(0))}
+    finally:
+        conn.rollback()
+    return QuestionIndex(subject_of, level_of, by_subject, by_subject_level, by_tag, tag_ids)
+
+
+class QuestionIndexCache:
+    # One index per storage, like grading.AnswerKeyCache; rebuilt on first use after invalidate()
+    def __init__(self):
+        self._indexes: Dict[str, QuestionIndex] = {}
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._generation = 0
+
+    def get(self) -> QuestionIndex:
+        name = database.current_storage().name
+        index = self._indexes.get(name)
+        if index is not None: return index
+        with self._build_lock:  # concurrent callers wait for one build
+            index = self._indexes.get(name)
+            if index is None:
+                generation = self._generation
+                conn = database.get_connection()
+                try:
+                    index = build_question_index(conn)
+                finally:
+                    conn.close()
+                with self._lock:
+                    # Not kept if the bank changed while it was being built
+                    if generation == self._generation: self._indexes[name] = index
+        return index
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._indexes.pop(database.current_storage().name, None)
+
+
+question_indexes = QuestionIndexCache()
+
+
+def seen_question_ids(conn, student_ids: Sequence[int], since: str = None) -> Set[int]:
+    # Questions these students got in attempts started on or after `since` (all attempts if None)
+    seen: Set[int] = set()
+    student_ids = list(student_ids)
+    for start in range(0, len(student_ids), 500):
+        chunk = student_ids[start:start + 500]
+        seen.update(r[0] for r in conn.execute(f"""
+            SELECT DISTINCT d.question_id
+            FROM {shards.results()} r JOIN {shards.details()} d ON d.result_id = r.result_id
+            WHERE r.student_id IN ({','.join('?' * len(chunk))}) AND r.status <> 'not_started'
+              AND (? IS NULL OR r.start_time >= ?)
+        """, chunk + [since, since]))
+    return seen
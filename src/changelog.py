@@ -0,0 +1,258 @@
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+# Change feed (CDC) for attempts, answers, exams and questions, filled by
+# triggers: one row per insert, update or delete, with a JSON image of the new
+# row (deletes carry just the key). change_id only ever grows, so a reader
+# remembers the last id it saw and fetches the rows above it. Two readers:
+#   - live exam monitors poll one exam via the (exam_id, change_id) index;
+#   - named consumers (ChangeConsumer, e.g. a gradebook sync) stream batches
+#     and checkpoint their position in cdc_consumers.
+# compact() drops rows every consumer has passed once a newer row for the same
+# entity_key exists, and old tombstones, so the log converges to roughly one
+# row per live object; a new consumer starting at 0 still sees current state.
+#
+# main's tables carry ordinary triggers. Triggers stored in a shard file
+# cannot write to main.changelog, so shards.attach() adds the same attempt
+# triggers as TEMP triggers on every connection that has an open shard
+# attached (every app write goes through such a connection). Writes made to a
+# shard file by other tools are not logged.
+
+KINDS = ("insert", "update", "delete")
+ENTITIES = ("results", "result_details", "exams", "questions")
+BATCH_SIZE = 500
+RETAIN_SECONDS = 24 * 3600  # compaction leaves the last day untouched (live monitors, slow readers)
+
+_NOW = "strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime')"
+
+# entity -> (key, exam_id, result_id expressions over {row}; payload columns)
+_ENTITIES = {
+    "results": ("{row}.result_id", "{row}.exam_id", "{row}.result_id",
+                ("result_id", "exam_id", "student_id", "score", "status", "submit_time", "start_time", "deadline")),
+    "result_details": ("{row}.result_id || ':' || {row}.question_id",
+                       "(SELECT exam_id FROM {on}results WHERE result_id = {row}.result_id)", "{row}.result_id",
+                       ("result_id", "question_id", "selected_answer", "is_correct")),
+    "exams": ("{row}.exam_id", "{row}.exam_id", "NULL",
+              ("exam_id", "subject_id", "exam_name", "duration", "created_by", "start_date", "end_date", "status")),
+    "questions": ("{row}.question_id", "NULL", "NULL",
+                  ("question_id", "subject_id", "content", "option_a", "option_b", "option_c", "option_d",
+                   "correct_answer", "difficulty_level")),
+}
+_KEY_COLUMNS = {"results": ("result_id",), "result_details": ("result_id", "question_id"),
+                "exams": ("exam_id",), "questions": ("question_id",)}
+_ATTEMPT_ENTITIES = ("results", "result_details")  # the ones that live in shard files too
+
+
+class Change(NamedTuple):
+    change_id: int
+    entity: str
+    entity_key: str
+    kind: str
+    exam_id: Optional[int]
+    result_id: Optional[int]
+    payload: Optional[Dict]
+    changed_at: str
+
+
+def trigger_names(entity: str) -> List[str]:
+    return [f"changelog_{entity}_{op}" for op in ("ai", "au", "ad")]
+
+
+def _triggers(entity: str, schema: str = "main", temp: bool = False) -> List[str]:
+    key, exam_id, result_id, columns = _ENTITIES[entity]
+    on = f"{schema}." if temp else ""
+    create = f"CREATE TEMP TRIGGER IF NOT EXISTS {schema}_" if temp else "CREATE TRIGGER IF NOT EXISTS "
+    changed = " OR ".join(f"old.{c} IS NOT new.{c}" for c in columns)
+
+    def insert(row, kind, payload_columns):
+        payload = ", ".join(f"'{c}', {row}.{c}" for c in payload_columns)
+        exprs = [e.format(row=row, on=on) for e in (key, exam_id, result_id)]
+        return (f"INSERT INTO changelog (entity, entity_key, kind, exam_id, result_id, payload, changed_at) "
+                f"VALUES ('{entity}', {exprs[0]}, '{kind}', {exprs[1]}, {exprs[2]}, json_object({payload}), {_NOW});")
+
+    ai, au, ad = trigger_names(entity)
+    return [
+        f"{create}{ai} AFTER INSERT ON {on}{entity} BEGIN {insert('new', 'insert', columns)} END",
+        f"{create}{au} AFTER UPDATE ON {on}{entity} WHEN {changed} BEGIN {insert('new', 'update', columns)} END",
+        # Deletes leave a tombstone carrying just the key
+        f"{create}{ad} AFTER DELETE ON {on}{entity} BEGIN {insert('old', 'delete', _KEY_COLUMNS[entity])} END",
+    ]
+
+
+def init_changelog(cursor):
+    # Trigger bodies change between schema versions: always recreate them
+    for entity in ENTITIES:
+        for name in trigger_names(entity): cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+    for legacy in ("changelog_results_ai", "changelog_results_au", "changelog_results_ad", "changelog_details_au"):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {legacy}")
+    columns = {r[1] for r in cursor.execute("PRAGMA table_info(changelog)")}
+    if columns and "entity" not in columns:
+        # Schema 5 activity log; it only fed live monitors, which start from the head again
+        cursor.execute("DROP TABLE changelog")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS changelog (
+        change_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        entity TEXT NOT NULL,
+        entity_key TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        exam_id INTEGER,
+        result_id INTEGER,
+        payload TEXT,
+        changed_at TEXT NOT NULL
+    )
+    """)
+    # Live monitors poll one exam's changes above the last id they saw
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_changelog_exam ON changelog (exam_id, change_id)")
+    # compact(): "is there a newer row for this key" probes, and the retention horizon lookup
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_changelog_key ON changelog (entity, entity_key, change_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_changelog_changed_at ON changelog (changed_at)")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS cdc_consumers (
+        name TEXT PRIMARY KEY,
+        last_change_id INTEGER NOT NULL DEFAULT 0,
+        updated_at TEXT
+    )
+    """)
+    for entity in ENTITIES:
+        for sql in _triggers(entity):
+            cursor.execute(sql)
+
+
+def attach_triggers(conn, schemas: List[str]):
+    for schema in schemas:
+        for entity in _ATTEMPT_ENTITIES:
+            for sql in _triggers(entity, schema, temp=True):
+                conn.execute(sql)
+
+
+def _row(r) -> Change:
+    return Change(r[0], r[1], r[2], r[3], r[4], r[5], json.loads(r[6]) if r[6] else None, r[7])
+
+
+def read_changes(conn, after_change_id: int, limit: int = BATCH_SIZE, entities=None, upto: int = None) -> List[Change]:
+    sql = "SELECT change_id, entity, entity_key, kind, exam_id, result_id, payload, changed_at FROM changelog WHERE change_id > ?"
+    params = [after_change_id]
+    if upto is not None:
+        sql += " AND change_id <= ?"
+        params.append(upto)
+    if entities:
+        sql += f" AND entity IN ({','.join('?' * len(entities))})"
+        params.extend(entities)
+    sql += " ORDER BY change_id LIMIT ?"
+    params.append(limit)
+    return [_row(r) for r in conn.execute(sql, params).fetchall()]
+
+
+class ChangeConsumer:
+    # A named, checkpointed reader of the change feed. Delivery is at least once:
+    # a batch is committed only after the consumer asks for the next one (or
+    # calls commit()), so a consumer that crashes mid-batch sees it again.
+    def __init__(self, name: str, entities=None, batch_size: int = BATCH_SIZE, from_head: bool = False, storage=None):
+        import database
+        self.name = name
+        self.entities = tuple(entities) if entities else None
+        self.batch_size = batch_size
+        self.storage = storage or database.current_storage()
+        self._next: Optional[int] = None  # position after the last polled batch
+        with database.use_storage(self.storage):
+            self.position = self._register(from_head)
+
+    def _register(self, from_head: bool) -> int:
+        import writer
+
+        def register(cursor):
+            row = cursor.execute("SELECT last_change_id FROM cdc_consumers WHERE name = ?", (self.name,)).fetchone()
+            if row: return row[0]
+            start = cursor.execute("SELECT COALESCE(MAX(change_id), 0) FROM changelog").fetchone()[0] if from_head else 0
+            cursor.execute("INSERT INTO cdc_consumers (name, last_change_id, updated_at) VALUES (?, ?, ?)",
+                           (self.name, start, datetime.now().isoformat()))
+            return start
+        return writer.run(register)
+
+    def poll(self) -> List[Change]:
+        import database
+        import readpool
+        with database.use_storage(self.storage):
+            conn = readpool.connection()
+            try:
+                conn.execute("BEGIN")  # head and rows from the same snapshot
+                head = conn.execute("SELECT COALESCE(MAX(change_id), 0) FROM changelog").fetchone()[0]
+                batch = read_changes(conn, self.position, self.batch_size, self.entities, upto=head)
+            finally:
+                conn.close()
+        # A short batch means everything up to head was seen (filtered rows included)
+        self._next = batch[-1].change_id if len(batch) == self.batch_size else max(head, self.position)
+        return batch
+
+    def commit(self, change_id: int = None):
+        import database
+        import writer
+        change_id = self._next if change_id is None else change_id
+        if change_id is None or change_id <= self.position: return
+        with database.use_storage(self.storage):
+            writer.run(lambda cursor: cursor.execute(
+                "UPDATE cdc_consumers SET last_change_id = MAX(last_change_id, ?), updated_at = ? WHERE name = ?",
+                (change_id, datetime.now().isoformat(), self.name)))
+        self.position = change_id
+
+    def stream(self, follow: bool = False, poll_interval: float = 1.0) -> Iterator[List[Change]]:
+        while True:
+            batch = self.poll()
+            if batch:
+                yield batch
+            self.commit()
+            if not batch:
+                if not follow: return
+                time.sleep(poll_interval)
+
+    def lag(self) -> int:
+        import database
+        import readpool
+        with database.use_storage(self.storage):
+            conn = readpool.connection()
+            try:
+                return conn.execute("SELECT COUNT(*) FROM changelog WHERE change_id > ?", (self.position,)).fetchone()[0]
+            finally:
+                conn.close()
+
+
+def consumers(conn) -> List[Dict]:
+    head = conn.execute("SELECT COALESCE(MAX(change_id), 0) FROM changelog").fetchone()[0]
+    rows = conn.execute("SELECT name, last_change_id, updated_at FROM cdc_consumers ORDER BY name").fetchall()
+    return [{"name": r[0], "last_change_id": r[1], "behind": head - r[1], "updated_at": r[2]} for r in rows]
+
+
+def drop_consumer(name: str) -> bool:
+    # A consumer that is gone would otherwise hold compaction back forever
+    import writer
+    return writer.run(lambda cursor: cursor.execute("DELETE FROM cdc_consumers WHERE name = ?", (name,)).rowcount > 0)
+
+
+def _compact(cursor, retain_seconds: float) -> Dict:
+    cutoff = (datetime.now() - timedelta(seconds=retain_seconds)).isoformat()
+    # change_id and changed_at grow together: the newest row before the cutoff bounds the window
+    row = cursor.execute("SELECT change_id FROM changelog WHERE changed_at < ? ORDER BY changed_at DESC LIMIT 1",
+                         (cutoff,)).fetchone()
+    horizon = row[0] if row else 0
+    slowest = cursor.execute("SELECT MIN(last_change_id) FROM cdc_consumers").fetchone()[0]
+    if slowest is not None: horizon = min(horizon, slowest)
+    stats = {"horizon": horizon, "superseded": 0, "tombstones": 0}
+    if horizon <= 0: return stats
+    stats["superseded"] = cursor.execute("""
+        DELETE FROM changelog WHERE change_id <= ? AND EXISTS (
+            SELECT 1 FROM changelog newer
+            WHERE newer.entity = changelog.entity AND newer.entity_key = changelog.entity_key
+              AND newer.change_id > changelog.change_id)
+    """, (horizon,)).rowcount
+    stats["tombstones"] = cursor.execute("DELETE FROM changelog WHERE change_id <= ? AND kind = 'delete'", (horizon,)).rowcount
+    return stats
+
+
+def compact(retain_seconds: float = RETAIN_SECONDS) -> Dict:
+    # Below the horizon (every consumer has committed past it and it is older than
+    # the retention window) keep only the newest row per entity_key, and drop tombstones.
+    # Runs on the writer thread, like consumer checkpoints.
+    import writer
+    return writer.run(_compact, retain_seconds)
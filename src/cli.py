@@ -0,0 +1,442 @@
+import argparse
+import csv
+import json
+import os
+import sys
+
+import database
+
+# Headless entry point for scheduled admin jobs (cron, servers without a display).
+# Never imports tkinter. Progress goes to stderr, data to stdout or the -o file.
+
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_USAGE = 2
+
+
+def _progress(label, every=1):
+    def report(done, total):
+        if done % every == 0 or done == total:
+            print(f"{label}: {done}/{total}", file=sys.stderr, flush=True)
+        return True
+    return report
+
+
+def _open_output(path):
+    if path in (None, "-"):
+        return sys.stdout, False
+    return open(path, "w", newline="", encoding="utf-8"), True
+
+
+def cmd_import_questions(args):
+    from services import MasterDataService
+    service = MasterDataService()
+    failed = 0
+    for path in args.files:
+        try:
+            report = service.import_questions_from_csv(path)
+        except Exception as e:
+            print(f"{path}: FAILED: {e}", file=sys.stderr)
+            failed += 1
+            continue
+        regrade = report["regrade"] or {}
+        print(f"{path}: {report['inserted']} inserted, {report['updated']} updated, "
+              f"{len(report['near_duplicates'])} near-duplicates, "
+              f"{regrade.get('scores_changed', 0)} scores regraded", file=sys.stderr)
+        for d in report["near_duplicates"]:
+            print(f"  line {d['line']}: similar to question {d['question_id']} ({d['similarity']:.0%})", file=sys.stderr)
+    import maintenance
+    maintenance.run_pending()
+    return EXIT_ERROR if failed else EXIT_OK
+
+
+def cmd_export_results(args):
+    from services import ResultService
+    out, close = _open_output(args.output)
+    try:
+        writer = csv.writer(out)
+        writer.writerow(["Result ID", "Exam", "Subject", "Student Name", "Score", "Submission Time"])
+        count = 0
+        for row in ResultService().iter_result_rows(args.exam):
+            writer.writerow(row)
+            count += 1
+            if count % 10000 == 0: print(f"exported: {count}", file=sys.stderr, flush=True)
+    finally:
+        if close: out.close()
+    print(f"exported {count} results", file=sys.stderr)
+    return EXIT_OK
+
+
+def cmd_grade(args):
+    from services import ResultService
+    service = ResultService()
+    swept = service.sweep_expired_attempts(progress=_progress("grading expired"))
+    print(f"graded {swept} expired attempts", file=sys.stderr)
+    if args.regrade_questions:
+        ids = [int(x) for x in args.regrade_questions.split(",") if x.strip()]
+        report = service.regrade_questions(ids, progress=_progress("regrading"))
+        print(json.dumps(report))
+    return EXIT_OK
+
+
+def cmd_sweep_statuses(args):
+    from services import ExamService, ResultService
+    ExamService().update_auto_statuses()
+    swept = ResultService().sweep_expired_attempts(progress=_progress("grading expired"))
+    print(f"exam statuses updated, {swept} expired attempts graded", file=sys.stderr)
+    return EXIT_OK
+
+
+def cmd_reports(args):
+    import reports
+    kinds = [k.strip() for k in args.kinds.split(",") if k.strip()]
+    unknown = set(kinds) - set(reports.KINDS)
+    if unknown:
+        print(f"unknown report kinds: {', '.join(sorted(unknown))}", file=sys.stderr)
+        return EXIT_USAGE
+    jobs = reports.plan_reports(args.out_dir, kinds, args.exam, compress=args.gzip)
+    done = reports.generate(jobs, workers=args.workers, progress=_progress("reports", every=max(1, len(jobs) // 20)))
+    for path, rows in sorted(done):
+        print(f"{path}\t{rows}")
+    return EXIT_OK
+
+
+def cmd_analytics_export(args):
+    import analytics
+    meta = analytics.export_response_matrix(args.output, exam_id=args.exam, subject_id=args.subject,
+                                            progress=_progress("attempts", every=100000))
+    print(json.dumps(meta))
+    return EXIT_OK
+
+
+def cmd_backup(args):
+    import backup
+    path = backup.create_snapshot(args.output, progress=_progress("pages", every=10))
+    removed = backup.prune_snapshots(keep=args.keep) if args.keep and not args.output else []
+    print(path)
+    print(f"snapshot written, {len(removed)} old snapshots pruned", file=sys.stderr)
+    return EXIT_OK
+
+
+def cmd_snapshots(args):
+    import backup
+    for path, taken, size in backup.list_snapshots(args.dir):
+        print(f"{taken:%Y-%m-%d %H:%M:%S}\t{size}\t{path}")
+    return EXIT_OK
+
+
+def cmd_verify(args):
+    import backup
+    errors = backup.integrity_errors(args.path)
+    for e in errors: print(e, file=sys.stderr)
+    print(f"{args.path}: {'ok' if not errors else 'CORRUPT'}", file=sys.stderr)
+    return EXIT_ERROR if errors else EXIT_OK
+
+
+def cmd_restore(args):
+    import backup
+    saved = backup.restore_snapshot(args.path, safety_snapshot=not args.no_safety_snapshot)
+    if saved: print(f"previous database saved as {saved}", file=sys.stderr)
+    print(f"restored {args.path}", file=sys.stderr)
+    return EXIT_OK
+
+
+def cmd_maintenance(args):
+    import maintenance
+    maintenance.note_bulk_change()
+    done = maintenance.run_pending()
+    print(json.dumps({"actions": done, "metrics": maintenance.metrics()}, indent=2))
+    return EXIT_OK
+
+
+def cmd_shards(args):
+    import shards
+    for st in shards.shard_stats():
+        state = "archived" if st["archived"] else "open"
+        print(f"{st['shard_id']}\t{st['name']}\t{st['starts_on']}\t{state}\t{st['results']}\t{st['file_bytes']}\t{st['path']}")
+    print(f"new attempts go to: {shards.write_schema()}", file=sys.stderr)
+    return EXIT_OK
+
+
+def cmd_shard_create(args):
+    import shards
+    shard = shards.create_shard(args.name, starts_on=args.starts, path=args.path)
+    print(f"shard {shard.shard_id} ({shard.name}) from {shard.starts_on}: {shard.path}")
+    return EXIT_OK
+
+
+def cmd_shard_archive(args):
+    import shards
+    shard = shards.archive_shard(args.shard_id)
+    print(f"shard {shard.shard_id} ({shard.name}) is now read-only", file=sys.stderr)
+    return EXIT_OK
+
+
+def cmd_journal_sync(args):
+    import journal
+    from services import ResultService
+    service = ResultService()
+    for result_id in journal.journal_attempts(args.dir):
+        j = journal.open_journal(result_id, args.dir, synced_seq=service.get_journal_seq(result_id))
+        try:
+            print(f"{result_id}\t{len(j.records)}\t{service.sync_answer_journal(j)}")
+        finally:
+            j.close()
+    return EXIT_OK
+
+
+def cmd_changes(args):
+    # JSON lines to stdout; the checkpoint advances after each batch has been written out
+    import changelog
+    consumer = changelog.ChangeConsumer(args.consumer, entities=args.entity, batch_size=args.batch, from_head=args.from_head)
+    out, close = _open_output(args.output)
+    count = 0
+    try:
+        for batch in consumer.stream(follow=args.follow, poll_interval=args.interval):
+            for change in batch:
+                out.write(json.dumps(change._asdict(), ensure_ascii=False) + "\n")
+            out.flush()
+            count += len(batch)
+    finally:
+        if close: out.close()
+    print(f"{args.consumer}: {count} changes, position {consumer.position}", file=sys.stderr)
+    return EXIT_OK
+
+
+def cmd_consumers(args):
+    import changelog
+    conn = database.get_connection()
+    try:
+        if args.drop:
+            if not changelog.drop_consumer(args.drop):
+                print(f"error: no consumer named {args.drop}", file=sys.stderr)
+                return EXIT_ERROR
+        for c in changelog.consumers(conn):
+            print(f"{c['name']}\t{c['last_change_id']}\t{c['behind']}\t{c['updated_at']}")
+    finally:
+        conn.close()
+    return EXIT_OK
+
+
+def cmd_changes_compact(args):
+    import changelog
+    print(json.dumps(changelog.compact(retain_seconds=args.retain_hours * 3600)))
+    return EXIT_OK
+
+
+def cmd_tags(args):
+    from services import MasterDataService
+    for tag in MasterDataService().get_all_tags():
+        print(f"{tag.tag_id}\t{tag.tag_name}\t{tag.question_count}")
+    return EXIT_OK
+
+
+def cmd_build_exam(args):
+    # Prints the new exam id; an infeasible blueprint lists every short section on stderr
+    from models import Admin, Subject
+    from services import ExamService
+    service = ExamService()
+    with open(args.blueprint, encoding="utf-8") as f:
+        text = f.read()
+    if args.check:
+        short = 0
+        for section, available in service.check_blueprint(args.subject, text, args.exclude_class, args.seen_since):
+            short += available < section.count
+            print(f"{section.line}\t{section.describe()}\t{available}")
+        return EXIT_ERROR if short else EXIT_OK
+    conn = database.get_connection()
+    try:
+        admin = conn.execute("SELECT user_id, username, full_name FROM users WHERE role = 'admin' ORDER BY user_id LIMIT 1").fetchone()
+    finally:
+        conn.close()
+    exam_id = service.create_blueprint_exam(Admin(admin[0], admin[1], "", admin[2], None), Subject(args.subject, ""),
+                                            args.name, args.duration, text, args.exclude_class, args.seen_since)
+    print(exam_id)
+    return EXIT_OK
+
+
+def cmd_prewarm(args):
+    from services import ResultService
+    service = ResultService()
+    if args.exam is not None:
+        created = {args.exam: service.prewarm_exam(args.exam)}
+    else:
+        created = service.prewarm_due_exams(args.lead_minutes)
+    for exam_id, count in created.items():
+        print(f"{exam_id}\t{count}")
+    return EXIT_OK
+
+
+def cmd_item_params(args):
+    # Imports and/or calibrates, then prints how many questions use each parameter source
+    from services import MasterDataService
+    service = MasterDataService()
+    if args.import_file:
+        print(f"imported\t{service.import_item_params(args.import_file)}")
+    if args.calibrate:
+        print(f"calibrated\t{service.calibrate_item_params(args.min_responses)}")
+    for source, count in sorted(service.get_item_param_counts().items()):
+        print(f"{source}\t{count}")
+    return EXIT_OK
+
+
+def cmd_vacuum(args):
+    before = database.database_stats()
+    database.vacuum()
+    after = database.database_stats()
+    print(f"vacuum: {before['file_bytes']} -> {after['file_bytes']} bytes", file=sys.stderr)
+    return EXIT_OK
+
+
+def cmd_stats(args):
+    print(json.dumps(database.database_stats(), indent=2))
+    return EXIT_OK
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="cli.py", description="Quiz Examination System admin commands")
+    parser.add_argument("--db", help="database file (default: quiz_app.db next to database.py)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("import-questions", help="import question CSV files")
+    p.add_argument("files", nargs="+")
+    p.set_defaults(func=cmd_import_questions)
+
+    p = sub.add_parser("export-results", help="export completed results as CSV")
+    p.add_argument("--exam", type=int, help="only this exam id")
+    p.add_argument("-o", "--output", default="-", help="output file (default: stdout)")
+    p.set_defaults(func=cmd_export_results)
+
+    p = sub.add_parser("grade", help="grade expired attempts, optionally regrade questions")
+    p.add_argument("--regrade-questions", metavar="IDS", help="comma-separated question ids to regrade")
+    p.set_defaults(func=cmd_grade)
+
+    p = sub.add_parser("sweep-statuses", help="apply scheduled exam status changes and close expired attempts")
+    p.set_defaults(func=cmd_sweep_statuses)
+
+    p = sub.add_parser("reports", help="write per-exam, per-subject and per-student CSV reports in parallel")
+    p.add_argument("--out-dir", required=True)
+    p.add_argument("--exam", type=int, action="append", help="only this exam id (repeatable)")
+    p.add_argument("--kinds", default=",".join(("exam", "matrix", "subject", "student")),
+                   help="comma-separated subset of exam,matrix,subject,student")
+    p.add_argument("--gzip", action="store_true", help="write .csv.gz files")
+    p.add_argument("--workers", type=int, help="worker processes (default: CPU count)")
+    p.set_defaults(func=cmd_reports)
+
+    p = sub.add_parser("analytics-export", help="write the attempts x questions response matrix as .npy files")
+    scope = p.add_mutually_exclusive_group(required=True)
+    scope.add_argument("--exam", type=int)
+    scope.add_argument("--subject", type=int)
+    p.add_argument("-o", "--output", required=True, help="output directory")
+    p.set_defaults(func=cmd_analytics_export)
+
+    p = sub.add_parser("backup", help="take an online snapshot of the database")
+    p.add_argument("-o", "--output", help="snapshot file (default: backups/<name>-<timestamp>.db)")
+    p.add_argument("--keep", type=int, default=24, help="snapshots to keep in the backups folder (0 = no pruning)")
+    p.set_defaults(func=cmd_backup)
+
+    p = sub.add_parser("snapshots", help="list snapshots, newest first")
+    p.add_argument("--dir", help="snapshot folder (default: backups/ next to the database)")
+    p.set_defaults(func=cmd_snapshots)
+
+    p = sub.add_parser("verify", help="run an integrity check on a snapshot or database file")
+    p.add_argument("path")
+    p.set_defaults(func=cmd_verify)
+
+    p = sub.add_parser("restore", help="replace the database with a verified snapshot")
+    p.add_argument("path")
+    p.add_argument("--no-safety-snapshot", action="store_true", help="do not snapshot the current database first")
+    p.set_defaults(func=cmd_restore)
+
+    p = sub.add_parser("maintenance", help="checkpoint the WAL, refresh statistics and reclaim free pages")
+    p.set_defaults(func=cmd_maintenance)
+
+    p = sub.add_parser("shards", help="list term shards holding exam attempts")
+    p.set_defaults(func=cmd_shards)
+
+    p = sub.add_parser("shard-create", help="start a new term shard; attempts started from --starts on go there")
+    p.add_argument("name", help="term name, e.g. 2026-hk1")
+    p.add_argument("--starts", help="first day of the term, YYYY-MM-DD (default: today)")
+    p.add_argument("--path", help="shard file (default: <database>_<name>.db)")
+    p.set_defaults(func=cmd_shard_create)
+
+    p = sub.add_parser("shard-archive", help="make a finished term shard read-only")
+    p.add_argument("shard_id", type=int)
+    p.set_defaults(func=cmd_shard_archive)
+
+    p = sub.add_parser("journal-sync", help="replay answer journals left on this machine into the database")
+    p.add_argument("--dir", help="journal directory (default: $QUIZ_JOURNAL_DIR or ~/.quiz_app/journal)")
+    p.set_defaults(func=cmd_journal_sync)
+
+    p = sub.add_parser("changes", help="stream the change feed as JSON lines for a named, checkpointed consumer")
+    p.add_argument("consumer", help="consumer name; its position is kept in the database")
+    p.add_argument("--entity", action="append", choices=["results", "result_details", "exams", "questions"],
+                   help="only these tables (repeatable; default: all)")
+    p.add_argument("--batch", type=int, default=500, help="changes per batch/checkpoint")
+    p.add_argument("--from-head", action="store_true", help="a new consumer starts at the newest change instead of the beginning")
+    p.add_argument("--follow", action="store_true", help="keep polling for new changes")
+    p.add_argument("--interval", type=float, default=1.0, help="seconds between polls with --follow")
+    p.add_argument("-o", "--output", help="output file (default: stdout)")
+    p.set_defaults(func=cmd_changes)
+
+    p = sub.add_parser("consumers", help="list change feed consumers and how far behind they are")
+    p.add_argument("--drop", metavar="NAME", help="forget a consumer (it no longer holds back compaction)")
+    p.set_defaults(func=cmd_consumers)
+
+    p = sub.add_parser("changes-compact", help="compact change feed entries every consumer has read")
+    p.add_argument("--retain-hours", type=float, default=24, help="leave entries newer than this alone")
+    p.set_defaults(func=cmd_changes_compact)
+
+    p = sub.add_parser("tags", help="list topic tags and how many questions carry each")
+    p.set_defaults(func=cmd_tags)
+
+    p = sub.add_parser("build-exam", help="create a draft exam from a blueprint file")
+    p.add_argument("blueprint", help="one section per line: <count> [easy|medium|hard] [tag, tag...]")
+    p.add_argument("--subject", type=int, required=True, help="subject id")
+    p.add_argument("--name", default="Blueprint exam")
+    p.add_argument("--duration", type=int, default=60, help="minutes")
+    p.add_argument("--exclude-class", type=int, action="append", metavar="ID",
+                   help="skip questions members of this class already got (repeatable)")
+    p.add_argument("--seen-since", metavar="YYYY-MM-DD", help="only count attempts started since this date")
+    p.add_argument("--check", action="store_true", help="only print how many questions each section can use")
+    p.set_defaults(func=cmd_build_exam)
+
+    p = sub.add_parser("prewarm", help="create attempts for enrolled students of exams that open soon")
+    p.add_argument("--exam", type=int, help="this exam now, whatever its start date")
+    p.add_argument("--lead-minutes", type=float, default=10, help="exams opening within this many minutes (default: 10)")
+    p.set_defaults(func=cmd_prewarm)
+
+    p = sub.add_parser("item-params", help="import or calibrate question parameters for adaptive exams")
+    p.add_argument("--import", dest="import_file", metavar="FILE", help="CSV with a header and question_id, a, b, c columns")
+    p.add_argument("--calibrate", action="store_true", help="estimate difficulty from completed attempts (imported rows are kept)")
+    p.add_argument("--min-responses", type=int, default=30, help="answers a question needs before it is calibrated (default: 30)")
+    p.set_defaults(func=cmd_item_params)
+
+    p = sub.add_parser("vacuum", help="checkpoint the WAL and rebuild the database file")
+    p.set_defaults(func=cmd_vacuum)
+
+    p = sub.add_parser("stats", help="print table counts and file sizes as JSON")
+    p.set_defaults(func=cmd_stats)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.db:
+        database.DB_NAME = os.path.abspath(args.db)
+    try:
+        if database.init_db(): database.seed_data()
+        return args.func(args)
+    except BrokenPipeError:
+        # Output piped into e.g. `head`; stop quietly
+        sys.stdout = open(os.devnull, "w")
+        return EXIT_OK
+    except KeyboardInterrupt:
+        return EXIT_ERROR
+    except Exception as e:
+        print(f"error: {e}", file=sys.stderr)
+        return EXIT_ERROR
+
+
+if __name__ == "__main__":
+    sys.exit(main())
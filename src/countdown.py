@@ -0,0 +1,28 @@
+import math
+import time
+from typing import Callable
+
+
+class Countdown:
+    # Remaining time is always derived from a fixed monotonic deadline, so late
+    # or skipped timer callbacks never accumulate into drift.
+    def __init__(self, remaining_seconds: float, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self._deadline = clock() + max(0, remaining_seconds)
+
+    def remaining(self) -> float:
+        return max(0.0, self._deadline - self._clock())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def display(self) -> str:
+        m, s = divmod(int(math.ceil(self.remaining())), 60)
+        return f"{m:02d}:{s:02d}"
+
+    def ms_until_next_tick(self, slack_ms: int = 5) -> int:
+        # Sleep until the displayed second changes instead of a fixed 1000ms
+        rem = self.remaining()
+        frac = rem - math.floor(rem)
+        wait = frac if frac > 0 else 1.0
+        return int(wait * 1000) + slack_ms
@@ -1,22 +1,86 @@
 import sqlite3
 import os
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime
+import changelog
+import dedup
+import instrumentation
+import querylog
+import shards
+from storage import FileStorage
 
 DB_NAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "quiz_app.db")
 
-def get_connection():
-    conn = sqlite3.connect(DB_NAME, check_same_thread=False)
-    conn.execute("PRAGMA journal_mode=WAL;")  # Enable Write-Ahead Logging for concurrency
+# Bump whenever init_db changes the schema; a database already at this version skips init_db
+SCHEMA_VERSION = 10
+
+_active_storage: ContextVar = ContextVar("storage", default=None)  # set by use_storage()
+_default_storage = (None, None)  # (DB_NAME it was made for, storage)
+
+def current_storage():
+    # The storage bound to this call (use_storage), else a FileStorage at DB_NAME
+    global _default_storage
+    storage = _active_storage.get()
+    if storage is not None: return storage
+    if _default_storage[0] != DB_NAME:
+        _default_storage = (DB_NAME, FileStorage(DB_NAME))
+    return _default_storage[1]
+
+def set_default_storage(storage):
+    # Process-wide default, e.g. a MemoryStorage for a whole test run
+    global DB_NAME, _default_storage
+    DB_NAME = storage.name
+    _default_storage = (DB_NAME, storage)
+
+@contextmanager
+def use_storage(storage):
+    token = _active_storage.set(storage)
+    try:
+        yield storage
+    finally:
+        _active_storage.reset(token)
+
+def open_storage(storage, seed: bool = True):
+    # Creates the schema (and the default accounts) in a fresh storage
+    with use_storage(storage):
+        if init_db() and seed: seed_data()
+    return storage
+
+def get_connection(storage=None):
+    storage = storage or current_storage()
+    if querylog.is_enabled():
+        # Traced connections time every statement for the slow-query log
+        conn = sqlite3.connect(storage.uri, check_same_thread=False, factory=querylog.TracedConnection, uri=True)
+    else:
+        conn = sqlite3.connect(storage.uri, check_same_thread=False, uri=True)
+    storage.configure(conn)
     conn.execute("PRAGMA busy_timeout = 30000;") # Wait up to 30s if locked
     conn.execute("PRAGMA foreign_keys = ON;")
+    if instrumentation.is_enabled() and not querylog.is_enabled():
+        conn.set_trace_callback(instrumentation.record_sql)
+    shards.attach(conn, storage.name)  # no-op until a term shard is registered
     return conn
 
-def init_db():
+def init_db() -> bool:
     conn = get_connection()
     cursor = conn.cursor()
     
+    # Cold start: one PRAGMA read instead of the whole CREATE/ALTER sequence
+    if cursor.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+        conn.close()
+        return False
+
     # PRAGMA foreign_keys is now set in get_connection()
 
+    # Incremental vacuum only takes effect when the file is rebuilt (switching to WAL
+    # already initialised it). A new, empty file is rebuilt at the end, which costs
+    # nothing; an existing one is left to `cli.py vacuum` rather than blocking startup
+    # on a full rewrite, and maintenance skips it until then.
+    needs_vacuum = cursor.execute("PRAGMA auto_vacuum").fetchone()[0] != 2
+    fresh = cursor.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0] == 0
+    if needs_vacuum: cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS users (
         user_id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -74,6 +138,11 @@ def init_db():
     except: pass
     try: cursor.execute("ALTER TABLE exams ADD COLUMN status TEXT DEFAULT 'draft'")
     except: pass
+    # Adaptive exams (see adaptive.py) have no exam_details; each attempt draws test_length questions from the subject
+    try: cursor.execute("ALTER TABLE exams ADD COLUMN exam_type TEXT DEFAULT 'fixed'")
+    except: pass
+    try: cursor.execute("ALTER TABLE exams ADD COLUMN test_length INTEGER")
+    except: pass
 
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS exam_details (
@@ -94,6 +163,7 @@ def init_db():
         submit_time TEXT,
         status TEXT DEFAULT 'completed',
         start_time TEXT,
+        deadline TEXT,
         FOREIGN KEY (exam_id) REFERENCES exams (exam_id),
         FOREIGN KEY (student_id) REFERENCES users (user_id)
     )
@@ -102,6 +172,8 @@ def init_db():
     except: pass
     try: cursor.execute("ALTER TABLE results ADD COLUMN start_time TEXT")
     except: pass
+    try: cursor.execute("ALTER TABLE results ADD COLUMN deadline TEXT")
+    except: pass
 
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS result_details (
@@ -114,9 +186,218 @@ def init_db():
         FOREIGN KEY (question_id) REFERENCES questions (question_id)
     )
     """)
+    # Adaptive attempts log the ability estimate after each answer; open term shards get the same columns
+    for schema in shards.writable_schemas():
+        try: cursor.execute(f"ALTER TABLE {schema}.result_details ADD COLUMN ability REAL")
+        except: pass
+        try: cursor.execute(f"ALTER TABLE {schema}.result_details ADD COLUMN ability_se REAL")
+        except: pass
+
+    # Answer-key compilation and grading look these up per exam / per attempt
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_exam_details_exam ON exam_details (exam_id, exam_detail_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_result_details_result ON result_details (result_id, question_id)")
+    # Regrading finds every attempt that answered a given question
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_result_details_question ON result_details (question_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_exam_details_question ON exam_details (question_id)")
+    # Exam close sweeps open attempts by exam
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_results_exam_status ON results (exam_id, status)")
+    # Expiry sweeper scans open attempts by stored deadline, in every schema attempts are written to;
+    # the (status, start_time) index it used before deadlines were stored only cost writes
+    for schema in shards.writable_schemas():
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_results_status_deadline ON results (status, deadline)")
+        cursor.execute(f"DROP INDEX IF EXISTS {schema}.idx_results_status_start")
+
+    init_question_search(cursor)
 
+    # Near-duplicate index: normalized-content hash + MinHash signature, LSH bands for lookup
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS question_signatures (
+        question_id INTEGER PRIMARY KEY,
+        subject_id INTEGER NOT NULL,
+        norm_hash TEXT NOT NULL,
+        minhash BLOB NOT NULL
+    )
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS question_lsh (
+        subject_id INTEGER NOT NULL,
+        band_key INTEGER NOT NULL,
+        question_id INTEGER NOT NULL
+    )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_question_signatures_hash ON question_signatures (subject_id, norm_hash)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_question_lsh_band ON question_lsh (subject_id, band_key)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_question_lsh_question ON question_lsh (question_id)")
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS question_signatures_ad AFTER DELETE ON questions BEGIN
+        DELETE FROM question_signatures WHERE question_id = old.question_id;
+        DELETE FROM question_lsh WHERE question_id = old.question_id;
+    END
+    """)
+    dedup.backfill_signatures(cursor)
+
+    # Term shards for attempts (see shards.py); empty means everything stays in main
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS result_shards (
+        shard_id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE,
+        path TEXT NOT NULL,
+        starts_on TEXT NOT NULL,
+        archived INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+
+    # Last local answer-journal record replayed per attempt (see journal.py)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS answer_journal_sync (
+        result_id INTEGER PRIMARY KEY,
+        last_seq INTEGER NOT NULL,
+        synced_at TEXT
+    )
+    """)
+
+    # Enrollment: exams assigned to classes are only offered to their members;
+    # an exam with no assignment stays open to every student
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS classes (
+        class_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        class_name TEXT NOT NULL UNIQUE
+    )
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS class_members (
+        class_id INTEGER NOT NULL,
+        student_id INTEGER NOT NULL,
+        PRIMARY KEY (class_id, student_id),
+        FOREIGN KEY (class_id) REFERENCES classes (class_id) ON DELETE CASCADE,
+        FOREIGN KEY (student_id) REFERENCES users (user_id) ON DELETE CASCADE
+    )
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS exam_assignments (
+        exam_id INTEGER NOT NULL,
+        class_id INTEGER NOT NULL,
+        PRIMARY KEY (exam_id, class_id),
+        FOREIGN KEY (exam_id) REFERENCES exams (exam_id) ON DELETE CASCADE,
+        FOREIGN KEY (class_id) REFERENCES classes (class_id) ON DELETE CASCADE
+    )
+    """)
+    # Student dashboard: a student's classes, then their exams; a student's own attempts
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_class_members_student ON class_members (student_id, class_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_exam_assignments_class ON exam_assignments (class_id, exam_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_results_student_exam ON results (student_id, exam_id)")
+
+    # Topic tags for blueprint exams (see blueprint.py). question_tags is clustered
+    # by tag so a tag's question ids come out of one range scan, already sorted
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS tags (
+        tag_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tag_name TEXT NOT NULL UNIQUE COLLATE NOCASE
+    )
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS question_tags (
+        tag_id INTEGER NOT NULL,
+        question_id INTEGER NOT NULL,
+        PRIMARY KEY (tag_id, question_id),
+        FOREIGN KEY (tag_id) REFERENCES tags (tag_id) ON DELETE CASCADE,
+        FOREIGN KEY (question_id) REFERENCES questions (question_id) ON DELETE CASCADE
+    ) WITHOUT ROWID
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_question_tags_question ON question_tags (question_id, tag_id)")
+
+    # Item response theory parameters for adaptive exams; questions without a row use defaults by difficulty
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS item_params (
+        question_id INTEGER PRIMARY KEY,
+        a REAL NOT NULL,
+        b REAL NOT NULL,
+        c REAL NOT NULL,
+        source TEXT NOT NULL,
+        responses INTEGER,
+        FOREIGN KEY (question_id) REFERENCES questions (question_id) ON DELETE CASCADE
+    )
+    """)
+
+    # Change feed for live monitors and CDC consumers (see changelog.py)
+    changelog.init_changelog(cursor)
+
+    cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
     conn.commit()
+    if needs_vacuum and fresh: conn.execute("VACUUM")
     conn.close()
+    return True
+
+def init_question_search(cursor):
+    # External-content FTS5 index over question text and options, kept in sync by triggers.
+    # Builds without FTS5 simply skip it; search falls back to LIKE.
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'questions_fts'")
+    exists = cursor.fetchone() is not None
+    try:
+        cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5(
+            content, option_a, option_b, option_c, option_d,
+            content='questions', content_rowid='question_id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+        """)
+    except sqlite3.OperationalError:
+        return False
+
+    cols = "content, option_a, option_b, option_c, option_d"
+    new_cols = "new.content, new.option_a, new.option_b, new.option_c, new.option_d"
+    old_cols = "old.content, old.option_a, old.option_b, old.option_c, old.option_d"
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS questions_fts_ai AFTER INSERT ON questions BEGIN
+        INSERT INTO questions_fts (rowid, {cols}) VALUES (new.question_id, {new_cols});
+    END
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS questions_fts_ad AFTER DELETE ON questions BEGIN
+        INSERT INTO questions_fts (questions_fts, rowid, {cols}) VALUES ('delete', old.question_id, {old_cols});
+    END
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS questions_fts_au AFTER UPDATE ON questions BEGIN
+        INSERT INTO questions_fts (questions_fts, rowid, {cols}) VALUES ('delete', old.question_id, {old_cols});
+        INSERT INTO questions_fts (rowid, {cols}) VALUES (new.question_id, {new_cols});
+    END
+    """)
+    if not exists:
+        # Index questions that were added before the FTS table existed
+        cursor.execute("INSERT INTO questions_fts (questions_fts) VALUES ('rebuild')")
+    return True
+
+def database_stats() -> dict:
+    storage = current_storage()
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        stats = {"path": storage.name, "schema_version": cursor.execute("PRAGMA user_version").fetchone()[0]}
+        for table in ("users", "subjects", "questions", "exams", "exam_details", "results", "result_details"):
+            stats[table] = cursor.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        stats["attempts_by_status"] = dict(cursor.execute(f"SELECT status, COUNT(*) FROM {shards.results()} GROUP BY status").fetchall())
+        if shards.is_active():
+            stats["results"] = cursor.execute(f"SELECT COUNT(*) FROM {shards.results()}").fetchone()[0]
+            stats["result_details"] = cursor.execute(f"SELECT COUNT(*) FROM {shards.details()}").fetchone()[0]
+        page_size = cursor.execute("PRAGMA page_size").fetchone()[0]
+        stats["free_bytes"] = cursor.execute("PRAGMA freelist_count").fetchone()[0] * page_size
+    finally:
+        conn.close()
+    for suffix in ("", "-wal"):
+        path = (storage.path or "") + suffix
+        stats["file_bytes" if not suffix else "wal_bytes"] = os.path.getsize(path) if storage.path and os.path.exists(path) else 0
+    return stats
+
+def vacuum():
+    conn = get_connection()
+    try:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")  # converts files created before incremental vacuum
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA optimize")
+    finally:
+        conn.close()
 
 def seed_data():
     conn = get_connection()
@@ -0,0 +1,140 @@
+import hashlib
+import re
+import struct
+import unicodedata
+import zlib
+from typing import Dict, Iterable, List, Sequence, Set, Tuple
+
+# MinHash over character shingles, banded for LSH. 64 hashes in 16 bands of 4
+# rows puts the 50% collision point near Jaccard 0.5 and catches pairs above
+# ~0.8 with high probability.
+NUM_HASHES = 64
+BANDS = 16
+ROWS = NUM_HASHES // BANDS
+SHINGLE = 4
+NEAR_DUPLICATE_THRESHOLD = 0.8
+
+
+def _hash_masks():
+    # Fixed seeds so signatures stored in the database stay comparable.
+    # XOR with a random 32-bit mask is a permutation of the shingle hashes,
+    # and min(map(mask.__xor__, grams)) runs in C.
+    return [struct.unpack("<I", hashlib.sha256(f"quiz-minhash-{i}".encode()).digest()[:4])[0]
+            for i in range(NUM_HASHES)]
+
+
+_MASKS = _hash_masks()
+
+
+def normalize(text: str) -> str:
+    # Case, accents, punctuation and whitespace differences do not count
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = re.sub(r"[^\w]+", " ", text.lower())
+    return " ".join(text.split())
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(normalize(text).encode("utf-8")).hexdigest()
+
+
+def shingles(normalized: str) -> Set[int]:
+    if len(normalized) <= SHINGLE:
+        return {zlib.crc32(normalized.encode("utf-8"))}
+    return {zlib.crc32(normalized[i:i + SHINGLE].encode("utf-8")) for i in range(len(normalized) - SHINGLE + 1)}
+
+
+def minhash(text: str) -> Tuple[int, ...]:
+    grams = shingles(normalize(text))
+    return tuple(min(map(mask.__xor__, grams)) for mask in _MASKS)
+
+
+def pack_signature(signature: Sequence[int]) -> bytes:
+    return struct.pack(f"<{NUM_HASHES}I", *signature)
+
+
+def unpack_signature(blob: bytes) -> Tuple[int, ...]:
+    return struct.unpack(f"<{NUM_HASHES}I", blob)
+
+
+def band_keys(signature: Sequence[int]) -> List[int]:
+    # One signed 64-bit key per band (fits an SQLite INTEGER); band number is mixed in
+    keys = []
+    for band in range(BANDS):
+        chunk = struct.pack(f"<H{ROWS}I", band, *signature[band * ROWS:(band + 1) * ROWS])
+        keys.append(struct.unpack("<q", hashlib.blake2b(chunk, digest_size=8).digest())[0])
+    return keys
+
+
+def similarity(sig_a: Sequence[int], sig_b: Sequence[int]) -> float:
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_HASHES
+
+
+def index_question(cursor, question_id: int, subject_id: int, content: str):
+    # Stores the signature and LSH band keys alongside a question (insert or refresh)
+    signature = minhash(content)
+    cursor.execute("DELETE FROM question_lsh WHERE question_id = ?", (question_id,))
+    cursor.execute("INSERT OR REPLACE INTO question_signatures (question_id, subject_id, norm_hash, minhash) VALUES (?, ?, ?, ?)",
+                   (question_id, subject_id, content_hash(content), pack_signature(signature)))
+    cursor.executemany("INSERT INTO question_lsh (subject_id, band_key, question_id) VALUES (?, ?, ?)",
+                       [(subject_id, key, question_id) for key in band_keys(signature)])
+    return signature
+
+
+def backfill_signatures(cursor) -> int:
+    cursor.execute("""
+        SELECT q.question_id, q.subject_id, q.content
+        FROM questions q
+        LEFT JOIN question_signatures s ON s.question_id = q.question_id
+        WHERE s.question_id IS NULL
+    """)
+    rows = cursor.fetchall()
+    for qid, subject_id, content in rows:
+        index_question(cursor, qid, subject_id, content)
+    return len(rows)
+
+
+def find_candidates(cursor, subject_id: int, content: str, threshold: float = NEAR_DUPLICATE_THRESHOLD,
+                    exclude_id: int = None) -> List[Tuple[int, float]]:
+    # Exact normalized matches first, then LSH bucket hits verified on the full signature
+    signature = minhash(content)
+    norm = content_hash(content)
+    keys = band_keys(signature)
+    placeholders = ",".join("?" * len(keys))
+    cursor.execute(f"""
+        SELECT s.question_id, s.norm_hash, s.minhash
+        FROM question_signatures s
+        WHERE s.question_id IN (
+            SELECT question_id FROM question_lsh WHERE subject_id = ? AND band_key IN ({placeholders})
+            UNION
+            SELECT question_id FROM question_signatures WHERE subject_id = ? AND norm_hash = ?
+        )
+    """, (subject_id, *keys, subject_id, norm))
+    matches = []
+    for qid, other_norm, blob in cursor.fetchall():
+        if qid == exclude_id: continue
+        score = 1.0 if other_norm == norm else similarity(signature, unpack_signature(blob))
+        if score >= threshold: matches.append((qid, score))
+    matches.sort(key=lambda m: (-m[1], m[0]))
+    return matches
+
+
+def clusters(pairs: Iterable[Tuple[int, int]]) -> List[List[int]]:
+    # Union-find over near-duplicate pairs
+    parent: Dict[int, int] = {}
+
+    def find(x):
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for a, b in pairs:
+        ra, rb = find(a), find(b)
+        if ra != rb: parent[max(ra, rb)] = min(ra, rb)
+
+    groups: Dict[int, List[int]] = {}
+    for x in parent:
+        groups.setdefault(find(x), []).append(x)
+    return sorted((sorted(g) for g in groups.values() if len(g) > 1), key=lambda g: g[0])
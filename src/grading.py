@@ -0,0 +1,195 @@
+import operator
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import database
+from database import get_connection
+
+OPTION_CODES = {'a': 1, 'b': 2, 'c': 3, 'd': 4}
+NO_ANSWER = 0
+
+
+def encode_option(answer: Optional[str]) -> int:
+    return OPTION_CODES.get((answer or "").strip().lower(), NO_ANSWER)
+
+
+# One rule for "is this answer correct", here and in SQL (sweeper, regrade,
+# adaptive steps): lower(trim(selected)) = lower(trim(correct)), where trim
+# strips spaces and lower folds ASCII only, and a blank correct answer matches
+# nothing. The score is correct answers / questions on the attempt's sheet * 10.
+ANSWER_MATCH_SQL = "COALESCE(lower(trim({selected})) = lower(trim({correct})) AND trim({correct}) <> '', 0)"
+SCORE_SQL = "COALESCE(SUM({is_correct}) * 10.0 / COUNT(*), 0)"
+
+_ASCII_LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+
+def normalize_answer(answer: Optional[str]) -> str:
+    return (answer or "").strip(" ").translate(_ASCII_LOWER)
+
+
+def answer_matches(selected: Optional[str], correct: Optional[str]) -> bool:
+    correct = normalize_answer(correct)
+    return correct != "" and normalize_answer(selected) == correct
+
+
+def score(correct_count: int, total: int) -> float:
+    # Same arithmetic as SCORE_SQL, so both give the same float
+    return correct_count * 10.0 / total if total > 0 else 0
+
+
+# Sheets are packed one byte per question: a one-character answer is its
+# lowercased ASCII byte, a blank is BLANK and anything longer or non-ASCII is
+# OTHER, looked up per answer in a dict (_ANSWER_BYTES) from C via map. The key
+# is packed the same way (a blank or long correct answer as NEVER), and grading
+# XORs sheet and key as big integers: equal positions come out as zero bytes,
+# counted by bytes.count. Per sheet this costs about what a plain Python loop
+# over the questions does (benchmarks.py grading); what the compiled key saves
+# is the question list round trip and per-question UPDATEs in finish_exam.
+BLANK = 0
+OTHER = 0x80
+NEVER = 0xFF
+
+_EQUAL_FLAGS = bytes([1] + [0] * 255)  # diff byte 0 -> flag 1
+
+
+def _answer_byte(answer: Optional[str]) -> int:
+    answer = normalize_answer(answer)
+    if not answer: return BLANK
+    return ord(answer) if len(answer) == 1 and answer.isascii() else OTHER
+
+
+class _AnswerBytes(dict):
+    # Raw stored answer -> sheet byte; common spellings are plain dict hits,
+    # others are normalized once and remembered (up to a bound)
+    def __missing__(self, answer):
+        code = _answer_byte(answer)
+        if len(self) < 1024: self[answer] = code
+        return code
+
+
+_ANSWER_BYTES = _AnswerBytes({None: BLANK})
+
+
+class AnswerKey:
+    __slots__ = ("exam_id", "question_ids", "answers", "key", "_key_int", "_values", "_positions")
+
+    def __init__(self, exam_id: int, question_ids: Sequence[int], correct_answers: Sequence[str]):
+        answers = tuple(normalize_answer(a) for a in correct_answers)
+        object.__setattr__(self, "exam_id", exam_id)
+        object.__setattr__(self, "question_ids", tuple(question_ids))
+        object.__setattr__(self, "answers", answers)
+        # Correct answers longer than one character cannot be packed: such keys compare strings
+        packable = all(len(a) <= 1 and a.isascii() for a in answers)
+        key = bytes(ord(a) if a else NEVER for a in answers) if packable else None
+        object.__setattr__(self, "key", key)
+        object.__setattr__(self, "_key_int", int.from_bytes(key, "little") if packable else None)
+        n = len(self.question_ids)
+        getter = operator.itemgetter(*self.question_ids) if n else (lambda answers: ())
+        object.__setattr__(self, "_values", getter if n != 1 else (lambda answers: (getter(answers),)))
+        object.__setattr__(self, "_positions", {qid: i for i, qid in enumerate(self.question_ids)})
+
+    def __setattr__(self, name, value):
+        raise AttributeError("AnswerKey is immutable")
+
+    def __len__(self):
+        return len(self.question_ids)
+
+    def position_of(self, question_id: int) -> Optional[int]:
+        return self._positions.get(question_id)
+
+    def covers(self, question_ids) -> bool:
+        # True when the key is for exactly these questions
+        return len(question_ids) == len(self._positions) and self._positions.keys() >= question_ids
+
+    def answer_sheet(self, answers: Dict[int, str]):
+        # Packed bytes, or normalized strings for keys that compare strings
+        try:
+            values = self._values(answers)
+        except KeyError:
+            values = tuple(map(answers.get, self.question_ids))
+        if self.key is None:
+            return tuple(map(normalize_answer, values))
+        return bytes(map(_ANSWER_BYTES.__getitem__, values))
+
+    def _diff(self, sheet: bytes) -> bytes:
+        return (int.from_bytes(sheet, "little") ^ self._key_int).to_bytes(len(sheet), "little")
+
+    def grade(self, sheet) -> Tuple[int, bytes]:
+        # flags[i] is 1 when position i is correct
+        if self.key is None:
+            flags = bytes(a != "" and a == s for s, a in zip(sheet, self.answers))
+        else:
+            flags = self._diff(sheet).translate(_EQUAL_FLAGS)
+        return flags.count(1), flags
+
+    def grade_many(self, sheets: Iterable) -> List[int]:
+        if self.key is None: return [self.grade(sheet)[0] for sheet in sheets]
+        diff = self._diff
+        return [diff(sheet).count(0) for sheet in sheets]
+
+    def score(self, correct_count: int) -> float:
+        return score(correct_count, len(self))
+
+    def correct_question_ids(self, flags: bytes) -> List[int]:
+        return [qid for qid, ok in zip(self.question_ids, flags) if ok]
+
+
+def compile_answer_key(cursor, exam_id: int) -> AnswerKey:
+    # Position is the order the questions were attached to the exam
+    cursor.execute("""
+        SELECT ed.question_id, q.correct_answer
+        FROM exam_details ed
+        JOIN questions q ON q.question_id = ed.question_id
+        WHERE ed.exam_id = ?
+        ORDER BY ed.exam_detail_id
+    """, (exam_id,))
+    rows = cursor.fetchall()
+    return AnswerKey(exam_id, [r[0] for r in rows], [r[1] for r in rows])
+
+
+def compile_sheet_key(cursor, exam_id: int, question_ids: Iterable[int]) -> AnswerKey:
+    # Key for the questions an attempt was actually given, for when the exam's
+    # question list has changed since it started
+    question_ids = sorted(question_ids)
+    correct = {}
+    for start in range(0, len(question_ids), 500):
+        chunk = question_ids[start:start + 500]
+        cursor.execute(f"SELECT question_id, correct_answer FROM questions WHERE question_id IN ({','.join('?' * len(chunk))})", chunk)
+        correct.update(cursor.fetchall())
+    return AnswerKey(exam_id, question_ids, [correct.get(q) for q in question_ids])
+
+
+class AnswerKeyCache:
+    # Keyed by storage as well: exam ids repeat across databases
+    def __init__(self):
+        self._keys: Dict[Tuple[str, int], AnswerKey] = {}
+        self._lock = threading.Lock()
+
+    def get(self, exam_id: int) -> Optional[AnswerKey]:
+        return self._keys.get((database.current_storage().name, exam_id))
+
+    def put(self, key: AnswerKey):
+        with self._lock:
+            self._keys[(database.current_storage().name, key.exam_id)] = key
+
+    def invalidate(self, exam_id: int):
+        with self._lock:
+            self._keys.pop((database.current_storage().name, exam_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._keys.clear()
+
+
+answer_keys = AnswerKeyCache()
+
+
+def get_answer_key(exam_id: int) -> AnswerKey:
+    key = answer_keys.get(exam_id)
+    if key is None:
+        conn = get_connection()
+        try:
+            key = compile_answer_key(conn.cursor(), exam_id)
+        finally:
+            conn.close()
+        answer_keys.put(key)
+    return key
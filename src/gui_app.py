@@ -2,9 +2,19 @@ import tkinter as tk
 from tkinter import messagebox, ttk, filedialog, simpledialog
 from datetime import date, datetime
 import calendar
+import os
+import backup
 import database
+import journal
+import maintenance
+import readpool
+import reports
+from blueprint import parse_tags
+from countdown import Countdown
+from jobs import ProcessLock
+from listmodel import ListModel, ListboxBinding
 from models import User, Admin, Student, Subject, Question, Exam, Result
-from services import UserService, ExamService, ResultService, MasterDataService
+from services import UserService, ClassService, ExamService, ResultService, MasterDataService
 
 class QuizApp(tk.Tk):
     def __init__(self):
@@ -15,29 +25,51 @@ class QuizApp(tk.Tk):
         self.grid_rowconfigure(0, weight=1)
         self.grid_columnconfigure(0, weight=1)
 
-        database.init_db()
-        database.seed_data()
+        # Schema/seed work only runs when the stored schema version is behind
+        if database.init_db(): database.seed_data()
         self.user_service = UserService()
         self.exam_service = ExamService()
         self.result_service = ResultService()
         self.master_service = MasterDataService()
+        self.class_service = ClassService()
         self.current_user = None
+        self.start_background_jobs()
+        self.report_snapshots = readpool.start_snapshots(readpool.SNAPSHOT_INTERVAL) if readpool.SNAPSHOT_INTERVAL else None
         
         self.container = tk.Frame(self)
         self.container.grid(row=0, column=0, sticky="nsew")
         self.container.grid_rowconfigure(0, weight=1)
         self.container.grid_columnconfigure(0, weight=1)
 
+        # Frames are built the first time they are shown
         self.frames = {}
-        for F in (LoginFrame, RegisterFrame, AdminDashboard, StudentDashboard):
-            page_name = F.__name__
-            frame = F(parent=self.container, controller=self)
+        self.frame_classes = {F.__name__: F for F in (LoginFrame, RegisterFrame, AdminDashboard, StudentDashboard)}
+        self.show_frame("LoginFrame")
+
+    def start_background_jobs(self):
+        # Every client sharing the database could run these; only the one holding
+        # the lock file next to it does (an in-memory database is never shared)
+        self.expiry_sweeper = self.prewarmer = self.scheduled_backups = self.maintenance = None
+        path = database.current_storage().path
+        self.jobs_lock = ProcessLock(path + ".jobs.lock") if path else None
+        if self.jobs_lock is not None and not self.jobs_lock.acquire(): return
+        # Grade attempts left open by crashed or closed clients
+        self.expiry_sweeper = self.result_service.start_expiry_sweeper()
+        # Answer sheets for class-assigned exams are created before they open
+        self.prewarmer = self.result_service.start_prewarmer()
+        self.scheduled_backups = backup.start_scheduled_backups()
+        self.maintenance = maintenance.start_scheduler()
+
+    def get_frame(self, page_name):
+        frame = self.frames.get(page_name)
+        if frame is None:
+            frame = self.frame_classes[page_name](parent=self.container, controller=self)
             self.frames[page_name] = frame
             frame.grid(row=0, column=0, sticky="nsew")
-        self.show_frame("LoginFrame")
+        return frame
 
     def show_frame(self, page_name):
-        frame = self.frames[page_name]
+        frame = self.get_frame(page_name)
         frame.tkraise()
         if hasattr(frame, "on_show"): frame.on_show()
 
@@ -48,6 +80,18 @@ class QuizApp(tk.Tk):
 
 BTN_FONT = ("Arial", 11, "bold")
 
+class Debouncer:
+    # Runs fn once typing has paused for `delay` ms
+    def __init__(self, widget, delay, fn):
+        self.widget, self.delay, self.fn = widget, delay, fn
+        self._job = None
+    def __call__(self, event=None):
+        if self._job: self.widget.after_cancel(self._job)
+        self._job = self.widget.after(self.delay, self._fire)
+    def _fire(self):
+        self._job = None
+        self.fn()
+
 class LoginFrame(tk.Frame):
     def __init__(self, parent, controller):
         super().__init__(parent)
@@ -133,6 +177,7 @@ class AdminDashboard(tk.Frame):
             ("Manage Questions", self.show_questions),
             ("Create Exam", self.show_create_exam),
             ("Exam Management", self.show_exam_management),
+            ("Manage Classes", self.show_classes),
         ]
         for text, cmd in menus:
             tk.Button(self.sidebar, text=text, command=cmd, font=("Arial", 11), bg="white", relief="flat", padx=10, pady=10).pack(fill="x", pady=5, padx=5)
@@ -143,16 +188,16 @@ class AdminDashboard(tk.Frame):
         self.content_area.grid_columnconfigure(0, weight=1)
 
         self.frames = {}
-        for F in (ManageSubjectsFrame, ManageQuestionsFrame, CreateExamFrame, ExamManagementFrame):
-            page_name = F.__name__
-            frame = F(parent=self.content_area, controller=self.controller)
-            self.frames[page_name] = frame
-            frame.grid(row=0, column=0, sticky="nsew")
+        self.frame_classes = {F.__name__: F for F in (ManageSubjectsFrame, ManageQuestionsFrame, CreateExamFrame, ExamManagementFrame, ManageClassesFrame)}
         
         self.show_subjects()
 
     def switch_content(self, page_name):
-        frame = self.frames[page_name]
+        frame = self.frames.get(page_name)
+        if frame is None:
+            frame = self.frame_classes[page_name](parent=self.content_area, controller=self.controller)
+            self.frames[page_name] = frame
+            frame.grid(row=0, column=0, sticky="nsew")
         frame.tkraise()
         if hasattr(frame, "on_show"): frame.on_show()
 
@@ -160,6 +205,7 @@ class AdminDashboard(tk.Frame):
     def show_questions(self): self.switch_content("ManageQuestionsFrame")
     def show_create_exam(self): self.switch_content("CreateExamFrame")
     def show_exam_management(self): self.switch_content("ExamManagementFrame")
+    def show_classes(self): self.switch_content("ManageClassesFrame")
     
 class ManageSubjectsFrame(tk.Frame):
     def __init__(self, parent, controller):
@@ -195,6 +241,103 @@ class ManageSubjectsFrame(tk.Frame):
         for i in reversed(sel): self.controller.master_service.delete_subject(self.subjects[i].subject_id)
         self.refresh()
 
+class ManageClassesFrame(tk.Frame):
+    # Classes on the left, all students on the right; the selected students are the class members
+    def __init__(self, parent, controller):
+        super().__init__(parent)
+        self.controller = controller
+        tk.Label(self, text="Manage Classes", font=("Arial", 16, "bold")).pack(pady=10)
+        body = tk.Frame(self)
+        body.pack(fill="both", expand=True)
+
+        left = tk.Frame(body)
+        left.pack(side="left", fill="both", expand=True, padx=(0, 10))
+        tk.Label(left, text="Classes", font=BTN_FONT).pack(anchor="w")
+        self.lb_classes = tk.Listbox(left, font=("Arial", 11), exportselection=False)
+        self.lb_classes.pack(fill="both", expand=True)
+        self.lb_classes.bind("<<ListboxSelect>>", lambda e: self.load_members())
+        bf = tk.Frame(left)
+        bf.pack(pady=10)
+        self.entry_name = tk.Entry(bf, font=("Arial", 12))
+        self.entry_name.pack(side="left", padx=5)
+        tk.Button(bf, text="Add", command=self.add, bg="#4CAF50", fg="white", font=BTN_FONT, pady=5).pack(side="left", padx=5)
+        tk.Button(bf, text="Delete", command=self.delete, bg="#F44336", fg="white", font=BTN_FONT, pady=5).pack(side="left", padx=5)
+
+        right = tk.Frame(body)
+        right.pack(side="left", fill="both", expand=True)
+        tk.Label(right, text="Members (select students, then Save)", font=BTN_FONT).pack(anchor="w")
+        f = tk.Frame(right)
+        f.pack(fill="both", expand=True)
+        sb = ttk.Scrollbar(f)
+        self.lb_students = tk.Listbox(f, selectmode=tk.MULTIPLE, yscrollcommand=sb.set, font=("Arial", 11), exportselection=False)
+        sb.config(command=self.lb_students.yview)
+        sb.pack(side="right", fill="y")
+        self.lb_students.pack(side="left", fill="both", expand=True)
+        tk.Button(right, text="Save Members", command=self.save_members, bg="#2196F3", fg="white", font=BTN_FONT, pady=5).pack(pady=10)
+
+    def on_show(self): self.refresh()
+    def refresh(self):
+        self.lb_classes.delete(0, tk.END)
+        self.classes = self.controller.class_service.get_all_classes()
+        for c in self.classes: self.lb_classes.insert(tk.END, f"{c.class_name} ({c.member_count})")
+        self.lb_students.delete(0, tk.END)
+        self.students = self.controller.user_service.get_all_students()
+        for st in self.students: self.lb_students.insert(tk.END, f"{st.full_name} ({st.username})")
+
+    def selected_class(self):
+        sel = self.lb_classes.curselection()
+        return self.classes[sel[0]] if sel else None
+
+    def load_members(self):
+        c = self.selected_class()
+        self.lb_students.selection_clear(0, tk.END)
+        if c is None: return
+        members = set(self.controller.class_service.get_member_ids(c.class_id))
+        for i, st in enumerate(self.students):
+            if st.user_id in members: self.lb_students.selection_set(i)
+
+    def add(self):
+        try: self.controller.class_service.add_class(self.entry_name.get().strip()); self.refresh(); self.entry_name.delete(0, tk.END)
+        except Exception as e: messagebox.showerror("Error", str(e))
+
+    def delete(self):
+        c = self.selected_class()
+        if c is None or not messagebox.askyesno("Confirm", f"Delete class {c.class_name}?"): return
+        self.controller.class_service.delete_class(c.class_id)
+        self.refresh()
+
+    def save_members(self):
+        c = self.selected_class()
+        if c is None: return messagebox.showinfo("Info", "Select a class first")
+        ids = [self.students[i].user_id for i in self.lb_students.curselection()]
+        self.controller.class_service.set_members(c.class_id, ids)
+        idx = self.lb_classes.curselection()[0]
+        self.refresh()
+        self.lb_classes.selection_set(idx)
+        self.load_members()
+
+class AssignClassesWindow(tk.Toplevel):
+    def __init__(self, controller, exam):
+        super().__init__()
+        self.controller = controller
+        self.exam = exam
+        self.title(f"Assign Classes: {exam.exam_name}")
+        self.geometry("400x450")
+        tk.Label(self, text="Only members of the selected classes see this exam.\nNo selection: every student sees it.",
+                 font=("Arial", 10), justify="left").pack(anchor="w", padx=20, pady=10)
+        self.lb = tk.Listbox(self, selectmode=tk.MULTIPLE, font=("Arial", 11), exportselection=False)
+        self.lb.pack(fill="both", expand=True, padx=20)
+        self.classes = controller.class_service.get_all_classes()
+        assigned = set(controller.class_service.get_exam_class_ids(exam.exam_id))
+        for i, c in enumerate(self.classes):
+            self.lb.insert(tk.END, f"{c.class_name} ({c.member_count})")
+            if c.class_id in assigned: self.lb.selection_set(i)
+        tk.Button(self, text="Save", command=self.save, bg="#4CAF50", fg="white", font=BTN_FONT, pady=5).pack(pady=15)
+
+    def save(self):
+        self.controller.class_service.set_exam_classes(self.exam.exam_id, [self.classes[i].class_id for i in self.lb.curselection()])
+        self.destroy()
+
 class ManageQuestionsFrame(tk.Frame):
     def __init__(self, parent, controller):
         super().__init__(parent)
@@ -204,12 +347,17 @@ class ManageQuestionsFrame(tk.Frame):
         ff.pack(fill="x")
         tk.Label(ff, text="Subject:", font=("Arial", 11)).pack(side="left")
         self.cb = ttk.Combobox(ff, state="readonly", font=("Arial", 11)); self.cb.pack(side="left"); self.cb.bind("<<ComboboxSelected>>", self.refresh)
+        tk.Label(ff, text="Search:", font=("Arial", 11)).pack(side="left", padx=(15, 0))
+        self.search = tk.Entry(ff, font=("Arial", 11)); self.search.pack(side="left", padx=5)
+        self.search.bind("<KeyRelease>", Debouncer(self, 250, self.refresh))
         tk.Button(ff, text="Import CSV", command=self.import_csv, bg="#FF9800", fg="white", font=BTN_FONT, pady=5).pack(side="right")
         self.lb = tk.Listbox(self, selectmode=tk.EXTENDED, font=("Consolas", 10))
         self.lb.pack(fill="both", expand=True, padx=10, pady=5)
         af = tk.Frame(self); af.pack(pady=10)
         tk.Button(af, text="Add", command=self.add, font=BTN_FONT, pady=5).pack(side="left", padx=5)
         tk.Button(af, text="Delete", command=self.delete, bg="#F44336", fg="white", font=BTN_FONT, pady=5).pack(side="left", padx=5)
+        tk.Button(af, text="Find Duplicates", command=self.find_duplicates, font=BTN_FONT, pady=5).pack(side="left", padx=5)
+        tk.Button(af, text="Tag Selected", command=self.tag_selected, font=BTN_FONT, pady=5).pack(side="left", padx=5)
 
     def on_show(self): 
         self.subs = self.controller.master_service.get_all_subjects()
@@ -220,7 +368,9 @@ class ManageQuestionsFrame(tk.Frame):
         self.lb.delete(0, tk.END)
         s = next((x for x in self.subs if x.subject_name == self.cb.get()), None)
         if not s: return
-        self.qs = self.controller.master_service.get_questions_by_subject(s.subject_id)
+        term = self.search.get().strip()
+        if term: self.qs = self.controller.master_service.search_questions(term, s.subject_id, limit=500)
+        else: self.qs = self.controller.master_service.get_questions_by_subject(s.subject_id)
         for q in self.qs: self.lb.insert(tk.END, f"[{q.difficulty_level.upper()}] {q.content}")
     def delete(self):
         sel = self.lb.curselection()
@@ -230,12 +380,39 @@ class ManageQuestionsFrame(tk.Frame):
     def import_csv(self):
         fp = filedialog.askopenfilename()
         if fp: 
-            try: self.controller.master_service.import_questions_from_csv(fp); messagebox.showinfo("OK", "Imported"); self.on_show()
+            try:
+                rep = self.controller.master_service.import_questions_from_csv(fp, background_regrade=True)
+                msg = f"Imported: {rep['inserted']} new, {rep['updated']} updated"
+                if rep["near_duplicates"]:
+                    msg += f"\n{len(rep['near_duplicates'])} look like near-duplicates of existing questions:"
+                    for d in rep["near_duplicates"][:10]: msg += f"\n  line {d['line']}: {d['content'][:50]}"
+                messagebox.showinfo("OK", msg); self.on_show()
             except Exception as e: messagebox.showerror("Error", str(e))
+    def tag_selected(self):
+        sel = self.lb.curselection()
+        if not sel: return messagebox.showinfo("Info", "Select questions first")
+        name = simpledialog.askstring("Tag", f"Topic tag for {len(sel)} question(s):", parent=self)
+        if not name or not name.strip(): return
+        try:
+            self.controller.master_service.tag_questions(name.strip(), [self.qs[i].question_id for i in sel])
+            messagebox.showinfo("OK", f"Tagged {len(sel)} question(s) with '{name.strip()}'")
+        except Exception as e: messagebox.showerror("Error", str(e))
+    def find_duplicates(self):
+        s = next((x for x in self.subs if x.subject_name == self.cb.get()), None)
+        if not s: return
+        groups = self.controller.master_service.find_duplicate_clusters(s.subject_id)
+        if not groups: return messagebox.showinfo("Duplicates", "No near-duplicate questions found")
+        win = tk.Toplevel(self); win.title(f"Near-duplicate questions: {s.subject_name}"); win.geometry("700x500")
+        txt = tk.Text(win, font=("Consolas", 10), wrap="word"); txt.pack(fill="both", expand=True)
+        for i, g in enumerate(groups, 1):
+            txt.insert(tk.END, f"Group {i} ({len(g)} questions)\n")
+            for q in g: txt.insert(tk.END, f"  #{q.question_id} [{q.difficulty_level}] {q.content}\n")
+            txt.insert(tk.END, "\n")
+        txt.config(state="disabled")
     def add(self):
         win = tk.Toplevel(self)
         win.title("Add New Question")
-        win.geometry("600x700")
+        win.geometry("600x760")
         
         main_frame = tk.Frame(win, padx=20, pady=20)
         main_frame.pack(fill="both", expand=True)
@@ -265,6 +442,10 @@ class ManageQuestionsFrame(tk.Frame):
         cb_level.pack(fill="x", pady=5)
         cb_level.current(0)
 
+        tk.Label(main_frame, text="Topic tags (comma separated):", font=BTN_FONT).pack(anchor="w", pady=(10,0))
+        en_tags = tk.Entry(main_frame, font=("Arial", 11))
+        en_tags.pack(fill="x", pady=5)
+
         def save():
             sub_name = cb_sub.get()
             if not sub_name:
@@ -277,11 +458,18 @@ class ManageQuestionsFrame(tk.Frame):
                 messagebox.showwarning("Warning", "Content and Correct Answer required")
                 return
 
+            similar = self.controller.master_service.find_near_duplicates(subject.subject_id, content)
+            if similar:
+                top, score = similar[0]
+                if score >= 1.0: prompt = f"This matches an existing question and will update it:\n\n{top.content}\n\nContinue?"
+                else: prompt = f"A similar question already exists ({score:.0%} match):\n\n{top.content}\n\nSave anyway?"
+                if not messagebox.askyesno("Possible Duplicate", prompt, parent=win): return
+
             try:
                 q = Question(0, subject.subject_id, content, 
                              entries['a'].get(), entries['b'].get(), entries['c'].get(), entries['d'].get(), 
                              cb_correct.get(), cb_level.get())
-                self.controller.master_service.add_question(q)
+                self.controller.master_service.add_question(q, background_regrade=True, tags=parse_tags(en_tags.get()) or None)
                 self.refresh()
                 win.destroy()
                 messagebox.showinfo("Success", "Question Added")
@@ -297,7 +485,9 @@ class CreateExamFrame(tk.Frame):
         nb = ttk.Notebook(self); nb.pack(fill="both", expand=True)
         self.manual = ManualExamFrame(nb, controller); nb.add(self.manual, text="Manual")
         self.auto = AutoExamFrame(nb, controller); nb.add(self.auto, text="Auto")
-    def on_show(self): self.manual.on_show(); self.auto.on_show()
+        self.blueprint = BlueprintExamFrame(nb, controller); nb.add(self.blueprint, text="Blueprint")
+        self.adaptive = AdaptiveExamFrame(nb, controller); nb.add(self.adaptive, text="Adaptive")
+    def on_show(self): self.manual.on_show(); self.auto.on_show(); self.blueprint.on_show(); self.adaptive.on_show()
 
 import calendar
 
@@ -388,6 +578,8 @@ class ManualExamFrame(tk.Frame):
         tk.Label(sf, text="Name:").pack(side="left"); self.en = tk.Entry(sf); self.en.pack(side="left", padx=5)
         tk.Label(sf, text="Subject:").pack(side="left"); self.cb = ttk.Combobox(sf, state="readonly", width=15); self.cb.pack(side="left", padx=5); self.cb.bind("<<ComboboxSelected>>", self.filt)
         tk.Label(sf, text="Dur(min):").pack(side="left"); self.dr = tk.Entry(sf, width=5); self.dr.insert(0,"60"); self.dr.pack(side="left", padx=5)
+        tk.Label(sf, text="Search:").pack(side="left"); self.search = tk.Entry(sf); self.search.pack(side="left", padx=5)
+        self.search.bind("<KeyRelease>", Debouncer(self, 250, self.apply_search))
         
         # Date Pickers
         df = tk.Frame(self); df.pack(fill="x", pady=5)
@@ -406,7 +598,9 @@ class ManualExamFrame(tk.Frame):
         tk.Button(md, text=">>", command=self.add_q).pack(); tk.Button(md, text="<<", command=self.rem_q).pack()
         self.sel = tk.Listbox(qa, selectmode=tk.EXTENDED); self.sel.pack(side="left", fill="both", expand=True)
         tk.Button(self, text="Create Exam (Draft)", command=self.crt, bg="#4CAF50", fg="white", font=BTN_FONT).pack(pady=10)
-        self.p_list, self.s_list = [], []
+        # Moves only touch the rows that changed; the pool renders progressively
+        self.p_model, self.s_model = ListModel(), ListModel()
+        self.p_view, self.s_view = ListboxBinding(self.pool, self.p_model), ListboxBinding(self.sel, self.s_model)
 
     def on_show(self):
         self.subs = self.controller.master_service.get_all_subjects()
@@ -418,22 +612,22 @@ class ManualExamFrame(tk.Frame):
     def filt(self, e=None):
         s = next((x for x in self.subs if x.subject_name == self.cb.get()), None)
         if not s: return
-        self.p_list = self.controller.master_service.get_questions_by_subject(s.subject_id); self.s_list = []
-        self.refs()
-    def refs(self):
-        self.pool.delete(0, tk.END); self.sel.delete(0, tk.END)
-        for q in self.p_list: self.pool.insert(tk.END, q.content)
-        for q in self.s_list: self.sel.insert(tk.END, q.content)
+        self.p_model.reset(self.controller.master_service.get_questions_by_subject(s.subject_id)); self.s_model.reset([])
+        self.search.delete(0, tk.END)
+    def apply_search(self):
+        # Pool shows the matching questions that are not already selected
+        s = next((x for x in self.subs if x.subject_name == self.cb.get()), None)
+        if not s: return
+        term = self.search.get().strip()
+        if term: found = self.controller.master_service.search_questions(term, s.subject_id, limit=500)
+        else: found = self.controller.master_service.get_questions_by_subject(s.subject_id)
+        self.p_model.reset(q for q in found if q.question_id not in self.s_model)
     def add_q(self):
-        ids = self.pool.curselection()
-        to_move = [self.p_list[i] for i in ids]
-        for i in reversed(ids): del self.p_list[i]
-        self.s_list.extend(to_move); self.refs()
+        self.p_view.sync_selection()
+        self.s_model.extend(self.p_model.take_selected())
     def rem_q(self):
-        ids = self.sel.curselection()
-        to_move = [self.s_list[i] for i in ids]
-        for i in reversed(ids): del self.s_list[i]
-        self.p_list.extend(to_move); self.refs()
+        self.s_view.sync_selection()
+        self.p_model.extend(self.s_model.take_selected())
 
     def crt(self):
         s = next((x for x in self.subs if x.subject_name == self.cb.get()), None)
@@ -447,7 +641,7 @@ class ManualExamFrame(tk.Frame):
         if not dur.isdigit() or int(dur) <= 0:
             messagebox.showwarning("Validation", "Duration must be a positive number")
             return
-        if not self.s_list:
+        if not len(self.s_model):
             messagebox.showwarning("Validation", "Please select at least one question")
             return
             
@@ -460,11 +654,11 @@ class ManualExamFrame(tk.Frame):
                 return
             
             self.controller.exam_service.create_exam(
-                self.controller.current_user, s, name, int(dur), self.s_list,
+                self.controller.current_user, s, name, int(dur), self.s_model.items(),
                 start_date=start_d, end_date=end_d
             )
             messagebox.showinfo("OK", "Exam Created (Status: Draft)"); self.filt()
-            self.s_list = []; self.refs(); self.en.delete(0, tk.END)
+            self.en.delete(0, tk.END)
             self.start_picker.set_to_now(); self.end_picker.set_to_now()
         except Exception as e: messagebox.showerror("Error", str(e))
 
@@ -542,6 +736,144 @@ class AutoExamFrame(tk.Frame):
             messagebox.showinfo("OK", "Created (Status: Draft)")
         except Exception as e: messagebox.showerror("Error", str(e))
 
+class BlueprintExamFrame(tk.Frame):
+    SAMPLE = "# <count> [easy|medium|hard] [topic, topic...]\n10 easy Algebra\n5 hard Geometry\n"
+
+    def __init__(self, parent, controller):
+        super().__init__(parent)
+        self.controller = controller
+        sf = tk.Frame(self); sf.pack(fill="x", pady=10)
+        tk.Label(sf, text="Name:").pack(side="left"); self.en = tk.Entry(sf); self.en.pack(side="left", padx=5)
+        tk.Label(sf, text="Subject:").pack(side="left"); self.cb = ttk.Combobox(sf, state="readonly", width=15); self.cb.pack(side="left", padx=5)
+        tk.Label(sf, text="Dur(min):").pack(side="left"); self.dr = tk.Entry(sf, width=5); self.dr.insert(0, "60"); self.dr.pack(side="left", padx=5)
+
+        df = tk.Frame(self); df.pack(fill="x", pady=5)
+        tk.Label(df, text="Start:").grid(row=0, column=0, padx=5, sticky="e")
+        self.start_picker = DateTimePicker(df); self.start_picker.grid(row=0, column=1, padx=5, sticky="w")
+        tk.Label(df, text="End:").grid(row=1, column=0, padx=5, sticky="e")
+        self.end_picker = DateTimePicker(df); self.end_picker.grid(row=1, column=1, padx=5, sticky="w")
+
+        body = tk.Frame(self); body.pack(fill="both", expand=True, pady=5)
+        left = tk.Frame(body); left.pack(side="left", fill="both", expand=True)
+        tk.Label(left, text="Blueprint (one section per line):").pack(anchor="w")
+        self.txt = tk.Text(left, height=8, font=("Consolas", 11)); self.txt.pack(fill="both", expand=True)
+        self.txt.insert("1.0", self.SAMPLE)
+        mid = tk.Frame(body); mid.pack(side="left", fill="y", padx=10)
+        tk.Label(mid, text="Topics (double-click to insert):").pack(anchor="w")
+        self.lb_tags = tk.Listbox(mid, width=25); self.lb_tags.pack(fill="y", expand=True)
+        self.lb_tags.bind("<Double-Button-1>", self.insert_tag)
+        right = tk.Frame(body); right.pack(side="left", fill="y")
+        tk.Label(right, text="Skip questions already seen by:").pack(anchor="w")
+        self.lb_classes = tk.Listbox(right, selectmode=tk.MULTIPLE, width=25, exportselection=False); self.lb_classes.pack(fill="y", expand=True)
+        tk.Label(right, text="since (YYYY-MM-DD, empty = ever):").pack(anchor="w")
+        self.since = tk.Entry(right); self.since.pack(fill="x")
+
+        bf = tk.Frame(self); bf.pack(pady=10)
+        tk.Button(bf, text="Check", command=self.check, font=BTN_FONT).pack(side="left", padx=5)
+        tk.Button(bf, text="Generate (Draft)", command=self.gen, bg="#673AB7", fg="white", font=BTN_FONT).pack(side="left", padx=5)
+
+    def on_show(self):
+        self.subs = self.controller.master_service.get_all_subjects()
+        self.cb['values'] = [s.subject_name for s in self.subs]
+        if self.subs and not self.cb.get(): self.cb.current(0)
+        self.tags = self.controller.master_service.get_all_tags()
+        self.lb_tags.delete(0, tk.END)
+        for t in self.tags: self.lb_tags.insert(tk.END, f"{t.tag_name} ({t.question_count})")
+        self.classes = self.controller.class_service.get_all_classes()
+        self.lb_classes.delete(0, tk.END)
+        for c in self.classes: self.lb_classes.insert(tk.END, c.class_name)
+        self.start_picker.set_to_now(); self.end_picker.set_to_now()
+
+    def insert_tag(self, e=None):
+        sel = self.lb_tags.curselection()
+        if sel: self.txt.insert(tk.INSERT, self.tags[sel[0]].tag_name)
+
+    def options(self):
+        s = next((x for x in self.subs if x.subject_name == self.cb.get()), None)
+        if not s: raise ValueError("Select a subject")
+        since = self.since.get().strip() or None
+        if since:
+            try: datetime.strptime(since, "%Y-%m-%d")
+            except ValueError: raise ValueError("'since' must be YYYY-MM-DD")
+        return s, self.txt.get("1.0", tk.END), [self.classes[i].class_id for i in self.lb_classes.curselection()], since
+
+    def check(self):
+        try:
+            s, text, classes, since = self.options()
+            rows = self.controller.exam_service.check_blueprint(s.subject_id, text, classes, since)
+        except Exception as e: return messagebox.showerror("Error", str(e))
+        lines = [f"{'OK ' if n >= sec.count else 'SHORT'}  line {sec.line}: {sec.describe()} - {n} available" for sec, n in rows]
+        messagebox.showinfo("Blueprint", "\n".join(lines))
+
+    def gen(self):
+        name = self.en.get().strip()
+        dur = self.dr.get().strip()
+        if not name: return messagebox.showwarning("Validation", "Exam Name is required")
+        if not dur.isdigit() or int(dur) <= 0: return messagebox.showwarning("Validation", "Duration must be a positive number")
+        sd, ed = self.start_picker.get_datetime_str(), self.end_picker.get_datetime_str()
+        if sd and ed and sd > ed: return messagebox.showwarning("Validation", "Start Date must be before End Date")
+        try:
+            s, text, classes, since = self.options()
+            self.controller.exam_service.create_blueprint_exam(self.controller.current_user, s, name, int(dur), text,
+                                                               classes, since, start_date=sd, end_date=ed)
+            messagebox.showinfo("OK", "Created (Status: Draft)")
+        except Exception as e: messagebox.showerror("Error", str(e))
+
+class AdaptiveExamFrame(tk.Frame):
+    # No question list: every student gets the given number of questions from the subject, picked as they answer
+    def __init__(self, parent, controller):
+        super().__init__(parent)
+        self.controller = controller
+        f = tk.Frame(self); f.place(relx=0.5, rely=0.3, anchor="center")
+        tk.Label(f, text="Adaptive Exam Creation", font=("Arial",14)).grid(row=0, columnspan=2, pady=10)
+
+        ls = ["Name:","Subject:","Duration:","Questions per student:"]
+        self.ws = {}
+        for i,t in enumerate(ls):
+            tk.Label(f, text=t).grid(row=i+1, column=0, sticky="e", pady=5)
+            w = ttk.Combobox(f, state="readonly") if "Subject" in t else tk.Entry(f)
+            w.grid(row=i+1, column=1, pady=5); self.ws[t] = w
+        self.ws["Duration:"].insert(0,"60")
+        self.ws["Questions per student:"].insert(0,"20")
+
+        row_offset = len(ls) + 1
+        tk.Label(f, text="Start Date:").grid(row=row_offset, column=0, sticky="e", pady=5)
+        self.start_picker = DateTimePicker(f)
+        self.start_picker.grid(row=row_offset, column=1, pady=5, sticky="w")
+        tk.Label(f, text="End Date:").grid(row=row_offset+1, column=0, sticky="e", pady=5)
+        self.end_picker = DateTimePicker(f)
+        self.end_picker.grid(row=row_offset+1, column=1, pady=5, sticky="w")
+
+        self.params_lbl = tk.Label(f, text="", fg="#616161")
+        self.params_lbl.grid(row=row_offset+2, columnspan=2)
+        tk.Button(f, text="Create (Draft)", command=self.gen, bg="#673AB7", fg="white", font=BTN_FONT).grid(row=row_offset+3, columnspan=2, pady=20)
+
+    def on_show(self):
+        self.subs = self.controller.master_service.get_all_subjects()
+        self.ws["Subject:"]['values'] = [s.subject_name for s in self.subs]
+        if self.subs and not self.ws["Subject:"].get(): self.ws["Subject:"].current(0)
+        self.start_picker.set_to_now(); self.end_picker.set_to_now()
+        counts = self.controller.master_service.get_item_param_counts()
+        self.params_lbl.config(text=f"Item parameters: {counts.get('import', 0)} imported, {counts.get('pvalue', 0)} calibrated, "
+                                    f"{counts.get('default', 0)} by difficulty")
+
+    def gen(self):
+        s = next((x for x in self.subs if x.subject_name == self.ws["Subject:"].get()), None)
+        name = self.ws["Name:"].get().strip()
+        dur = self.ws["Duration:"].get().strip()
+        length = self.ws["Questions per student:"].get().strip()
+        if not name: return messagebox.showwarning("Validation", "Exam Name is required")
+        if not s: return messagebox.showwarning("Validation", "Select a subject")
+        if not dur.isdigit() or int(dur) <= 0: return messagebox.showwarning("Validation", "Duration must be a positive number")
+        if not length.isdigit() or int(length) <= 0: return messagebox.showwarning("Validation", "Questions per student must be a positive number")
+        sd, ed = self.start_picker.get_datetime_str(), self.end_picker.get_datetime_str()
+        if sd and ed and sd > ed: return messagebox.showwarning("Validation", "Start Date must be before End Date")
+        try:
+            self.controller.exam_service.create_adaptive_exam(self.controller.current_user, s, name, int(dur), int(length),
+                                                              start_date=sd, end_date=ed)
+            messagebox.showinfo("OK", "Created (Status: Draft)")
+        except Exception as e: messagebox.showerror("Error", str(e))
+
 class ExamManagementFrame(tk.Frame):
     def __init__(self, parent, controller):
         super().__init__(parent)
@@ -652,6 +984,8 @@ class ExamDetailWindow(tk.Toplevel):
         act_f = tk.Frame(header, bg="#F5F7FB")
         act_f.pack(side="right")
         
+        tk.Button(act_f, text="ASSIGN CLASSES", command=lambda: AssignClassesWindow(self.controller, self.exam), bg="#607D8B", fg="white", font=("Arial", 10, "bold"), padx=15, pady=8, relief="flat").pack(side="left", padx=5)
+        tk.Button(act_f, text="LIVE MONITOR", command=lambda: LiveMonitorWindow(self.controller, self.exam), bg="#2196F3", fg="white", font=("Arial", 10, "bold"), padx=15, pady=8, relief="flat").pack(side="left", padx=5)
         if exam.status == 'draft':
             tk.Button(act_f, text="PUBLISH EXAM", command=self.publish, bg="#4CAF50", fg="white", font=("Arial", 10, "bold"), padx=15, pady=8, relief="flat").pack(side="left", padx=5)
         elif exam.status == 'published':
@@ -759,23 +1093,18 @@ class ExamDetailWindow(tk.Toplevel):
     def export_report(self):
         if not self.res: return messagebox.showinfo("Info", "No results to export")
         
-        f_path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV Files", "*.csv")])
+        f_path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV Files", "*.csv"), ("Gzipped CSV", "*.csv.gz")])
         if not f_path: return
-        
+        with_matrix = messagebox.askyesno("Export", "Also export the per-question answer matrix?")
+        
+        # Streams straight from the database; the answer matrix is written next to the report
+        compress = f_path.endswith(".gz")
+        jobs = [("exam", self.exam.exam_id, f_path, compress)]
+        if with_matrix:
+            base = f_path[:-7] if f_path.endswith(".csv.gz") else os.path.splitext(f_path)[0]
+            jobs.append(("matrix", self.exam.exam_id, base + "_matrix" + (".csv.gz" if compress else ".csv"), compress))
         try:
-            import csv
-            with open(f_path, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerow(["Exam Report", self.exam.exam_name])
-                writer.writerow(["Total Participants", self.stat_vars["total"].get()])
-                writer.writerow(["Average Score", self.stat_vars["avg"].get()])
-                writer.writerow(["Highest Score", self.stat_vars["high"].get()])
-                writer.writerow(["Lowest Score", self.stat_vars["low"].get()])
-                writer.writerow([])
-                writer.writerow(["#", "Student Name", "Score", "Submission Time"])
-                
-                for i, r in enumerate(self.res, 1):
-                    writer.writerow([i, r.student_name, r.score, r.submit_time])
+            reports.generate(jobs, workers=1)
             messagebox.showinfo("Success", "Report exported successfully!")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to export: {e}")
@@ -791,6 +1120,92 @@ class ExamDetailWindow(tk.Toplevel):
         self.controller.result_service.delete_result(self.res[int(sel[0])].result_id)
         self.load_results()
 
+MONITOR_POLL_MS = 1500  # changelog poll interval of the live monitor
+
+class LiveMonitorWindow(tk.Toplevel):
+    # Open attempts of one exam, kept current from the changelog: each poll reads
+    # only the changes since the last one and refreshes only those attempts
+    def __init__(self, controller, exam):
+        super().__init__()
+        self.controller = controller
+        self.exam = exam
+        self.title(f"Live Monitor: {exam.exam_name}")
+        self.geometry("900x600")
+
+        top = tk.Frame(self, padx=20, pady=10)
+        top.pack(fill="x")
+        tk.Label(top, text=f"Live Monitor - {exam.exam_name}", font=("Arial", 16, "bold")).pack(side="left")
+        self.summary_lbl = tk.Label(top, text="", font=("Arial", 11), fg="#757575")
+        self.summary_lbl.pack(side="right")
+
+        self.tree = ttk.Treeview(self, columns=("st", "ans", "left", "act", "status"), show="headings", selectmode="browse")
+        self.tree.heading("st", text="Student Name"); self.tree.column("st", width=260)
+        self.tree.heading("ans", text="Answered"); self.tree.column("ans", width=100, anchor="center")
+        self.tree.heading("left", text="Time Left"); self.tree.column("left", width=100, anchor="center")
+        self.tree.heading("act", text="Last Activity"); self.tree.column("act", width=120, anchor="center")
+        self.tree.heading("status", text="Status"); self.tree.column("status", width=120, anchor="center")
+        self.tree.pack(fill="both", expand=True, padx=20, pady=(0, 20))
+
+        # Read the position first: changes racing the initial load are applied again, harmlessly
+        rs = self.controller.result_service
+        self.last_change = rs.last_change_id()
+        self.attempts = {}
+        for a in rs.get_live_attempts(exam.exam_id): self.show(a)
+        self.tick()
+        self.after(MONITOR_POLL_MS, self.poll)
+
+    def show(self, attempt):
+        rid = attempt["result_id"]
+        if attempt["last_activity"] is None and rid in self.attempts:
+            attempt["last_activity"] = self.attempts[rid]["last_activity"]
+        self.attempts[rid] = attempt
+        status = {"completed": "Submitted", "not_started": "Not started"}.get(attempt["status"], "In progress")
+        if attempt["status"] == "completed": status += f" ({attempt['score']:.1f})"
+        values = (attempt["student_name"], f"{attempt['answered']} / {attempt['questions']}", self.time_left(attempt),
+                  (attempt["last_activity"] or "")[11:19], status)
+        if self.tree.exists(rid): self.tree.item(rid, values=values)
+        else: self.tree.insert("", "end", iid=rid, values=values)
+
+    def time_left(self, attempt):
+        if attempt["status"] != "in_progress" or not attempt["deadline"]: return "-"
+        left = int((datetime.fromisoformat(attempt["deadline"]) - datetime.now()).total_seconds())
+        return "0:00" if left <= 0 else f"{left // 60}:{left % 60:02d}"
+
+    def poll(self):
+        if not self.winfo_exists(): return
+        rs = self.controller.result_service
+        try:
+            changes = rs.get_exam_changes(self.exam.exam_id, self.last_change)
+        except Exception:
+            changes = []  # database busy or unreachable: try again next poll
+        if changes:
+            self.last_change = changes[-1][0]
+            touched, activity = set(), {}
+            for _, rid, entity, kind, changed_at in changes:
+                if entity == "results" and kind == "delete":
+                    touched.discard(rid)
+                    self.attempts.pop(rid, None)
+                    if self.tree.exists(rid): self.tree.delete(rid)
+                else:
+                    touched.add(rid)
+                    activity[rid] = changed_at
+            for a in rs.get_live_attempts(self.exam.exam_id, sorted(touched)):
+                if activity.get(a["result_id"]): a["last_activity"] = activity[a["result_id"]]
+                self.show(a)
+        self.after(MONITOR_POLL_MS, self.poll)
+
+    def tick(self):
+        # Countdown and totals are local; no database work here
+        if not self.winfo_exists(): return
+        active = 0
+        for rid, a in self.attempts.items():
+            if a["status"] == "in_progress":
+                active += 1
+                self.tree.set(rid, "left", self.time_left(a))
+        submitted = sum(1 for a in self.attempts.values() if a["status"] == "completed")
+        self.summary_lbl.config(text=f"In progress: {active}   Submitted: {submitted}")
+        self.after(1000, self.tick)
+
 class StudentDashboard(tk.Frame):
     def __init__(self, parent, controller):
         super().__init__(parent)
@@ -816,16 +1231,12 @@ class StudentDashboard(tk.Frame):
 
     def on_show(self): self.load_exams(); self.load_hist()
     def load_exams(self):
-        self.lb_exams.delete(0, tk.END); self.display_exams = []
-        subs = self.controller.master_service.get_all_subjects()
-        for s in subs:
-            exams = self.controller.exam_service.get_exams_by_subject(s.subject_id)
-            for e in exams:
-                res = self.controller.result_service.get_student_history(self.controller.current_user.user_id)
-                completed_ids = [r.exam_id for r in res]
-                if e.exam_id not in completed_ids:
-                    self.display_exams.append(e)
-                    self.lb_exams.insert(tk.END, f"{s.subject_name} - {e.exam_name} ({e.duration}m)")
+        self.lb_exams.delete(0, tk.END)
+        # One query: the student's open exams (class assignments applied, completed ones left out)
+        self.display_exams = self.controller.exam_service.get_exams_for_student(self.controller.current_user.user_id)
+        for e in self.display_exams:
+            kind = f", adaptive, {e.test_length} questions" if e.exam_type == 'adaptive' else ""
+            self.lb_exams.insert(tk.END, f"{e.subject_name} - {e.exam_name} ({e.duration}m{kind})")
 
     def load_hist(self):
         self.lb_hist.delete(0, tk.END)
@@ -841,20 +1252,28 @@ class StudentDashboard(tk.Frame):
             self.load_exams()
             return
 
-        ExamWindow(self.controller, exam, state)
+        if exam.exam_type == 'adaptive': AdaptiveExamWindow(self.controller, exam, state)
+        else: ExamWindow(self.controller, exam, state)
 
     def view(self):
         if not self.lb_hist.curselection(): return
         ReviewWindow(self.controller, self.history[self.lb_hist.curselection()[0]].result_id)
 
+JOURNAL_SYNC_MS = 2000   # background replay of the local answer journal
+JOURNAL_RETRY_MS = 5000  # forced submit retry while the server is unreachable
+
 class ExamWindow(tk.Toplevel):
     def __init__(self, controller, exam, state):
         super().__init__()
         self.controller = controller
         self.exam = exam
         self.result_id = state["result_id"]
-        self.remaining = state["remaining_seconds"]
-        self.saved = state["saved_answers"]
+        # Server gives the time left until the stored deadline; count it down on the monotonic clock
+        self.countdown = Countdown(state["remaining_seconds"])
+        # Clicks go to a local journal first; answers a crash kept from the database win
+        self.journal = journal.open_journal(self.result_id, synced_seq=state.get("journal_seq", 0))
+        self.saved = {**state["saved_answers"], **self.journal.latest_answers()}
+        self.journal_sync = None  # in-flight sync Future
         
         self.title(f"Exam: {exam.exam_name}")
         self.state('zoomed') # Maximize
@@ -870,6 +1289,9 @@ class ExamWindow(tk.Toplevel):
         
         self.prog_lbl = tk.Label(header, text="0 / 0", font=("Arial", 14), bg="#EEE")
         self.prog_lbl.pack(side="right")
+
+        self.sync_lbl = tk.Label(header, text="", font=("Arial", 10), fg="#E65100", bg="#EEE")
+        self.sync_lbl.pack(side="right", padx=20)
         
         # Main Canvas Area
         self.canvas = tk.Canvas(self)
@@ -909,7 +1331,8 @@ class ExamWindow(tk.Toplevel):
             self.vars[q.question_id] = var
             
             def on_click(qid=q.question_id, v=var, fr=f):
-                self.controller.result_service.save_answer_progress(self.result_id, qid, v.get())
+                self.journal.append(qid, v.get())
+                self.sync_journal()
                 self.update_progress()
                 fr.config(bg="#E3F2FD") 
 
@@ -934,6 +1357,25 @@ class ExamWindow(tk.Toplevel):
         
         self.update_timer()
         self.update_progress()
+        self.sync_journal()
+        self.after(JOURNAL_SYNC_MS, self.poll_journal)
+
+    def sync_journal(self):
+        # One replay in flight at a time; anything clicked meanwhile goes with the next one
+        if self.journal_sync is not None and not self.journal_sync.done(): return
+        failed = self.journal_sync is not None and self.journal_sync.exception() is not None
+        self.sync_lbl.config(text="Saved on this computer - waiting for the server" if failed else "")
+        try:
+            self.journal_sync = self.controller.result_service.sync_answer_journal(self.journal, wait=False)
+        except Exception:
+            self.journal_sync = None
+            self.sync_lbl.config(text="Saved on this computer - waiting for the server")
+
+    def poll_journal(self):
+        if not self.winfo_exists(): return
+        self.journal.flush()
+        self.sync_journal()
+        self.after(JOURNAL_SYNC_MS, self.poll_journal)
 
     def on_frame_configure(self, event):
         self.canvas.configure(scrollregion=self.canvas.bbox("all"))
@@ -966,15 +1408,14 @@ class ExamWindow(tk.Toplevel):
         self.prog_lbl.config(text=f"Completed: {done} / {total}")
 
     def update_timer(self):
-        if self.remaining <= 0:
+        if self.countdown.expired():
             self.timer_lbl.config(text="Time's up!")
             self.submit(force=True)
             return
         
-        m, s = divmod(int(self.remaining), 60)
-        self.timer_lbl.config(text=f"{m:02d}:{s:02d}")
-        self.remaining -= 1
-        self.after(1000, self.update_timer)
+        text = self.countdown.display()
+        if text != self.timer_lbl.cget("text"): self.timer_lbl.config(text=text)
+        self.after(self.countdown.ms_until_next_tick(), self.update_timer)
 
     def submit(self, force=False):
         if not force:
@@ -982,8 +1423,127 @@ class ExamWindow(tk.Toplevel):
             total = len(self.exam.questions)
             if not messagebox.askyesno("Submit", f"You have answered {done}/{total} questions.\nFinish exam?"): return
             
+        try:
+            res = self.controller.result_service.finish_exam(self.result_id, self.exam, journal=self.journal)
+        except Exception:
+            # Nothing is lost: the journal still holds every answer
+            if force:
+                self.sync_lbl.config(text="Saved on this computer - submitting when the server is back")
+                self.after(JOURNAL_RETRY_MS, lambda: self.submit(force=True))
+            else:
+                messagebox.showerror("Submit", "Cannot reach the server. Your answers are saved on this computer.\nPlease try again.")
+            return
         self.unbind_all("<MouseWheel>")
-        res = self.controller.result_service.finish_exam(self.result_id, self.exam)
+        messagebox.showinfo("Done", f"Score: {res.score:.1f}")
+        self.destroy()
+
+class AdaptiveExamWindow(tk.Toplevel):
+    # One question at a time; the server picks the next one from each answer, so
+    # answers go straight to it (no local journal) and cannot be changed later
+    def __init__(self, controller, exam, state):
+        super().__init__()
+        self.controller = controller
+        self.exam = exam
+        self.result_id = state["result_id"]
+        self.countdown = Countdown(state["remaining_seconds"])
+        self.done = False
+
+        self.title(f"Exam: {exam.exam_name}")
+        self.state('zoomed')
+        self.bind("<Escape>", lambda e: self.attributes("-fullscreen", False))
+
+        header = tk.Frame(self, bg="#EEE", height=60, padx=20)
+        header.pack(fill="x")
+        tk.Label(header, text=f"{exam.exam_name}", font=("Arial", 16, "bold"), bg="#EEE").pack(side="left")
+        self.timer_lbl = tk.Label(header, text="--:--", font=("Arial", 16, "bold"), fg="red", bg="#EEE")
+        self.timer_lbl.pack(side="left", expand=True)
+        self.prog_lbl = tk.Label(header, text="0 / 0", font=("Arial", 14), bg="#EEE")
+        self.prog_lbl.pack(side="right")
+
+        self.body = tk.Frame(self, padx=50, pady=20)
+        self.body.pack(fill="both", expand=True)
+        bf = tk.Frame(self); bf.pack(pady=20)
+        self.next_btn = tk.Button(bf, text="NEXT", command=self.next, bg="#2196F3", fg="white", font=("Arial", 14, "bold"), pady=10, width=20)
+        self.next_btn.pack(side="left", padx=10)
+        tk.Button(bf, text="FINISH & SUBMIT", command=self.submit, bg="#4CAF50", fg="white", font=("Arial", 14, "bold"), pady=10, width=20).pack(side="left", padx=10)
+
+        self.bind("<Control-c>", lambda e: "break")
+        self.bind("<Control-v>", lambda e: "break")
+        self.bind("<Control-x>", lambda e: "break")
+        self.bind("<Control-a>", lambda e: "break")
+        self.bind("<Button-3>", lambda e: "break")
+        self.violation_count = 0
+        self.bind("<FocusOut>", self.on_focus_loss)
+
+        self.show(self.controller.result_service.adaptive_state(self.result_id, exam))
+        self.update_timer()
+
+    def show(self, st):
+        for w in self.body.winfo_children(): w.destroy()
+        self.question = st["question"]
+        self.answered = st["answered"]
+        self.prog_lbl.config(text=f"Completed: {st['answered']} / {st['test_length']}")
+        if self.question is None:
+            self.next_btn.config(state="disabled")
+            tk.Label(self.body, text="All questions answered. Press FINISH & SUBMIT.", font=("Arial", 14)).pack(pady=40)
+            return
+        f = tk.LabelFrame(self.body, text=f"Question {st['answered'] + 1}", font=("Arial", 12, "bold"), padx=10, pady=10)
+        f.pack(fill="x", pady=15)
+        tk.Label(f, text=self.question.content, font=("Arial", 14), wraplength=800, justify="left").pack(anchor="w", pady=(0, 10))
+        self.var = tk.StringVar(value="none")
+        for opt in ('a','b','c','d'):
+            txt = getattr(self.question, 'option_'+opt)
+            tk.Radiobutton(f, text=f"{opt.upper()}. {txt}", variable=self.var, value=opt, font=("Arial", 12)).pack(anchor="w", padx=20, pady=2)
+
+    def next(self):
+        if self.question is None: return
+        if self.var.get() == "none": return messagebox.showwarning("Answer", "Choose an answer first.\nAnswers cannot be changed later.")
+        self.next_btn.config(state="disabled")
+        try:
+            st = self.controller.result_service.answer_adaptive(self.result_id, self.exam, self.question.question_id, self.var.get())
+        except Exception:
+            messagebox.showerror("Network", "Cannot reach the server. Please try again.")
+            self.next_btn.config(state="normal")
+            return
+        self.next_btn.config(state="normal")
+        self.show(st)
+
+    def on_focus_loss(self, event):
+        if self.attributes("-fullscreen"):
+             self.violation_count += 1
+             left = 3 - self.violation_count
+             if left <= 0:
+                 messagebox.showerror("Violation", "You have switched windows too many times.\nExam will be submitted automatically.")
+                 self.submit(force=True)
+             else:
+                 messagebox.showwarning("Warning", f"Do not switch windows during the exam!\nViolations: {self.violation_count}/3\nRemaining chances: {left}")
+                 self.focus_force()
+
+    def update_timer(self):
+        if self.done: return
+        if self.countdown.expired():
+            self.timer_lbl.config(text="Time's up!")
+            self.submit(force=True)
+            return
+        text = self.countdown.display()
+        if text != self.timer_lbl.cget("text"): self.timer_lbl.config(text=text)
+        self.after(self.countdown.ms_until_next_tick(), self.update_timer)
+
+    def submit(self, force=False):
+        if self.done: return
+        if not force and self.question is not None:
+            if not messagebox.askyesno("Submit", f"You have answered {self.answered}/{self.exam.test_length} questions.\n"
+                                                 "Unanswered questions lower the score.\nFinish exam?"): return
+        try:
+            res = self.controller.result_service.finish_exam(self.result_id, self.exam)
+        except Exception:
+            if force:
+                # Graded by the expiry sweeper from the answers already sent if the server stays away
+                self.after(JOURNAL_RETRY_MS, lambda: self.submit(force=True))
+            else:
+                messagebox.showerror("Submit", "Cannot reach the server. Please try again.")
+            return
+        self.done = True
         messagebox.showinfo("Done", f"Score: {res.score:.1f}")
         self.destroy()
 
@@ -1011,7 +1571,9 @@ class ReviewWindow(tk.Toplevel):
 
         for idx, detail in enumerate(result.details):
             color = "#C8E6C9" if detail.is_correct else "#FFCDD2"
-            f = tk.LabelFrame(scrollable_frame, text=f"Q{idx+1}: {detail.question_content}", bg=color, font=("Arial", 11, "bold"))
+            # Adaptive attempts: the ability estimate after each answer
+            ability = f"  [ability {detail.ability:+.2f} ± {detail.ability_se:.2f}]" if detail.ability is not None else ""
+            f = tk.LabelFrame(scrollable_frame, text=f"Q{idx+1}: {detail.question_content}{ability}", bg=color, font=("Arial", 11, "bold"))
             f.pack(fill="x", padx=5, pady=10)
             
             ops = detail.options
@@ -1073,8 +1635,16 @@ class EditExamWindow(tk.Toplevel):
         self.set_picker(self.start_picker, exam.start_date)
         self.set_picker(self.end_picker, exam.end_date)
         
+        # Adaptive exams have no question list, just a length
+        self.adaptive = exam.exam_type == 'adaptive'
+        if self.adaptive:
+            tk.Label(tf, text="Questions per student:").pack(side="left", padx=10)
+            self.en_len = tk.Entry(tf, width=5, font=("Arial", 11)); self.en_len.pack(side="left")
+            self.en_len.insert(0, str(exam.test_length or ""))
+
         # Questions
-        qf = tk.Frame(self, padx=10, pady=10); qf.pack(fill="both", expand=True)
+        qf = tk.Frame(self, padx=10, pady=10)
+        if not self.adaptive: qf.pack(fill="both", expand=True)
         
         # Pool (Left)
         lf = tk.LabelFrame(qf, text=f"Available Questions ({exam.subject_name})"); lf.pack(side="left", fill="both", expand=True)
@@ -1097,15 +1667,13 @@ class EditExamWindow(tk.Toplevel):
         tk.Button(self, text="SAVE CHANGES", command=self.save, bg="#4CAF50", fg="white", font=BTN_FONT, pady=10).pack(pady=10)
         
         # Init Lists
-        self.s_list = exam.questions # Already active
-        self.p_list = []
-        if self.subject:
+        self.p_model, self.s_model = ListModel(), ListModel()
+        self.p_view, self.s_view = ListboxBinding(self.lb_pool, self.p_model), ListboxBinding(self.lb_sel, self.s_model)
+        self.s_model.reset(exam.questions or []) # Already active
+        if self.subject and not self.adaptive:
             all_qs = self.controller.master_service.get_questions_by_subject(self.subject.subject_id)
             # Filter out already selected
-            sel_ids = [q.question_id for q in self.s_list]
-            self.p_list = [q for q in all_qs if q.question_id not in sel_ids]
-            
-        self.refresh_lists()
+            self.p_model.reset(q for q in all_qs if q.question_id not in self.s_model)
         
     def set_picker(self, picker, dt_str):
         if not dt_str: return
@@ -1120,22 +1688,13 @@ class EditExamWindow(tk.Toplevel):
             picker.minute_var.set(f"{dt.minute:02d}")
         except: pass
 
-    def refresh_lists(self):
-        self.lb_pool.delete(0, tk.END); self.lb_sel.delete(0, tk.END)
-        for q in self.p_list: self.lb_pool.insert(tk.END, q.content)
-        for q in self.s_list: self.lb_sel.insert(tk.END, q.content)
-
     def add_q(self):
-        ids = self.lb_pool.curselection()
-        to_move = [self.p_list[i] for i in ids]
-        for i in reversed(ids): del self.p_list[i]
-        self.s_list.extend(to_move); self.refresh_lists()
+        self.p_view.sync_selection()
+        self.s_model.extend(self.p_model.take_selected())
 
     def rem_q(self):
-        ids = self.lb_sel.curselection()
-        to_move = [self.s_list[i] for i in ids]
-        for i in reversed(ids): del self.s_list[i]
-        self.p_list.extend(to_move); self.refresh_lists()
+        self.s_view.sync_selection()
+        self.p_model.extend(self.s_model.take_selected())
 
     def save(self):
         name = self.en_name.get().strip()
@@ -1143,7 +1702,9 @@ class EditExamWindow(tk.Toplevel):
         
         if not name: messagebox.showwarning("Val", "Name required"); return
         if not dur.isdigit() or int(dur) <= 0: messagebox.showwarning("Val", "Duration > 0"); return
-        if not self.s_list: messagebox.showwarning("Val", "Select > 0 questions"); return
+        length = self.en_len.get().strip() if self.adaptive else None
+        if self.adaptive and (not length.isdigit() or int(length) <= 0): messagebox.showwarning("Val", "Questions per student > 0"); return
+        if not self.adaptive and not len(self.s_model): messagebox.showwarning("Val", "Select > 0 questions"); return
         
         sd = self.start_picker.get_datetime_str()
         ed = self.end_picker.get_datetime_str()
@@ -1151,7 +1712,8 @@ class EditExamWindow(tk.Toplevel):
         
         try:
             self.controller.exam_service.update_exam(
-                self.exam.exam_id, name, int(dur), self.s_list, sd, ed
+                self.exam.exam_id, name, int(dur), self.s_model.items(), sd, ed,
+                test_length=int(length) if length else None
             )
             
             # Auto-Reopen Logic
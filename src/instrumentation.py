@@ -0,0 +1,224 @@
+import functools
+import json
+import os
+import threading
+import time
+import types
+from contextlib import contextmanager
+from typing import Dict, List
+
+# Opt-in call metrics for the service classes. Classes are only registered by
+# @instrumented; their methods are wrapped when enable() is called and restored
+# by disable(), so a disabled build runs the original functions untouched.
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registered: List[type] = []
+_originals: Dict[type, Dict[str, object]] = {}
+_stats: Dict[str, "MethodStats"] = {}
+_lock = threading.Lock()
+_local = threading.local()
+_enabled = False
+
+
+class MethodStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.rows_returned = 0
+        self.sql_statements = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # last slot is +Inf
+
+    def observe(self, seconds: float, rows: int, sql: int, failed: bool):
+        self.calls += 1
+        self.errors += failed
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.rows_returned += rows
+        self.sql_statements += sql
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+    def to_dict(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "total_seconds": self.total_seconds,
+            "mean_seconds": self.total_seconds / self.calls if self.calls else 0.0,
+            "max_seconds": self.max_seconds,
+            "rows_returned": self.rows_returned,
+            "sql_statements": self.sql_statements,
+            "histogram": {str(b): n for b, n in zip(list(LATENCY_BUCKETS) + ["+Inf"], self.buckets)},
+        }
+
+
+def _row_count(value) -> int:
+    if isinstance(value, (list, tuple, set, dict)):
+        return len(value)
+    return 0
+
+
+def _call_stack() -> list:
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def current_method() -> str:
+    stack = getattr(_local, "stack", None)
+    return stack[-1][0] if stack else None
+
+
+def capture(origin: str = None) -> tuple:
+    # The calls this thread is inside, for work it hands to another thread (the writer queue)
+    return list(getattr(_local, "stack", ())), origin
+
+
+@contextmanager
+def attributed(context: tuple):
+    # Runs the block on this thread as if inside the captured calls: its SQL counts
+    # against them, and querylog tags it with their method (or the captured origin)
+    saved = getattr(_local, "stack", None), getattr(_local, "origin", None)
+    _local.stack, _local.origin = context
+    try:
+        yield
+    finally:
+        _local.stack, _local.origin = saved
+
+
+def current_origin() -> str:
+    return getattr(_local, "origin", None)
+
+
+def record_sql(statement: str):
+    # sqlite3 trace callback: counts each statement against every active call on this thread
+    for frame in getattr(_local, "stack", ()):
+        frame[1] += 1
+
+
+def _wrap(name: str, fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        stack = _call_stack()
+        frame = [name, 0]
+        stack.append(frame)
+        failed = False
+        result = None
+        t0 = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+            return result
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - t0
+            stack.pop()
+            with _lock:
+                stats = _stats.get(name)
+                if stats is None:
+                    stats = _stats[name] = MethodStats(name)
+                stats.observe(elapsed, _row_count(result), frame[1], failed)
+    wrapper.__instrumented__ = True
+    return wrapper
+
+
+def _patch(cls: type):
+    if cls in _originals: return
+    originals = {}
+    for attr, value in list(vars(cls).items()):
+        if attr.startswith("__") or not isinstance(value, types.FunctionType): continue
+        originals[attr] = value
+        setattr(cls, attr, _wrap(f"{cls.__name__}.{attr}", value))
+    _originals[cls] = originals
+
+
+def _unpatch(cls: type):
+    for attr, value in _originals.pop(cls, {}).items():
+        setattr(cls, attr, value)
+
+
+def instrumented(cls: type) -> type:
+    _registered.append(cls)
+    if _enabled: _patch(cls)
+    return cls
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def enable():
+    global _enabled
+    with _lock:
+        _enabled = True
+        for cls in _registered: _patch(cls)
+
+
+def disable():
+    global _enabled
+    with _lock:
+        _enabled = False
+        for cls in _registered: _unpatch(cls)
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+
+def snapshot() -> Dict[str, Dict]:
+    with _lock:
+        return {name: s.to_dict() for name, s in sorted(_stats.items())}
+
+
+def to_json(indent: int = 2) -> str:
+    return json.dumps({"enabled": _enabled, "methods": snapshot()}, indent=indent)
+
+
+def to_prometheus() -> str:
+    with _lock:
+        stats = sorted(_stats.items())
+        lines = [
+            "# HELP quiz_service_calls_total Service method calls.",
+            "# TYPE quiz_service_calls_total counter",
+        ]
+        lines += [f'quiz_service_calls_total{{method="{n}"}} {s.calls}' for n, s in stats]
+        lines += ["# HELP quiz_service_errors_total Service method calls that raised.",
+                  "# TYPE quiz_service_errors_total counter"]
+        lines += [f'quiz_service_errors_total{{method="{n}"}} {s.errors}' for n, s in stats]
+        lines += ["# HELP quiz_service_rows_returned_total Items in returned lists/dicts.",
+                  "# TYPE quiz_service_rows_returned_total counter"]
+        lines += [f'quiz_service_rows_returned_total{{method="{n}"}} {s.rows_returned}' for n, s in stats]
+        lines += ["# HELP quiz_service_sql_statements_total SQL statements issued during the call.",
+                  "# TYPE quiz_service_sql_statements_total counter"]
+        lines += [f'quiz_service_sql_statements_total{{method="{n}"}} {s.sql_statements}' for n, s in stats]
+        lines += ["# HELP quiz_service_latency_seconds Service method latency.",
+                  "# TYPE quiz_service_latency_seconds histogram"]
+        for n, s in stats:
+            cumulative = 0
+            for bound, count in zip(list(LATENCY_BUCKETS) + ["+Inf"], s.buckets):
+                cumulative += count
+                lines.append(f'quiz_service_latency_seconds_bucket{{method="{n}",le="{bound}"}} {cumulative}')
+            lines.append(f'quiz_service_latency_seconds_sum{{method="{n}"}} {s.total_seconds}')
+            lines.append(f'quiz_service_latency_seconds_count{{method="{n}"}} {s.calls}')
+    return "\n".join(lines) + "\n"
+
+
+def dump(path: str):
+    # .prom / .txt -> Prometheus text format, anything else -> JSON
+    text = to_prometheus() if path.endswith((".prom", ".txt")) else to_json()
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+if os.environ.get("QUIZ_INSTRUMENT") == "1":
+    enable()
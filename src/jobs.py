@@ -0,0 +1,153 @@
+import os
+import threading
+import time
+from typing import Callable, Optional, Tuple
+
+
+class BackgroundJob:
+    # Runs fn(*args, progress=job.report_progress, **kwargs) on a daemon thread.
+    # progress() returns False once the job is cancelled so fn can stop between batches.
+    def __init__(self, fn: Callable, *args, name: str = None,
+                 on_progress: Callable[[int, int], None] = None, **kwargs):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.name = name or getattr(fn, "__name__", "job")
+        self.on_progress = on_progress
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.started_at = None
+        self.finished_at = None
+        self._done = 0
+        self._total = 0
+        self._cancel = threading.Event()
+        self._finished = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+
+    def start(self) -> "BackgroundJob":
+        self.started_at = time.time()
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            self.result = self.fn(*self.args, progress=self.report_progress, **self.kwargs)
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.finished_at = time.time()
+            self._finished.set()
+
+    def report_progress(self, done: int, total: int) -> bool:
+        self._done, self._total = done, total
+        if self.on_progress:
+            try: self.on_progress(done, total)
+            except Exception: pass
+        return not self._cancel.is_set()
+
+    @property
+    def progress(self) -> Tuple[int, int]:
+        return self._done, self._total
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def is_running(self) -> bool:
+        return self._thread.is_alive()
+
+    def wait(self, timeout: float = None):
+        if not self._finished.wait(timeout):
+            raise TimeoutError(f"Job '{self.name}' still running")
+        if self.error:
+            raise self.error
+        return self.result
+
+
+class PeriodicJob:
+    # Calls fn() every `interval` seconds on a daemon thread until stop().
+    def __init__(self, interval: float, fn: Callable, name: str = None, run_immediately: bool = True):
+        self.interval = interval
+        self.fn = fn
+        self.name = name or getattr(fn, "__name__", "periodic")
+        self.run_immediately = run_immediately
+        self.runs = 0
+        self.errors = 0
+        self.last_run = None
+        self.last_result = None
+        self.last_error: Optional[BaseException] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+
+    def start(self) -> "PeriodicJob":
+        self._thread.start()
+        return self
+
+    def _loop(self):
+        if not self.run_immediately and self._stop.wait(self.interval):
+            return
+        while not self._stop.is_set():
+            self.run_once()
+            if self._stop.wait(self.interval):
+                break
+
+    def run_once(self):
+        self.last_run = time.time()
+        try:
+            self.last_result = self.fn()
+        except Exception as e:
+            self.errors += 1
+            self.last_error = e
+        self.runs += 1
+        return self.last_result
+
+    def stop(self, timeout: float = None):
+        self._stop.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def is_running(self) -> bool:
+        return self._thread.is_alive()
+
+
+class ProcessLock:
+    # Non-blocking exclusive lock on a file, held until release() or process exit.
+    # Used so that only one of several clients sharing a database runs the
+    # background jobs; the OS drops the lock when its holder dies.
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def acquire(self) -> bool:
+        if self._file is not None: return True
+        f = open(self.path, "a+b")
+        try:
+            if os.name == "nt":
+                import msvcrt
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._file = f
+        return True
+
+    def release(self):
+        f, self._file = self._file, None
+        if f is None: return
+        try:
+            if os.name == "nt":
+                import msvcrt
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        finally:
+            f.close()
@@ -0,0 +1,139 @@
+import json
+import os
+import threading
+import time
+import zlib
+from typing import Dict, List, Tuple
+
+import database
+
+# Crash-safe local record of a student's answer clicks. Every click is appended
+# to a per-attempt file on the local disk before anything touches the
+# database, so a slow or briefly unreachable database (e.g. on a network
+# share) never loses an answer. Lines are "seq<TAB>question_id<TAB>answer<TAB>crc";
+# a torn last line from a crash fails its CRC and is dropped on reopen.
+#
+# fsync is batched: after FSYNC_EVERY records or FSYNC_INTERVAL seconds,
+# whichever comes first (flush() forces one). Each write reaches the OS
+# immediately, so only a power loss can cost the last unsynced batch.
+#
+# ResultService.sync_answer_journal() replays records with a sequence number
+# above the one stored in answer_journal_sync for the attempt, in the same
+# transaction that advances it, so replays can be repeated safely. That number
+# is per attempt, not per file: a journal opened for an attempt that already
+# synced elsewhere (another machine, a cleared journal directory) must be given
+# it as synced_seq, so its new records are numbered above it.
+
+FSYNC_EVERY = 16
+FSYNC_INTERVAL = 0.5
+
+Record = Tuple[int, int, str]  # (seq, question_id, answer)
+
+
+def journal_dir() -> str:
+    return os.environ.get("QUIZ_JOURNAL_DIR") or os.path.join(os.path.expanduser("~"), ".quiz_app", "journal")
+
+
+def _line(seq: int, question_id: int, answer: str) -> bytes:
+    body = f"{seq}\t{question_id}\t{json.dumps(answer)}"
+    return f"{body}\t{zlib.crc32(body.encode('utf-8')):08x}\n".encode("utf-8")
+
+
+class AnswerJournal:
+    def __init__(self, path: str, result_id: int, fsync_every: int = FSYNC_EVERY, fsync_interval: float = FSYNC_INTERVAL,
+                 synced_seq: int = 0):
+        self.path = path
+        self.result_id = result_id
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.records: List[Record] = self._recover()
+        self.seq = max(self.records[-1][0] if self.records else 0, synced_seq)
+        self.synced_seq = synced_seq  # highest seq known to be in the database
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        self._last_fsync = time.monotonic()
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o600)
+
+    def _recover(self) -> List[Record]:
+        # Reads every intact record; cuts a torn or corrupt tail so new appends start on a clean line
+        records, good = [], 0
+        if not os.path.exists(self.path): return records
+        with open(self.path, "rb") as f:
+            data = f.read()
+        for raw in data.split(b"\n")[:-1]:
+            try:
+                body, crc = raw.decode("utf-8").rsplit("\t", 1)
+                if int(crc, 16) != zlib.crc32(body.encode("utf-8")): break
+                seq, qid, answer = body.split("\t", 2)
+                records.append((int(seq), int(qid), json.loads(answer)))
+            except ValueError:
+                break
+            good += len(raw) + 1
+        if good < len(data):
+            with open(self.path, "r+b") as f:
+                f.truncate(good)
+        return records
+
+    def append(self, question_id: int, answer: str) -> int:
+        with self._lock:
+            self.seq += 1
+            os.write(self._fd, _line(self.seq, question_id, answer))
+            self.records.append((self.seq, question_id, answer))
+            self._unsynced += 1
+            if self._unsynced >= self.fsync_every or time.monotonic() - self._last_fsync >= self.fsync_interval:
+                self._fsync()
+            return self.seq
+
+    def _fsync(self):
+        os.fsync(self._fd)
+        self._unsynced = 0
+        self._last_fsync = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            if self._unsynced: self._fsync()
+
+    def pending(self) -> List[Record]:
+        with self._lock:
+            return [r for r in self.records if r[0] > self.synced_seq]
+
+    def mark_synced(self, seq: int):
+        with self._lock:
+            self.synced_seq = max(self.synced_seq, seq)
+
+    def latest_answers(self) -> Dict[int, str]:
+        with self._lock:
+            return {qid: answer for _, qid, answer in self.records}
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                if self._unsynced: self._fsync()
+                os.close(self._fd)
+                self._fd = None
+
+    def discard(self):
+        # The attempt is graded: the journal has nothing left to protect
+        self.close()
+        if os.path.exists(self.path): os.remove(self.path)
+
+
+def journal_path(result_id: int, directory: str = None) -> str:
+    # One file per attempt and database (result ids repeat across databases)
+    db_key = zlib.crc32(database.current_storage().name.encode("utf-8"))
+    return os.path.join(directory or journal_dir(), f"{db_key:08x}-{result_id}.journal")
+
+
+def open_journal(result_id: int, directory: str = None, **kwargs) -> AnswerJournal:
+    path = journal_path(result_id, directory)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return AnswerJournal(path, result_id, **kwargs)
+
+
+def journal_attempts(directory: str = None) -> List[int]:
+    # Attempts of the current database with a journal on this machine
+    directory = directory or journal_dir()
+    prefix = journal_path(0, directory).rsplit("-", 1)[0] + "-"
+    if not os.path.isdir(directory): return []
+    names = (os.path.join(directory, n) for n in os.listdir(directory) if n.endswith(".journal"))
+    return sorted(int(p[len(prefix):-len(".journal")]) for p in names if p.startswith(prefix))
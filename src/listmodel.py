@@ -0,0 +1,159 @@
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Sequence, Set, Tuple
+
+# Ordered item list for the question pickers. Membership, positions and the
+# selection live in dict/set indexes, and every change is published as a small
+# delta ("delete" a range, "insert" a run) so a bound widget only touches the
+# rows that changed instead of being cleared and refilled. No Tk imports here;
+# ListboxBinding adapts a model to anything with the Listbox insert/delete API.
+
+SMALL_MOVE = 32  # up to this many keys, removal works in place without the position index
+
+
+class ListModel:
+    def __init__(self, key: Callable = lambda item: item.question_id):
+        self.key = key
+        self._keys: List[Hashable] = []
+        self._items: Dict[Hashable, object] = {}
+        self._pos: Optional[Dict[Hashable, int]] = {}  # rebuilt lazily after deletes
+        self.selected: Set[Hashable] = set()
+        self._listeners: List[Callable] = []
+
+    def subscribe(self, fn: Callable):
+        # fn(op, index, payload): ("reset", 0, None), ("delete", first, last), ("insert", index, [items])
+        self._listeners.append(fn)
+
+    def _emit(self, op, index, payload):
+        for fn in self._listeners: fn(op, index, payload)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __iter__(self):
+        items = self._items
+        return (items[k] for k in self._keys)
+
+    def items(self) -> List:
+        items = self._items
+        return [items[k] for k in self._keys]
+
+    def keys(self) -> List[Hashable]:
+        return list(self._keys)
+
+    def get(self, key):
+        return self._items.get(key)
+
+    def at(self, index: int):
+        return self._items[self._keys[index]]
+
+    def index_of(self, key) -> int:
+        if self._pos is None:
+            self._pos = {k: i for i, k in enumerate(self._keys)}
+        return self._pos[key]
+
+    def reset(self, items: Iterable):
+        self._items = {}
+        for item in items:
+            self._items.setdefault(self.key(item), item)  # duplicates keep their first position
+        self._keys = list(self._items)
+        self._pos = None
+        self.selected.clear()
+        self._emit("reset", 0, None)
+
+    def extend(self, items: Iterable) -> List:
+        added = []
+        for item in items:
+            k = self.key(item)
+            if k in self._items: continue
+            self._items[k] = item
+            added.append(item)
+        if added:
+            start = len(self._keys)
+            self._keys.extend(self.key(item) for item in added)
+            if self._pos is not None:
+                for i, item in enumerate(added, start): self._pos[self.key(item)] = i
+            self._emit("insert", start, added)
+        return added
+
+    def remove_keys(self, keys: Iterable[Hashable]) -> List:
+        # Removes the given keys; returns the removed items in display order
+        doomed = {k for k in keys if k in self._items}
+        if not doomed: return []
+        if self._pos is None and len(doomed) <= SMALL_MOVE:
+            positions = sorted(map(self._keys.index, doomed))  # C-level scans beat rebuilding the index
+        else:
+            positions = sorted(self.index_of(k) for k in doomed)
+        removed = [self._items.pop(self._keys[i]) for i in positions]
+        if len(doomed) <= SMALL_MOVE:
+            for i in reversed(positions): del self._keys[i]
+        else:
+            self._keys = [k for k in self._keys if k not in doomed]
+        self._pos = None
+        self.selected -= doomed
+        # Contiguous runs, last first, so earlier indexes stay valid for the widget
+        runs: List[Tuple[int, int]] = []
+        for p in positions:
+            if runs and runs[-1][1] == p - 1: runs[-1] = (runs[-1][0], p)
+            else: runs.append((p, p))
+        for first, last in reversed(runs):
+            self._emit("delete", first, last)
+        return removed
+
+    def take_selected(self) -> List:
+        return self.remove_keys(list(self.selected))
+
+    def select_indexes(self, indexes: Sequence[int]):
+        keys = self._keys
+        self.selected = {keys[i] for i in indexes if 0 <= i < len(keys)}
+
+
+class ListboxBinding:
+    # Keeps a Listbox (or anything with insert/delete/after/curselection) in step
+    # with a ListModel. Large resets render progressively in chunks scheduled
+    # with after(), so a 50k-row pool paints its first screen immediately.
+    def __init__(self, listbox, model: ListModel, text: Callable = lambda item: item.content,
+                 chunk: int = 1000, track_selection: bool = True):
+        self.listbox = listbox
+        self.model = model
+        self.text = text
+        self.chunk = chunk
+        self.rendered = 0
+        self._job = None
+        model.subscribe(self._on_change)
+        if track_selection and hasattr(listbox, "bind"):
+            listbox.bind("<<ListboxSelect>>", lambda e: self.sync_selection())
+
+    def sync_selection(self):
+        self.model.select_indexes(self.listbox.curselection())
+
+    def _on_change(self, op, index, payload):
+        if op == "reset":
+            self.cancel()
+            self.listbox.delete(0, "end")
+            self.rendered = 0
+            self._render_more()
+        elif op == "delete":
+            first, last = index, payload
+            if first < self.rendered:
+                self.listbox.delete(first, min(last, self.rendered - 1))
+                self.rendered -= min(last, self.rendered - 1) - first + 1
+        elif op == "insert" and index <= self.rendered:
+            # Past the rendered prefix the pending chunks pick new rows up
+            self.listbox.insert(index, *[self.text(item) for item in payload])
+            self.rendered += len(payload)
+
+    def _render_more(self):
+        self._job = None
+        end = min(len(self.model), self.rendered + self.chunk)
+        if end > self.rendered:
+            self.listbox.insert("end", *[self.text(self.model.at(i)) for i in range(self.rendered, end)])
+            self.rendered = end
+        if self.rendered < len(self.model):
+            self._job = self.listbox.after(1, self._render_more)
+
+    def cancel(self):
+        if self._job is not None:
+            self.listbox.after_cancel(self._job)
+            self._job = None
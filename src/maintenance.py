@@ -0,0 +1,221 @@
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+import changelog
+import database
+from jobs import PeriodicJob
+
+# Background upkeep for the WAL database. Each tick looks at the -wal size and
+# at PRAGMA data_version (bumped by commits from any other connection); once no
+# write has been seen for `idle_seconds` it checkpoints, and an oversized WAL
+# gets a TRUNCATE checkpoint so the file shrinks back. Bulk imports ask for an
+# ANALYZE on the next idle tick, and free pages left by large deletes are
+# returned to the filesystem with incremental_vacuum. The change feed is
+# compacted on an idle tick every COMPACT_EVERY seconds.
+
+WAL_TRUNCATE_BYTES = 64 * 1024 * 1024  # above this an idle checkpoint also truncates the -wal file
+WAL_FORCE_BYTES = 256 * 1024 * 1024    # above this a PASSIVE checkpoint runs even while busy
+VACUUM_MIN_BYTES = 8 * 1024 * 1024     # free pages worth reclaiming
+VACUUM_STEP_PAGES = 1024               # pages per incremental_vacuum call
+OPTIMIZE_EVERY = 6 * 3600              # seconds between routine PRAGMA optimize runs
+CHECKPOINT_BUSY_MS = 1000              # how long a checkpoint may wait for readers
+COMPACT_EVERY = 3600                   # seconds between change feed compactions
+
+_lock = threading.Lock()
+_pending_analyze = False
+_metrics: Dict[str, float] = {
+    "ticks": 0,
+    "writes_observed": 0,
+    "wal_bytes": 0,
+    "checkpoints_passive": 0,
+    "checkpoints_truncate": 0,
+    "checkpoints_busy": 0,
+    "checkpoint_frames": 0,
+    "checkpoint_seconds_total": 0.0,
+    "checkpoint_seconds_max": 0.0,
+    "wal_bytes_reclaimed": 0,
+    "analyze_runs": 0,
+    "optimize_runs": 0,
+    "vacuum_runs": 0,
+    "vacuum_pages_reclaimed": 0,
+    "vacuum_bytes_reclaimed": 0,
+    "changelog_compactions": 0,
+    "changelog_rows_compacted": 0,
+}
+
+
+def note_bulk_change():
+    # Called after bulk imports/regrades: statistics are refreshed on the next idle tick
+    global _pending_analyze
+    _pending_analyze = True
+
+
+def metrics() -> Dict[str, float]:
+    with _lock:
+        return dict(_metrics)
+
+
+def _count(**values):
+    with _lock:
+        for name, value in values.items():
+            _metrics[name] += value
+
+
+def _wal_size() -> int:
+    storage = database.current_storage()
+    if storage.path is None: return 0
+    path = storage.path + "-wal"
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def checkpoint(conn, mode: str = "PASSIVE") -> Dict:
+    wal_before = _wal_size()
+    t0 = time.perf_counter()
+    busy, log_frames, done_frames = conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+    elapsed = time.perf_counter() - t0
+    reclaimed = max(0, wal_before - _wal_size())
+    with _lock:
+        _metrics["checkpoints_" + mode.lower()] += 1
+        _metrics["checkpoints_busy"] += busy
+        _metrics["checkpoint_frames"] += max(done_frames, 0)
+        _metrics["checkpoint_seconds_total"] += elapsed
+        _metrics["checkpoint_seconds_max"] = max(_metrics["checkpoint_seconds_max"], elapsed)
+        _metrics["wal_bytes_reclaimed"] += reclaimed
+    return {"mode": mode, "busy": bool(busy), "log_frames": log_frames, "checkpointed_frames": done_frames,
+            "seconds": elapsed, "wal_bytes_reclaimed": reclaimed}
+
+
+def analyze(conn):
+    # analysis_limit keeps ANALYZE to a sample per index on large tables
+    conn.execute("PRAGMA analysis_limit = 1000")
+    conn.execute("ANALYZE")
+    conn.commit()
+    _count(analyze_runs=1)
+
+
+def optimize(conn):
+    conn.execute("PRAGMA optimize")
+    _count(optimize_runs=1)
+
+
+def incremental_vacuum(conn, min_bytes: int = VACUUM_MIN_BYTES, max_pages: int = None) -> int:
+    # Returns bytes given back to the filesystem; no-op unless auto_vacuum=INCREMENTAL
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2: return 0
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    if free * page_size < min_bytes: return 0
+    pages = free if max_pages is None else min(free, max_pages)
+    done = 0
+    while done < pages:
+        step = min(VACUUM_STEP_PAGES, pages - done)
+        # execute() would step the pragma once and free a single page; executescript runs it to completion
+        conn.executescript(f"PRAGMA incremental_vacuum({step});")
+        done += step
+    reclaimed = free - conn.execute("PRAGMA freelist_count").fetchone()[0]
+    _count(vacuum_runs=1, vacuum_pages_reclaimed=reclaimed, vacuum_bytes_reclaimed=reclaimed * page_size)
+    return reclaimed * page_size
+
+
+def compact_changelog() -> Dict:
+    stats = changelog.compact()
+    _count(changelog_compactions=1, changelog_rows_compacted=stats["superseded"] + stats["tombstones"])
+    return stats
+
+
+def _connect():
+    conn = database.get_connection()
+    conn.execute(f"PRAGMA busy_timeout = {CHECKPOINT_BUSY_MS}")
+    return conn
+
+
+def run_pending(conn=None) -> Dict:
+    # One-shot pass for scripts and the CLI: checkpoint, then any queued ANALYZE and vacuum
+    global _pending_analyze
+    own = conn is None
+    conn = conn or _connect()
+    try:
+        done = {"changelog": compact_changelog()}
+        done["checkpoint"] = checkpoint(conn, "TRUNCATE")
+        if _pending_analyze:
+            _pending_analyze = False
+            analyze(conn)
+            done["analyze"] = True
+        done["vacuum_bytes_reclaimed"] = incremental_vacuum(conn)
+        optimize(conn)
+        return done
+    finally:
+        if own: conn.close()
+
+
+class MaintenanceScheduler:
+    def __init__(self, interval: float = 30, idle_seconds: float = 10,
+                 wal_truncate_bytes: int = WAL_TRUNCATE_BYTES, wal_force_bytes: int = WAL_FORCE_BYTES):
+        self.interval = interval
+        self.idle_seconds = idle_seconds
+        self.wal_truncate_bytes = wal_truncate_bytes
+        self.wal_force_bytes = wal_force_bytes
+        self.last_write = time.monotonic()
+        self.last_optimize = time.monotonic()
+        self.last_compact = time.monotonic()
+        self._data_version: Optional[int] = None
+        self._dirty = True  # writes since the last complete checkpoint
+        self._conn = None
+        self.job: Optional[PeriodicJob] = None
+
+    def start(self) -> "MaintenanceScheduler":
+        self.job = PeriodicJob(self.interval, self.tick, name="db-maintenance", run_immediately=False).start()
+        return self
+
+    def stop(self):
+        if self.job: self.job.stop()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def tick(self) -> Dict:
+        global _pending_analyze
+        if self._conn is None: self._conn = _connect()
+        conn, now = self._conn, time.monotonic()
+        actions = {}
+
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if self._data_version is not None and version != self._data_version:
+            self.last_write = now
+            self._dirty = True
+            _count(writes_observed=1)
+        self._data_version = version
+        wal = _wal_size()
+        with _lock:
+            _metrics["ticks"] += 1
+            _metrics["wal_bytes"] = wal
+
+        idle = now - self.last_write >= self.idle_seconds
+        if idle and now - self.last_compact >= COMPACT_EVERY:
+            # Before the checkpoint, so the deletes are checkpointed with everything else
+            actions["changelog"] = compact_changelog()
+            self.last_compact = now
+        if idle and wal and (self._dirty or wal >= self.wal_truncate_bytes):
+            actions["checkpoint"] = checkpoint(conn, "TRUNCATE" if wal >= self.wal_truncate_bytes else "PASSIVE")
+        elif wal >= self.wal_force_bytes:
+            # PASSIVE never waits on readers or writers, so it is safe mid-exam
+            actions["checkpoint"] = checkpoint(conn, "PASSIVE")
+        if "checkpoint" in actions and not actions["checkpoint"]["busy"]:
+            self._dirty = actions["checkpoint"]["checkpointed_frames"] < actions["checkpoint"]["log_frames"]
+        if idle and _pending_analyze:
+            _pending_analyze = False
+            analyze(conn)
+            actions["analyze"] = True
+        if idle:
+            reclaimed = incremental_vacuum(conn, max_pages=VACUUM_STEP_PAGES * 8)
+            if reclaimed: actions["vacuum_bytes_reclaimed"] = reclaimed
+            if now - self.last_optimize >= OPTIMIZE_EVERY:
+                optimize(conn)
+                self.last_optimize = now
+                actions["optimize"] = True
+        return actions
+
+
+def start_scheduler(interval: float = 30, idle_seconds: float = 10) -> MaintenanceScheduler:
+    return MaintenanceScheduler(interval, idle_seconds).start()
@@ -33,6 +33,26 @@ class Subject:
         return self.subject_name
 
 
+class StudentClass:
+    def __init__(self, class_id: int, class_name: str, member_count: int = 0):
+        self.class_id = class_id
+        self.class_name = class_name
+        self.member_count = member_count
+
+    def __str__(self):
+        return self.class_name
+
+
+class Tag:
+    def __init__(self, tag_id: int, tag_name: str, question_count: int = 0):
+        self.tag_id = tag_id
+        self.tag_name = tag_name
+        self.question_count = question_count
+
+    def __str__(self):
+        return self.tag_name
+
+
 class Question:
     def __init__(self, question_id: int, subject_id: int, content: str, 
                  option_a: str, option_b: str, option_c: str, option_d: str, 
@@ -53,7 +73,8 @@ class Question:
 
 class Exam:
     def __init__(self, exam_id: int, subject_id: int, exam_name: str, duration: int, created_by: int, 
-                 start_date: str = None, end_date: str = None, status: str = 'draft'):
+                 start_date: str = None, end_date: str = None, status: str = 'draft',
+                 exam_type: str = 'fixed', test_length: int = None):
         self.exam_id = exam_id
         self.subject_id = subject_id
         self.exam_name = exam_name
@@ -62,6 +83,8 @@ class Exam:
         self.start_date = start_date
         self.end_date = end_date
         self.status = status
+        self.exam_type = exam_type  # 'fixed', or 'adaptive': questions picked per student, test_length of them
+        self.test_length = test_length
         self.questions: List[Question] = [] # Can satisfy ExamDetails logic by ordering this list
 
     def add_question(self, question: Question):
@@ -72,12 +95,15 @@ class Exam:
 
 
 class ResultDetail:
-    def __init__(self, result_detail_id: int, result_id: int, question_id: int, selected_answer: str, is_correct: bool):
+    def __init__(self, result_detail_id: int, result_id: int, question_id: int, selected_answer: str, is_correct: bool,
+                 ability: float = None, ability_se: float = None):
         self.result_detail_id = result_detail_id
         self.result_id = result_id
         self.question_id = question_id
         self.selected_answer = selected_answer
         self.is_correct = is_correct
+        self.ability = ability  # adaptive exams: estimate after this answer
+        self.ability_se = ability_se
 
 
 class Result:
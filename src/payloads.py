@@ -0,0 +1,67 @@
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import database
+from models import Question
+
+# What a student receives when an exam opens: its questions in exam order.
+# Built once per exam and shared by every student, so a room of students
+# starting together costs one query instead of one per student. The pre-warm
+# job (ResultService.prewarm_exam) fills it before the start time. Entries are
+# dropped when the exam or any question changes; treat the tuples as
+# read-only.
+
+ExamPayload = Tuple[Question, ...]
+
+
+def compile_exam_payloads(cursor, exam_ids: Sequence[int]) -> Dict[int, ExamPayload]:
+    # One query for any number of exams; order matches the compiled answer key
+    if not exam_ids: return {}
+    placeholders = ",".join("?" * len(exam_ids))
+    cursor.execute(f"""
+        SELECT ed.exam_id, q.question_id, q.subject_id, q.content, q.option_a, q.option_b, q.option_c, q.option_d,
+               q.correct_answer, q.difficulty_level
+        FROM exam_details ed
+        JOIN questions q ON q.question_id = ed.question_id
+        WHERE ed.exam_id IN ({placeholders})
+        ORDER BY ed.exam_id, ed.exam_detail_id
+    """, list(exam_ids))
+    payloads: Dict[int, List[Question]] = {exam_id: [] for exam_id in exam_ids}
+    for r in cursor.fetchall():
+        payloads[r[0]].append(Question(r[1], r[2], r[3], r[4], r[5], r[6], r[7], r[8], r[9]))
+    return {exam_id: tuple(qs) for exam_id, qs in payloads.items()}
+
+
+class ExamPayloadCache:
+    # Keyed by storage as well, like grading.AnswerKeyCache
+    def __init__(self):
+        self._payloads: Dict[Tuple[str, int], ExamPayload] = {}
+        self._lock = threading.Lock()
+
+    def get(self, exam_id: int) -> Optional[ExamPayload]:
+        return self._payloads.get((database.current_storage().name, exam_id))
+
+    def put(self, exam_id: int, payload: ExamPayload):
+        with self._lock:
+            self._payloads[(database.current_storage().name, exam_id)] = payload
+
+    def invalidate(self, exam_id: int = None):
+        # One exam, or every exam of the active storage (a question changed)
+        name = database.current_storage().name
+        with self._lock:
+            if exam_id is not None:
+                self._payloads.pop((name, exam_id), None)
+            else:
+                for key in [k for k in self._payloads if k[0] == name]: del self._payloads[key]
+
+
+exam_payloads = ExamPayloadCache()
+
+
+def get_exam_payloads(cursor, exam_ids: Sequence[int]) -> Dict[int, ExamPayload]:
+    found = {exam_id: exam_payloads.get(exam_id) for exam_id in exam_ids}
+    missing = [exam_id for exam_id, payload in found.items() if payload is None]
+    for exam_id, payload in compile_exam_payloads(cursor, missing).items():
+        exam_payloads.put(exam_id, payload)
+        found[exam_id] = payload
+    return found
@@ -0,0 +1,247 @@
+import collections
+import re
+import sqlite3
+import sys
+import threading
+import time
+from typing import Dict, List
+
+import instrumentation
+
+# Slow-query log. When enabled, database.get_connection builds connections from
+# TracedConnection: every statement is timed from execute() through its fetches,
+# tagged with the calling service method, and aggregated by normalized text.
+# Statements over the threshold are kept with their EXPLAIN QUERY PLAN.
+
+PROGRESS_INTERVAL = 1000  # VM instructions between progress-handler ticks
+
+_enabled = False
+_threshold = 0.1
+_explain = True
+_lock = threading.Lock()
+_slow = collections.deque(maxlen=500)
+_totals: Dict[str, List] = {}  # normalized sql -> [count, total_seconds, max_seconds, vm_ticks]
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE = re.compile(r"\s+")
+
+
+def normalize(sql: str) -> str:
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _IN_LIST.sub("(?, ...)", sql)
+    return _SPACE.sub(" ", sql).strip()
+
+
+def caller(skip=()) -> str:
+    # First frame outside the database plumbing (and `skip` modules), e.g. "services.ResultService.finish_exam"
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get("__name__")
+        if module not in (__name__, "database", "sqlite3") and module not in skip:
+            return f"{module}.{frame.f_code.co_qualname}"
+        frame = frame.f_back
+    return "?"
+
+
+def _caller() -> str:
+    # Writer operations run on the writer thread with their submitter's method/origin restored
+    return instrumentation.current_method() or instrumentation.current_origin() or caller()
+
+
+class _Statement:
+    __slots__ = ("sql", "params", "caller", "seconds", "vm_ticks", "traced")
+
+    def __init__(self, sql, params):
+        self.sql = sql
+        self.params = params
+        self.caller = _caller()
+        self.seconds = 0.0
+        self.vm_ticks = 0
+        self.traced = 0
+
+
+class TracedCursor(sqlite3.Cursor):
+    _stmt = None
+
+    def _begin(self, sql, params):
+        self._finish()
+        self._stmt = _Statement(sql, params)
+        self.connection._active = self._stmt
+
+    def _finish(self):
+        stmt, self._stmt = self._stmt, None
+        if stmt is not None: self.connection._record(stmt)
+
+    def _timed(self, fn, *args):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            if self._stmt is not None: self._stmt.seconds += time.perf_counter() - t0
+
+    def execute(self, sql, params=()):
+        self._begin(sql, params)
+        return self._timed(super().execute, sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        self._begin(sql, seq_of_params[0] if seq_of_params else ())
+        return self._timed(super().executemany, sql, seq_of_params)
+
+    def executescript(self, script):
+        self._begin(script, None)
+        return self._timed(super().executescript, script)
+
+    def fetchone(self):
+        return self._timed(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed(super().fetchmany, size if size is not None else self.arraysize)
+
+    def fetchall(self):
+        return self._timed(super().fetchall)
+
+    def close(self):
+        self._finish()
+        super().close()
+
+
+class TracedConnection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._active = None
+        self._cursors = []
+        self.set_trace_callback(self._on_trace)
+        self.set_progress_handler(self._on_progress, PROGRESS_INTERVAL)
+
+    def _on_trace(self, statement):
+        if self._active is not None: self._active.traced += 1
+        if instrumentation.is_enabled(): instrumentation.record_sql(statement)
+
+    def _on_progress(self):
+        if self._active is not None: self._active.vm_ticks += 1
+        return 0
+
+    def cursor(self, factory=TracedCursor):
+        cur = super().cursor(factory)
+        if isinstance(cur, TracedCursor): self._cursors.append(cur)
+        return cur
+
+    # The C implementations bypass cursor(); route them through a traced cursor
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+    def executescript(self, script):
+        return self.cursor().executescript(script)
+
+    def _flush(self):
+        for cur in self._cursors: cur._finish()
+        self._cursors = []
+        self._active = None
+
+    def _record(self, stmt: _Statement):
+        if self._active is stmt: self._active = None
+        plan = None
+        if stmt.seconds >= _threshold and _explain and stmt.params is not None:
+            plan = self._query_plan(stmt.sql, stmt.params)
+        _observe(stmt, plan)
+
+    def _query_plan(self, sql, params):
+        try:
+            cur = sqlite3.Cursor(self)
+            cur.execute("EXPLAIN QUERY PLAN " + sql, params)
+            return [r[3] for r in cur.fetchall()]
+        except sqlite3.Error:
+            return None
+
+    def commit(self):
+        self._flush()
+        super().commit()
+
+    def rollback(self):
+        self._flush()
+        super().rollback()
+
+    def close(self):
+        self._flush()
+        super().close()
+
+
+def _observe(stmt: _Statement, plan):
+    key = normalize(stmt.sql)
+    with _lock:
+        agg = _totals.get(key)
+        if agg is None:
+            agg = _totals[key] = [0, 0.0, 0.0, 0]
+        agg[0] += 1
+        agg[1] += stmt.seconds
+        agg[2] = max(agg[2], stmt.seconds)
+        agg[3] += stmt.vm_ticks
+        if stmt.seconds >= _threshold:
+            _slow.append({
+                "statement": key,
+                "seconds": stmt.seconds,
+                "caller": stmt.caller,
+                "vm_instructions": stmt.vm_ticks * PROGRESS_INTERVAL,
+                "sqlite_statements": stmt.traced,  # incl. implicit BEGIN and trigger bodies
+                "query_plan": plan,
+                "at": time.time(),
+            })
+
+
+def enable(threshold_ms: float = 100, explain: bool = True, max_entries: int = 500):
+    global _enabled, _threshold, _explain, _slow
+    with _lock:
+        _threshold = threshold_ms / 1000.0
+        _explain = explain
+        if _slow.maxlen != max_entries: _slow = collections.deque(_slow, maxlen=max_entries)
+        _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def reset():
+    with _lock:
+        _slow.clear()
+        _totals.clear()
+
+
+def slow_queries() -> List[Dict]:
+    with _lock:
+        return list(_slow)
+
+
+def top_statements(n: int = 10) -> List[Dict]:
+    with _lock:
+        items = sorted(_totals.items(), key=lambda kv: kv[1][1], reverse=True)[:n]
+    return [{"statement": sql, "count": c, "total_seconds": total, "mean_seconds": total / c,
+             "max_seconds": mx, "vm_instructions": ticks * PROGRESS_INTERVAL}
+            for sql, (c, total, mx, ticks) in items]
+
+
+def report(n: int = 10) -> str:
+    lines = [f"Top {n} statements by total time:"]
+    for i, s in enumerate(top_statements(n), 1):
+        lines.append(f"{i:3d}. {s['total_seconds'] * 1000:9.1f} ms total  {s['count']:6d} calls  "
+                     f"{s['mean_seconds'] * 1000:7.2f} ms avg  {s['max_seconds'] * 1000:7.2f} ms max")
+        lines.append(f"     {s['statement'][:160]}")
+    slow = slow_queries()
+    lines.append(f"\nSlow statements (>= {_threshold * 1000:g} ms): {len(slow)}")
+    for q in slow[-n:]:
+        lines.append(f"  {q['seconds'] * 1000:8.1f} ms  {q['caller']}  {q['statement'][:120]}")
+        for step in q["query_plan"] or []:
+            lines.append(f"      plan: {step}")
+    return "\n".join(lines)
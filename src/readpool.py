@@ -0,0 +1,222 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import database
+import querylog
+import shards
+from jobs import PeriodicJob
+
+# Read-only connections for admin views, reports and exports, kept apart from
+# the exam write path. They are opened with query_only, a large page cache and
+# mmap, and are reused from a small pool, so report scans neither share a
+# connection with student writes nor evict their cache.
+#
+# Snapshot mode (start_snapshots(); the GUI turns it on when
+# QUIZ_REPORT_SNAPSHOT=<seconds> is set) points the stale_ok readers at a copy
+# of the database refreshed through the backup API instead of the live file,
+# so a long scan does not hold the WAL open either. Those results lag by up to
+# one refresh; live readers are unaffected. Shard files (see shards.py) are
+# always read live.
+
+POOL_SIZE = 4                   # idle connections kept per source
+CACHE_KIB = 64 * 1024           # PRAGMA cache_size per connection
+MMAP_BYTES = 256 * 1024 * 1024  # PRAGMA mmap_size per connection
+SNAPSHOT_INTERVAL = float(os.environ.get("QUIZ_REPORT_SNAPSHOT") or 0)  # 0 = live reads only
+
+
+class _Lease:
+    # Stands in for the connection; close() hands it back to the pool instead
+    def __init__(self, pool: "ReadPool", conn: sqlite3.Connection, source: str):
+        self._pool = pool
+        self._conn = conn
+        self.source = source
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._conn is not None:
+            self._pool._release(self._conn, self.source)
+            self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ReadPool:
+    def __init__(self, storage=None, size: int = POOL_SIZE, cache_kib: int = CACHE_KIB, mmap_bytes: int = MMAP_BYTES):
+        self.storage = storage or database.current_storage()
+        self.live = self.storage.name  # source key for live connections
+        self.shard_generation = shards.generation
+        self.size = size
+        self.cache_kib = cache_kib
+        self.mmap_bytes = mmap_bytes
+        self.snapshot: Optional[str] = None  # current snapshot file in snapshot mode
+        self.job: Optional[PeriodicJob] = None
+        self._idle: List[Tuple[str, sqlite3.Connection]] = []
+        self._leased: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._metrics = {
+            "leases": 0,
+            "snapshot_leases": 0,
+            "connections_opened": 0,
+            "snapshot_refreshes": 0,
+            "snapshot_refreshes_skipped": 0,
+            "snapshot_refresh_seconds_max": 0.0,
+        }
+
+    def _open(self, source: str) -> sqlite3.Connection:
+        if source == self.live:
+            conn = database.get_connection(self.storage)
+        else:
+            conn = sqlite3.connect(f"file:{source}?mode=ro", uri=True, check_same_thread=False)
+            shards.attach(conn, self.live)
+        conn.execute("PRAGMA query_only = ON")
+        conn.execute(f"PRAGMA cache_size = -{self.cache_kib}")
+        conn.execute(f"PRAGMA mmap_size = {self.mmap_bytes}")
+        with self._lock: self._metrics["connections_opened"] += 1
+        return conn
+
+    def acquire(self, stale_ok: bool = False) -> _Lease:
+        with self._lock:
+            source = self.snapshot if stale_ok and self.snapshot else self.live
+            conn = None
+            for i in range(len(self._idle) - 1, -1, -1):
+                if self._idle[i][0] == source:
+                    conn = self._idle.pop(i)[1]
+                    break
+            self._leased[source] = self._leased.get(source, 0) + 1
+            self._metrics["leases"] += 1
+            if source != self.live: self._metrics["snapshot_leases"] += 1
+        if conn is None:
+            try:
+                conn = self._open(source)
+            except Exception:
+                with self._lock: self._leased[source] -= 1
+                raise
+        return _Lease(self, conn, source)
+
+    def _release(self, conn: sqlite3.Connection, source: str):
+        if conn.in_transaction: conn.rollback()
+        # Pooled readers never commit or close: record their statements now
+        if isinstance(conn, querylog.TracedConnection): conn._flush()
+        with self._lock:
+            self._leased[source] -= 1
+            current = source == self.live or source == self.snapshot
+            if current and sum(1 for s, _ in self._idle if s == source) < self.size:
+                self._idle.append((source, conn))
+                return
+        conn.close()
+
+    def _snapshot_paths(self) -> Tuple[str, str]:
+        stem = os.path.splitext(self.storage.path)[0]
+        return f"{stem}.reporting-a.db", f"{stem}.reporting-b.db"
+
+    def refresh_snapshot(self) -> Optional[str]:
+        # Writes the file not currently served, then switches readers to it.
+        # A file still leased by a long report is left alone until the next tick.
+        import backup
+        with self._refresh_lock:
+            a, b = self._snapshot_paths()
+            target = b if self.snapshot == a else a
+            with self._lock:
+                if self._leased.get(target):
+                    self._metrics["snapshot_refreshes_skipped"] += 1
+                    return self.snapshot
+                self._drop_idle(target)
+            t0 = time.perf_counter()
+            with database.use_storage(self.storage):
+                backup.create_snapshot(dest=target)
+            elapsed = time.perf_counter() - t0
+            with self._lock:
+                self.snapshot = target
+                m = self._metrics
+                m["snapshot_refreshes"] += 1
+                m["snapshot_refresh_seconds_max"] = max(m["snapshot_refresh_seconds_max"], elapsed)
+            return target
+
+    def _drop_idle(self, source: str):
+        keep = []
+        for s, conn in self._idle:
+            if s == source: conn.close()
+            else: keep.append((s, conn))
+        self._idle = keep
+
+    def start_snapshots(self, interval: float) -> "ReadPool":
+        if self.storage.path is None: return self  # in-memory storage: nothing to copy to
+        if self.job is None:
+            self.job = PeriodicJob(interval, self.refresh_snapshot, name="report-snapshot").start()
+        return self
+
+    def drain(self):
+        # Idle connections are closed and the snapshot dropped (stale_ok reads go live until
+        # the next refresh); leased connections are closed when they come back
+        with self._lock:
+            self.snapshot = None
+            for _, conn in self._idle: conn.close()
+            self._idle = []
+
+    def close(self):
+        if self.job: self.job.stop()
+        self.job = None
+        self.drain()
+
+    def metrics(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._metrics)
+            stats["idle"] = len(self._idle)
+            stats["leased"] = sum(self._leased.values())
+        stats["snapshot"] = self.snapshot
+        return stats
+
+
+_pools: Dict[str, ReadPool] = {}
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ReadPool:
+    # Same lifecycle as writer.get_writer: one pool per storage, rebuilt when the shard layout changes
+    storage = database.current_storage()
+    with _pool_lock:
+        pool = _pools.get(storage.name)
+        if pool is None or pool.shard_generation != shards.generation:
+            interval = pool.job.interval if pool is not None and pool.job else 0
+            if pool is not None: pool.close()
+            pool = _pools[storage.name] = ReadPool(storage)
+            if interval: pool.start_snapshots(interval)
+        return pool
+
+
+def connection(stale_ok: bool = False) -> _Lease:
+    # stale_ok: the caller accepts data up to one snapshot refresh old (reports, exports)
+    return get_pool().acquire(stale_ok)
+
+
+def start_snapshots(interval: float = 300) -> ReadPool:
+    return get_pool().start_snapshots(interval)
+
+
+def drain():
+    pool = _pools.get(database.current_storage().name)
+    if pool is not None: pool.drain()
+
+
+def metrics() -> Dict[str, float]:
+    pool = _pools.get(database.current_storage().name)
+    return pool.metrics() if pool is not None else {}
+
+
+def shutdown(storage=None):
+    # Closes the pool of one storage, or all of them
+    with _pool_lock:
+        names = [storage.name] if storage is not None else list(_pools)
+        for name in names:
+            pool = _pools.pop(name, None)
+            if pool is not None: pool.close()
@@ -0,0 +1,231 @@
+import csv
+import gzip
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import database
+import readpool
+import shards
+
+# Bulk CSV report engine. Every report streams rows straight from an SQLite
+# cursor to the file (fetchmany batches), so memory stays flat regardless of the
+# number of results. Independent reports fan out across a process pool, each
+# worker with its own connection.
+
+FETCH_SIZE = 1000
+KINDS = ("exam", "matrix", "subject", "student")
+
+
+def _open(path: str, compress: bool):
+    if compress:
+        return gzip.open(path, "wt", newline="", encoding="utf-8")
+    return open(path, "w", newline="", encoding="utf-8")
+
+
+def _stream(cursor, sql: str, params=()):
+    cursor.execute(sql, params)
+    while True:
+        rows = cursor.fetchmany(FETCH_SIZE)
+        if not rows: return
+        yield from rows
+
+
+def _slug(text: str) -> str:
+    return re.sub(r"[^\w]+", "_", text or "").strip("_")[:40] or "report"
+
+
+def write_exam_report(cursor, exam_id: int, out) -> int:
+    cursor.execute("SELECT exam_name FROM exams WHERE exam_id = ?", (exam_id,))
+    row = cursor.fetchone()
+    if not row: raise ValueError(f"Exam {exam_id} not found")
+    cursor.execute(f"""
+        SELECT COUNT(*), AVG(score), MAX(score), MIN(score)
+        FROM {shards.results()} WHERE exam_id = ? AND status = 'completed'
+    """, (exam_id,))
+    total, avg, high, low = cursor.fetchone()
+
+    writer = csv.writer(out)
+    writer.writerow(["Exam Report", row[0]])
+    writer.writerow(["Total Participants", total])
+    writer.writerow(["Average Score", f"{avg:.2f}" if avg is not None else "0"])
+    writer.writerow(["Highest Score", f"{high:.1f}" if high is not None else "0"])
+    writer.writerow(["Lowest Score", f"{low:.1f}" if low is not None else "0"])
+    writer.writerow([])
+    writer.writerow(["#", "Student Name", "Score", "Submission Time"])
+    count = 0
+    for count, r in enumerate(_stream(cursor, f"""
+        SELECT u.full_name, r.score, r.submit_time
+        FROM {shards.results()} r JOIN users u ON u.user_id = r.student_id
+        WHERE r.exam_id = ? AND r.status = 'completed'
+        ORDER BY r.submit_time DESC
+    """, (exam_id,)), 1):
+        writer.writerow([count, r[0], r[1], r[2]])
+    return count
+
+
+def write_answer_matrix(cursor, exam_id: int, out) -> int:
+    # One row per attempt, one (answer, correct) column pair per question in exam order
+    cursor.execute("SELECT question_id FROM exam_details WHERE exam_id = ? ORDER BY exam_detail_id", (exam_id,))
+    qids = [r[0] for r in cursor.fetchall()]
+    position = {qid: i for i, qid in enumerate(qids)}
+    writer = csv.writer(out)
+    header = ["Result ID", "Student ID", "Student Name", "Score"]
+    for i, qid in enumerate(qids, 1):
+        header += [f"Q{i} ({qid})", f"Q{i} correct"]
+    writer.writerow(header)
+
+    count = 0
+    current, row = None, None
+    for rid, sid, name, score, qid, answer, ok in _stream(cursor, f"""
+        SELECT a.result_id, a.student_id, u.full_name, a.score, a.question_id, a.selected_answer, a.is_correct
+        FROM {shards.answers()} a
+        JOIN users u ON u.user_id = a.student_id
+        WHERE a.exam_id = ? AND a.status = 'completed' AND a.question_id IS NOT NULL
+        ORDER BY a.result_id
+    """, (exam_id,)):
+        if rid != current:
+            if row is not None:
+                writer.writerow(row)
+                count += 1
+            current = rid
+            row = [rid, sid, name, score] + [""] * (2 * len(qids))
+        pos = position.get(qid)
+        if pos is not None:
+            row[4 + 2 * pos] = answer or ""
+            row[5 + 2 * pos] = int(ok or 0)
+    if row is not None:
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+def write_subject_report(cursor, subject_id: int, out) -> int:
+    writer = csv.writer(out)
+    writer.writerow(["Exam ID", "Exam", "Participants", "Average Score", "Highest Score", "Lowest Score"])
+    for r in _stream(cursor, f"""
+        SELECT e.exam_id, e.exam_name, COUNT(r.result_id), AVG(r.score), MAX(r.score), MIN(r.score)
+        FROM exams e
+        LEFT JOIN {shards.results()} r ON r.exam_id = e.exam_id AND r.status = 'completed'
+        WHERE e.subject_id = ?
+        GROUP BY e.exam_id ORDER BY e.exam_id
+    """, (subject_id,)):
+        writer.writerow(r)
+    writer.writerow([])
+    writer.writerow(["Student ID", "Student Name", "Exam", "Score", "Submission Time"])
+    count = 0
+    for count, r in enumerate(_stream(cursor, f"""
+        SELECT u.user_id, u.full_name, e.exam_name, r.score, r.submit_time
+        FROM exams e
+        JOIN {shards.results()} r ON r.exam_id = e.exam_id AND r.status = 'completed'
+        JOIN users u ON u.user_id = r.student_id
+        WHERE e.subject_id = ?
+        ORDER BY u.full_name, r.submit_time
+    """, (subject_id,)), 1):
+        writer.writerow(r)
+    return count
+
+
+def write_student_report(cursor, student_id: int, out) -> int:
+    writer = csv.writer(out)
+    writer.writerow(["Subject", "Exam", "Score", "Correct", "Questions", "Submission Time"])
+    count = 0
+    for count, r in enumerate(_stream(cursor, f"""
+        SELECT s.subject_name, e.exam_name, r.score,
+               (SELECT COALESCE(SUM(is_correct), 0) FROM {shards.details()} rd WHERE rd.result_id = r.result_id),
+               (SELECT COUNT(*) FROM {shards.details()} rd WHERE rd.result_id = r.result_id),
+               r.submit_time
+        FROM {shards.results()} r
+        JOIN exams e ON e.exam_id = r.exam_id
+        JOIN subjects s ON s.subject_id = e.subject_id
+        WHERE r.student_id = ? AND r.status = 'completed'
+        ORDER BY r.submit_time
+    """, (student_id,)), 1):
+        writer.writerow(r)
+    return count
+
+
+WRITERS = {
+    "exam": write_exam_report,
+    "matrix": write_answer_matrix,
+    "subject": write_subject_report,
+    "student": write_student_report,
+}
+
+# (kind, key, output path, gzip)
+ReportJob = Tuple[str, int, str, bool]
+
+
+def run_job(job: ReportJob, db_path: str = None) -> Tuple[str, int]:
+    kind, key, path, compress = job
+    if db_path: database.DB_NAME = db_path  # process-pool workers start with the default path
+    conn = readpool.connection(stale_ok=True)
+    try:
+        with _open(path, compress) as out:
+            rows = WRITERS[kind](conn.cursor(), key, out)
+    finally:
+        conn.close()
+    return path, rows
+
+
+def plan_reports(out_dir: str, kinds: Sequence[str] = KINDS, exam_ids: Sequence[int] = None,
+                 compress: bool = False) -> List[ReportJob]:
+    # Without exam_ids: every exam, subject and student that has results
+    suffix = ".csv.gz" if compress else ".csv"
+    jobs: List[ReportJob] = []
+    conn = readpool.connection(stale_ok=True)
+    try:
+        cursor = conn.cursor()
+        if exam_ids:
+            placeholders = ",".join("?" * len(exam_ids))
+            exams = cursor.execute(f"SELECT exam_id, exam_name, subject_id FROM exams WHERE exam_id IN ({placeholders})", list(exam_ids)).fetchall()
+        else:
+            exams = cursor.execute("SELECT exam_id, exam_name, subject_id FROM exams ORDER BY exam_id").fetchall()
+        subject_ids = sorted({e[2] for e in exams})
+        subjects = dict(cursor.execute("SELECT subject_id, subject_name FROM subjects").fetchall())
+        students = []
+        if "student" in kinds and exams:
+            placeholders = ",".join("?" * len(exams))
+            students = cursor.execute(f"""
+                SELECT DISTINCT u.user_id, u.username FROM {shards.results()} r JOIN users u ON u.user_id = r.student_id
+                WHERE r.status = 'completed' AND r.exam_id IN ({placeholders}) ORDER BY u.user_id
+            """, [e[0] for e in exams]).fetchall()
+    finally:
+        conn.close()
+
+    for exam_id, name, _ in exams:
+        if "exam" in kinds:
+            jobs.append(("exam", exam_id, os.path.join(out_dir, f"exam_{exam_id}_{_slug(name)}{suffix}"), compress))
+        if "matrix" in kinds:
+            jobs.append(("matrix", exam_id, os.path.join(out_dir, f"matrix_{exam_id}_{_slug(name)}{suffix}"), compress))
+    if "subject" in kinds:
+        for sid in subject_ids:
+            jobs.append(("subject", sid, os.path.join(out_dir, f"subject_{sid}_{_slug(subjects.get(sid))}{suffix}"), compress))
+    for uid, username in students:
+        jobs.append(("student", uid, os.path.join(out_dir, f"student_{uid}_{_slug(username)}{suffix}"), compress))
+    return jobs
+
+
+def generate(jobs: Sequence[ReportJob], workers: int = None,
+             progress: Optional[Callable[[int, int], object]] = None) -> List[Tuple[str, int]]:
+    # workers=1 runs in-process; otherwise one connection per spawned worker process
+    done: List[Tuple[str, int]] = []
+    for path in {os.path.dirname(j[2]) for j in jobs}:
+        if path: os.makedirs(path, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    db_path = database.current_storage().path
+    if workers <= 1 or len(jobs) <= 1 or db_path is None:  # an in-memory database is not visible to other processes
+        for job in jobs:
+            done.append(run_job(job))
+            if progress: progress(len(done), len(jobs))
+        return done
+    # Spawned, not forked: a forked worker would inherit this process's pooled
+    # connections (and the threads using them); each worker opens its own
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [pool.submit(run_job, job, db_path) for job in jobs]
+        for future in as_completed(futures):
+            done.append(future.result())
+            if progress: progress(len(done), len(jobs))
+    return done
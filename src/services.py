@@ -1,12 +1,84 @@
 from datetime import datetime, timedelta
 from typing import List, Optional, Dict
+import functools
+import inspect
 import re
 import csv
 import io
 import random
+import sqlite3
+from itertools import groupby
+import database
 from database import get_connection
-from models import User, Admin, Student, Subject, Question, Exam, Result, ResultDetail
+from models import User, Admin, Student, StudentClass, Subject, Tag, Question, Exam, Result, ResultDetail
+from grading import ANSWER_MATCH_SQL, SCORE_SQL, answer_keys, compile_answer_key, compile_sheet_key, get_answer_key
+from payloads import exam_payloads, get_exam_payloads
+from blueprint import Section, parse_blueprint, parse_tags, question_indexes, seen_question_ids
+import adaptive
+from adaptive import item_banks
+from jobs import BackgroundJob, PeriodicJob
+import writer
+import readpool
+import shards
+import dedup
+import maintenance
+from instrumentation import instrumented
 
+def _bound(fn):
+    if inspect.isgeneratorfunction(fn):
+        @functools.wraps(fn)
+        def gen_wrapper(self, *args, **kwargs):
+            if self.storage is None:
+                yield from fn(self, *args, **kwargs)
+                return
+            # Re-enter the storage for every step instead of leaking it to the consumer between items
+            it = fn(self, *args, **kwargs)
+            while True:
+                with database.use_storage(self.storage):
+                    try: item = next(it)
+                    except StopIteration: return
+                yield item
+        return gen_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        if self.storage is None: return fn(self, *args, **kwargs)
+        with database.use_storage(self.storage):
+            return fn(self, *args, **kwargs)
+    return wrapper
+
+def bind_storage(cls: type) -> type:
+    # Services take an optional storage (storage.FileStorage / MemoryStorage);
+    # every method then runs with it active, so get_connection(), the writer
+    # queue, the read pool and the answer-key cache all use that database.
+    # Without one they follow database.DB_NAME as before.
+    for attr, value in list(vars(cls).items()):
+        if attr.startswith("__") or not inspect.isfunction(value): continue
+        setattr(cls, attr, _bound(value))
+
+    def __init__(self, storage=None):
+        self.storage = storage
+    cls.__init__ = __init__
+    return cls
+
+def _drop_unstarted_attempts(conn, where: str, params: tuple) -> int:
+    # Deletes pre-warmed attempts nobody started (status 'not_started') matching `where` (alias r, joined to exams e)
+    dropped = 0
+    for schema in shards.writable_schemas():
+        ids = [r[0] for r in conn.execute(f"""
+            SELECT r.result_id FROM {schema}.results r JOIN exams e ON e.exam_id = r.exam_id
+            WHERE r.status = 'not_started' AND {where}
+        """, params).fetchall()]
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            conn.execute(f"DELETE FROM {schema}.result_details WHERE result_id IN ({placeholders})", chunk)
+            conn.execute(f"DELETE FROM {schema}.results WHERE result_id IN ({placeholders})", chunk)
+        dropped += len(ids)
+    return dropped
+
+@instrumented
+@bind_storage
 class UserService:
     def _validate_password(self, password: str, confirm_password: str = None) -> str:
         if confirm_password is not None and password != confirm_password:
@@ -22,30 +94,31 @@ class UserService:
         if val_error:
             raise ValueError(val_error)
             
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        try:
+        def insert(cursor):
             cursor.execute("INSERT INTO users (username, password_hash, full_name, dob, role) VALUES (?, ?, ?, ?, ?)",
                            (username, password, full_name, dob, 'student'))
-            user_id = cursor.lastrowid
-            conn.commit()
+            return cursor.lastrowid
+
+        try:
+            user_id = writer.run(insert)
             return Student(user_id, username, password, full_name, dob)
         except Exception as e:
-            conn.rollback()
             if "UNIQUE constraint failed" in str(e):
                 raise ValueError("Username already exists")
             raise e
-        finally:
-            conn.close()
 
     def change_password(self, user_id, new_pass):
         val_error = self._validate_password(new_pass)
         if val_error: raise ValueError(val_error)
+        writer.run(lambda cursor: cursor.execute("UPDATE users SET password_hash = ? WHERE user_id = ?", (new_pass, user_id)))
+
+    def get_all_students(self) -> List[Student]:
         conn = get_connection()
-        conn.execute("UPDATE users SET password_hash = ? WHERE user_id = ?", (new_pass, user_id))
-        conn.commit()
+        cursor = conn.cursor()
+        cursor.execute("SELECT user_id, username, password_hash, full_name, dob FROM users WHERE role = 'student' ORDER BY full_name")
+        rows = cursor.fetchall()
         conn.close()
+        return [Student(r[0], r[1], r[2], r[3], r[4]) for r in rows]
 
     def login(self, username, password) -> Optional[User]:
         conn = get_connection()
@@ -64,6 +137,23 @@ class UserService:
                     return Student(row[0], row[1], row[2], row[3], row[4])
         return None
 
+# is_correct of a result_details row by grading.ANSWER_MATCH_SQL (0 once the question is gone)
+_DETAIL_IS_CORRECT_SQL = f"""COALESCE((
+    SELECT {ANSWER_MATCH_SQL.format(selected="result_details.selected_answer", correct="q.correct_answer")}
+    FROM questions q WHERE q.question_id = result_details.question_id
+), 0)"""
+
+
+def _set_question_tags(cursor, question_id: int, names: List[str]):
+    # Replaces the question's tags; unknown tag names are created
+    cursor.execute("DELETE FROM question_tags WHERE question_id = ?", (question_id,))
+    for name in names:
+        cursor.execute("INSERT OR IGNORE INTO tags (tag_name) VALUES (?)", (name,))
+        cursor.execute("INSERT OR IGNORE INTO question_tags (tag_id, question_id) SELECT tag_id, ? FROM tags WHERE tag_name = ?",
+                       (question_id, name))
+
+@instrumented
+@bind_storage
 class MasterDataService:
     def get_all_subjects(self) -> List[Subject]:
         conn = get_connection()
@@ -74,26 +164,10 @@ class MasterDataService:
         return [Subject(r[0], r[1]) for r in rows]
 
     def add_subject(self, name: str):
-        conn = get_connection()
-        try:
-            conn.execute("INSERT INTO subjects (subject_name) VALUES (?)", (name,))
-            conn.commit()
-        except Exception as e:
-            conn.rollback()
-            raise e
-        finally:
-            conn.close()
+        writer.run(lambda cursor: cursor.execute("INSERT INTO subjects (subject_name) VALUES (?)", (name,)))
 
     def delete_subject(self, subject_id: int):
-        conn = get_connection()
-        try:
-            conn.execute("DELETE FROM subjects WHERE subject_id = ?", (subject_id,))
-            conn.commit()
-        except Exception as e:
-            conn.rollback()
-            raise e
-        finally:
-            conn.close()
+        writer.run(lambda cursor: cursor.execute("DELETE FROM subjects WHERE subject_id = ?", (subject_id,)))
 
     def get_questions_by_subject(self, subject_id: int) -> List[Question]:
         conn = get_connection()
@@ -106,45 +180,201 @@ class MasterDataService:
         conn.close()
         return [Question(r[0], r[1], r[2], r[3], r[4], r[5], r[6], r[7], r[8]) for r in rows]
 
-    def add_question(self, q: Question):
+    def _fts_query(self, query: str) -> str:
+        # Every word must match, each as a prefix so results update while typing
+        words = re.findall(r"\w+", query or "")
+        return " ".join(f'"{w}"*' for w in words)
+
+    def search_questions(self, query: str, subject_id: int = None, difficulty: str = None, limit: int = 100) -> List[Question]:
+        match = self._fts_query(query)
+        difficulty = difficulty.lower() if difficulty else None
+        if not match:
+            if subject_id is None: return []
+            qs = self.get_questions_by_subject(subject_id)
+            if difficulty: qs = [q for q in qs if (q.difficulty_level or "").lower() == difficulty]
+            return qs[:limit]
+
         conn = get_connection()
+        cursor = conn.cursor()
         try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT question_id FROM questions WHERE subject_id = ? AND content = ?", (q.subject_id, q.content))
-            row = cursor.fetchone()
+            try:
+                # bm25 weights: hits in the question text rank above hits in the options
+                cursor.execute("""
+                    SELECT q.question_id, q.subject_id, q.content, q.option_a, q.option_b, q.option_c, q.option_d, q.correct_answer, q.difficulty_level
+                    FROM questions_fts f
+                    JOIN questions q ON q.question_id = f.rowid
+                    WHERE questions_fts MATCH ?
+                      AND (? IS NULL OR q.subject_id = ?)
+                      AND (? IS NULL OR lower(q.difficulty_level) = ?)
+                    ORDER BY bm25(questions_fts, 10.0, 1.0, 1.0, 1.0, 1.0)
+                    LIMIT ?
+                """, (match, subject_id, subject_id, difficulty, difficulty, limit))
+            except sqlite3.OperationalError:
+                # No FTS5 in this SQLite build
+                like = f"%{query.strip()}%"
+                cursor.execute("""
+                    SELECT question_id, subject_id, content, option_a, option_b, option_c, option_d, correct_answer, difficulty_level
+                    FROM questions
+                    WHERE (content LIKE ? OR option_a LIKE ? OR option_b LIKE ? OR option_c LIKE ? OR option_d LIKE ?)
+                      AND (? IS NULL OR subject_id = ?)
+                      AND (? IS NULL OR lower(difficulty_level) = ?)
+                    LIMIT ?
+                """, (like, like, like, like, like, subject_id, subject_id, difficulty, difficulty, limit))
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
+        return [Question(r[0], r[1], r[2], r[3], r[4], r[5], r[6], r[7], r[8]) for r in rows]
+
+    def add_question(self, q: Question, background_regrade: bool = False, tags: List[str] = None):
+        changed_ids = []
+
+        def upsert(cursor):
+            row = self._find_same_question(cursor, q.subject_id, q.content)
             
             if row:
                 q_id = row[0]
-                conn.execute("""
+                if row[1] != q.correct_answer: changed_ids.append(q_id)
+                cursor.execute("""
                     UPDATE questions 
                     SET option_a = ?, option_b = ?, option_c = ?, option_d = ?, correct_answer = ?, difficulty_level = ?
                     WHERE question_id = ?
                 """, (q.option_a, q.option_b, q.option_c, q.option_d, q.correct_answer, q.difficulty_level, q_id))
             else:
-                conn.execute("""
+                cursor.execute("""
                     INSERT INTO questions (subject_id, content, option_a, option_b, option_c, option_d, correct_answer, difficulty_level)
                     VALUES (?, ?, ?, ?, ?, ?, ?, ?)
                 """, (q.subject_id, q.content, q.option_a, q.option_b, q.option_c, q.option_d, q.correct_answer, q.difficulty_level))
-            
-            conn.commit()
-        except Exception as e:
-            conn.rollback()
-            raise e
+                q_id = cursor.lastrowid
+                dedup.index_question(cursor, q_id, q.subject_id, q.content)
+            if tags is not None: _set_question_tags(cursor, q_id, tags)
+
+        writer.run(upsert)
+        exam_payloads.invalidate()  # an edited question may sit in any exam
+        question_indexes.invalidate()
+        item_banks.invalidate(q.subject_id)
+        return self._regrade_changed(changed_ids, background_regrade)
+
+    def _find_same_question(self, cursor, subject_id: int, content: str):
+        # Same question = same subject and same text after normalization (case, spacing, punctuation)
+        cursor.execute("""
+            SELECT q.question_id, q.correct_answer
+            FROM question_signatures s
+            JOIN questions q ON q.question_id = s.question_id
+            WHERE s.subject_id = ? AND s.norm_hash = ?
+            ORDER BY q.question_id LIMIT 1
+        """, (subject_id, dedup.content_hash(content)))
+        return cursor.fetchone()
+
+    def find_near_duplicates(self, subject_id: int, content: str, threshold: float = dedup.NEAR_DUPLICATE_THRESHOLD,
+                             exclude_id: int = None) -> List[tuple]:
+        conn = get_connection()
+        cursor = conn.cursor()
+        try:
+            matches = dedup.find_candidates(cursor, subject_id, content, threshold, exclude_id)
+            if not matches: return []
+            scores = dict(matches)
+            placeholders = ",".join("?" * len(scores))
+            cursor.execute(f"""
+                SELECT question_id, subject_id, content, option_a, option_b, option_c, option_d, correct_answer, difficulty_level
+                FROM questions WHERE question_id IN ({placeholders})
+            """, list(scores))
+            found = {r[0]: Question(r[0], r[1], r[2], r[3], r[4], r[5], r[6], r[7], r[8]) for r in cursor.fetchall()}
+            return [(found[qid], score) for qid, score in matches if qid in found]
         finally:
             conn.close()
 
-    def delete_question(self, question_id: int):
+    def find_duplicate_clusters(self, subject_id: int, threshold: float = dedup.NEAR_DUPLICATE_THRESHOLD) -> List[List[Question]]:
         conn = get_connection()
+        cursor = conn.cursor()
         try:
-            conn.execute("DELETE FROM questions WHERE question_id = ?", (question_id,))
-            conn.commit()
-        except Exception as e:
-            conn.rollback()
-            raise e
+            writer.run(dedup.backfill_signatures)
+            # Candidate pairs only come from shared LSH buckets; each is verified on the full signature
+            cursor.execute("""
+                SELECT group_concat(question_id) FROM question_lsh
+                WHERE subject_id = ?
+                GROUP BY band_key HAVING COUNT(*) > 1
+            """, (subject_id,))
+            buckets = [[int(x) for x in r[0].split(",")] for r in cursor.fetchall()]
+            ids = sorted({qid for b in buckets for qid in b})
+            if not ids: return []
+            signatures = {}
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                cursor.execute(f"SELECT question_id, norm_hash, minhash FROM question_signatures WHERE question_id IN ({','.join('?' * len(chunk))})", chunk)
+                for qid, norm, blob in cursor.fetchall():
+                    signatures[qid] = (norm, dedup.unpack_signature(blob))
+
+            pairs = set()
+            for bucket in buckets:
+                for i, a in enumerate(bucket):
+                    for b in bucket[i + 1:]:
+                        pair = (min(a, b), max(a, b))
+                        if pair in pairs or a not in signatures or b not in signatures: continue
+                        (na, sa), (nb, sb) = signatures[a], signatures[b]
+                        if na == nb or dedup.similarity(sa, sb) >= threshold: pairs.add(pair)
+            groups = dedup.clusters(pairs)
+            questions = {q.question_id: q for q in self.get_questions_by_subject(subject_id)} if groups else {}
+            return [[questions[qid] for qid in g if qid in questions] for g in groups]
         finally:
             conn.close()
 
-    def import_questions_from_csv(self, file_path: str):
+    def _regrade_changed(self, question_ids: List[int], background: bool):
+        # Already graded attempts must follow a changed correct_answer
+        if not question_ids: return None
+        if background:
+            return ResultService(self.storage).regrade_in_background(question_ids)
+        return ResultService(self.storage).regrade_questions(question_ids)
+
+    def delete_question(self, question_id: int):
+        try:
+            writer.run(lambda cursor: cursor.execute("DELETE FROM questions WHERE question_id = ?", (question_id,)))
+        finally:
+            exam_payloads.invalidate()
+            question_indexes.invalidate()
+            item_banks.invalidate()
+
+    def get_all_tags(self) -> List[Tag]:
+        conn = get_connection()
+        rows = conn.execute("""
+            SELECT t.tag_id, t.tag_name, COUNT(qt.question_id)
+            FROM tags t LEFT JOIN question_tags qt ON qt.tag_id = t.tag_id
+            GROUP BY t.tag_id ORDER BY t.tag_name
+        """).fetchall()
+        conn.close()
+        return [Tag(r[0], r[1], r[2]) for r in rows]
+
+    def get_question_tags(self, question_id: int) -> List[str]:
+        conn = get_connection()
+        rows = conn.execute("""
+            SELECT t.tag_name FROM question_tags qt JOIN tags t ON t.tag_id = qt.tag_id
+            WHERE qt.question_id = ? ORDER BY t.tag_name
+        """, (question_id,)).fetchall()
+        conn.close()
+        return [r[0] for r in rows]
+
+    def set_question_tags(self, question_id: int, names: List[str]):
+        writer.run(_set_question_tags, question_id, names)
+        question_indexes.invalidate()
+
+    def tag_questions(self, name: str, question_ids: List[int]):
+        # Adds one tag to many questions, keeping their other tags
+        if not name: raise ValueError("Tag name is required")
+
+        def tag(cursor):
+            cursor.execute("INSERT OR IGNORE INTO tags (tag_name) VALUES (?)", (name,))
+            tag_id = cursor.execute("SELECT tag_id FROM tags WHERE tag_name = ?", (name,)).fetchone()[0]
+            cursor.executemany("INSERT OR IGNORE INTO question_tags (tag_id, question_id) VALUES (?, ?)",
+                               [(tag_id, qid) for qid in question_ids])
+        writer.run(tag)
+        question_indexes.invalidate()
+
+    def delete_tag(self, tag_id: int):
+        try:
+            writer.run(lambda cursor: cursor.execute("DELETE FROM tags WHERE tag_id = ?", (tag_id,)))
+        finally:
+            question_indexes.invalidate()
+
+    def import_questions_from_csv(self, file_path: str, background_regrade: bool = False):
         rows_to_process = []
         with open(file_path, mode='r', encoding='utf-8-sig') as csvfile:
             reader = csv.reader(csvfile)
@@ -152,19 +382,24 @@ class MasterDataService:
             
             if headers and "Subject" not in headers[0]:
                 pass
+            has_tags = bool(headers) and len(headers) > 8 and headers[8].strip().lower() == "tags"
 
-            for row in reader:
+            for line_no, row in enumerate(reader, 2):
                 if len(row) < 8: continue
-                rows_to_process.append(row)
+                rows_to_process.append((line_no, row))
         
         if not rows_to_process:
             raise ValueError("No valid questions found in CSV")
 
-        conn = get_connection()
-        cursor = conn.cursor()
-        try:
-            for row in rows_to_process:
+        changed_ids = []
+        report = {"inserted": 0, "updated": 0, "near_duplicates": [], "regrade": None}
+
+        # The whole file is one writer operation: all rows or none, as before
+        def import_rows(cursor):
+            for line_no, row in rows_to_process:
                 subj_name, content, a, b, c, d, correct, level = row[0], row[1], row[2], row[3], row[4], row[5], row[6], row[7]
+                # Optional 9th column, when the header names it "Tags": tags separated by ';' or ','
+                tags = parse_tags(row[8]) if has_tags and len(row) > 8 and row[8].strip() else None
                 
                 cursor.execute("SELECT subject_id FROM subjects WHERE subject_name = ?", (subj_name,))
                 s_row = cursor.fetchone()
@@ -174,34 +409,158 @@ class MasterDataService:
                 else:
                     subject_id = s_row[0]
 
-                cursor.execute("SELECT question_id FROM questions WHERE subject_id = ? AND content = ?", (subject_id, content))
-                existing = cursor.fetchone()
+                # Normalized duplicates are merged into the existing question
+                existing = self._find_same_question(cursor, subject_id, content)
                 
                 if existing:
+                    if existing[1] != correct: changed_ids.append(existing[0])
                     cursor.execute("""
                         UPDATE questions 
                         SET option_a = ?, option_b = ?, option_c = ?, option_d = ?, correct_answer = ?, difficulty_level = ?
                         WHERE question_id = ?
                     """, (a, b, c, d, correct, level, existing[0]))
+                    if tags is not None: _set_question_tags(cursor, existing[0], tags)
+                    report["updated"] += 1
                 else:
+                    # Near duplicates are still imported but flagged for review
+                    similar = dedup.find_candidates(cursor, subject_id, content)
                     cursor.execute("""
                         INSERT INTO questions (subject_id, content, option_a, option_b, option_c, option_d, correct_answer, difficulty_level)
                         VALUES (?, ?, ?, ?, ?, ?, ?, ?)
                     """, (subject_id, content, a, b, c, d, correct, level))
-            
-            conn.commit()
-        except Exception as e:
-            conn.rollback()
-            raise e
+                    q_id = cursor.lastrowid
+                    dedup.index_question(cursor, q_id, subject_id, content)
+                    if tags is not None: _set_question_tags(cursor, q_id, tags)
+                    report["inserted"] += 1
+                    if similar:
+                        report["near_duplicates"].append({"line": line_no, "content": content,
+                                                          "question_id": similar[0][0], "similarity": similar[0][1]})
+
+        writer.run(import_rows)
+        maintenance.note_bulk_change()
+        exam_payloads.invalidate()
+        question_indexes.invalidate()
+        item_banks.invalidate()
+        report["regrade"] = self._regrade_changed(changed_ids, background_regrade)
+        return report
+
+    def get_item_param_counts(self) -> Dict[str, int]:
+        # Questions per parameter source ('import', 'pvalue'); 'default' = no row, difficulty-based
+        conn = get_connection()
+        try:
+            counts = dict(conn.execute("SELECT source, COUNT(*) FROM item_params GROUP BY source").fetchall())
+            counts["default"] = conn.execute(
+                "SELECT COUNT(*) FROM questions WHERE question_id NOT IN (SELECT question_id FROM item_params)").fetchone()[0]
+            return counts
         finally:
             conn.close()
 
-class ExamService:
-    def create_exam(self, admin: Admin, subject: Subject, name: str, duration: int, questions: List[Question], 
-                    start_date: str = None, end_date: str = None):
+    def calibrate_item_params(self, min_responses: int = 30) -> int:
+        conn = readpool.connection()
+        try:
+            params = adaptive.calibrate_item_params(conn, min_responses)
+        finally:
+            conn.close()
+        try:
+            return writer.run(adaptive.save_item_params, params)
+        finally:
+            item_banks.invalidate()
+
+    def import_item_params(self, file_path: str) -> int:
+        # CSV with a header and columns question_id, a, b, c (3PL: discrimination, difficulty, guessing)
+        params = []
+        with open(file_path, mode='r', encoding='utf-8-sig') as csvfile:
+            reader = csv.reader(csvfile)
+            next(reader, None)
+            for line_no, row in enumerate(reader, 2):
+                if not row or not "".join(row).strip(): continue
+                try:
+                    question_id, a, b, c = int(row[0]), float(row[1]), float(row[2]), float(row[3])
+                except (ValueError, IndexError):
+                    raise ValueError(f"Line {line_no}: expected question_id, a, b, c")
+                if a <= 0 or not 0 <= c < 1:
+                    raise ValueError(f"Line {line_no}: need a > 0 and 0 <= c < 1")
+                params.append((question_id, a, b, c))
+        if not params:
+            raise ValueError("No item parameters found in CSV")
+
+        def save(cursor):
+            ids = sorted({p[0] for p in params})
+            known = set()
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                known.update(r[0] for r in cursor.execute(
+                    f"SELECT question_id FROM questions WHERE question_id IN ({','.join('?' * len(chunk))})", chunk))
+            missing = [q for q in ids if q not in known]
+            if missing: raise ValueError(f"Unknown question ids: {', '.join(map(str, missing[:20]))}")
+            cursor.executemany("""
+                INSERT INTO item_params (question_id, a, b, c, source, responses) VALUES (?, ?, ?, ?, 'import', NULL)
+                ON CONFLICT (question_id) DO UPDATE SET a = excluded.a, b = excluded.b, c = excluded.c,
+                    source = excluded.source, responses = NULL
+            """, params)
+            return len(params)
+        try:
+            return writer.run(save)
+        finally:
+            item_banks.invalidate()
+
+@instrumented
+@bind_storage
+class ClassService:
+    def get_all_classes(self) -> List[StudentClass]:
         conn = get_connection()
         cursor = conn.cursor()
+        cursor.execute("""
+            SELECT c.class_id, c.class_name, COUNT(m.student_id)
+            FROM classes c LEFT JOIN class_members m ON m.class_id = c.class_id
+            GROUP BY c.class_id ORDER BY c.class_name
+        """)
+        rows = cursor.fetchall()
+        conn.close()
+        return [StudentClass(r[0], r[1], r[2]) for r in rows]
+
+    def add_class(self, name: str) -> int:
+        if not name: raise ValueError("Class name is required")
         try:
+            return writer.run(lambda cursor: cursor.execute("INSERT INTO classes (class_name) VALUES (?)", (name,)).lastrowid)
+        except sqlite3.IntegrityError:
+            raise ValueError("Class name already exists")
+
+    def delete_class(self, class_id: int):
+        # Members and exam assignments go with it (ON DELETE CASCADE)
+        writer.run(lambda cursor: cursor.execute("DELETE FROM classes WHERE class_id = ?", (class_id,)))
+
+    def get_member_ids(self, class_id: int) -> List[int]:
+        conn = get_connection()
+        rows = conn.execute("SELECT student_id FROM class_members WHERE class_id = ?", (class_id,)).fetchall()
+        conn.close()
+        return [r[0] for r in rows]
+
+    def set_members(self, class_id: int, student_ids: List[int]):
+        def replace(cursor):
+            cursor.execute("DELETE FROM class_members WHERE class_id = ?", (class_id,))
+            cursor.executemany("INSERT INTO class_members (class_id, student_id) VALUES (?, ?)", [(class_id, sid) for sid in set(student_ids)])
+        writer.run(replace)
+
+    def get_exam_class_ids(self, exam_id: int) -> List[int]:
+        conn = get_connection()
+        rows = conn.execute("SELECT class_id FROM exam_assignments WHERE exam_id = ?", (exam_id,)).fetchall()
+        conn.close()
+        return [r[0] for r in rows]
+
+    def set_exam_classes(self, exam_id: int, class_ids: List[int]):
+        # No classes = the exam is open to every student again
+        def replace(cursor):
+            cursor.execute("DELETE FROM exam_assignments WHERE exam_id = ?", (exam_id,))
+            cursor.executemany("INSERT INTO exam_assignments (exam_id, class_id) VALUES (?, ?)", [(exam_id, cid) for cid in set(class_ids)])
+        writer.run(replace)
+
+@instrumented
+@bind_storage
+class ExamService:
+    def create_exam(self, admin: Admin, subject: Subject, name: str, duration: int, questions: List[Question], 
+                    start_date: str = None, end_date: str = None):
+        def insert(cursor):
             cursor.execute("""
                 INSERT INTO exams (subject_id, exam_name, duration, created_by, start_date, end_date, status) 
                 VALUES (?, ?, ?, ?, ?, ?, 'draft')
@@ -210,13 +569,9 @@ class ExamService:
             
             details = [(exam_id, q.question_id) for q in questions]
             cursor.executemany("INSERT INTO exam_details (exam_id, question_id) VALUES (?, ?)", details)
-            conn.commit()
             return exam_id
-        except Exception as e:
-            conn.rollback()
-            raise e
-        finally:
-            conn.close()
+
+        return writer.run(insert)
 
     def create_auto_exam(self, admin: Admin, subject: Subject, name: str, duration: int, 
                          count_easy: int, count_medium: int, count_hard: int,
@@ -244,9 +599,7 @@ class ExamService:
             random.sample(hard_qs, count_hard)
         )
         
-        conn = get_connection()
-        cursor = conn.cursor()
-        try:
+        def insert(cursor):
             cursor.execute("""
                 INSERT INTO exams (subject_id, exam_name, duration, created_by, start_date, end_date, status) 
                 VALUES (?, ?, ?, ?, ?, ?, 'draft')
@@ -255,47 +608,139 @@ class ExamService:
             
             details = [(exam_id, qid) for qid in selected_ids]
             cursor.executemany("INSERT INTO exam_details (exam_id, question_id) VALUES (?, ?)", details)
-            conn.commit()
             return exam_id
-        except Exception as e:
-            conn.rollback()
-            raise e
+
+        return writer.run(insert)
+
+    def _blueprint_exclusions(self, exclude_classes: List[int], seen_since: str):
+        # Questions any member of these classes got since seen_since (any time if None)
+        if not exclude_classes: return set()
+        conn = get_connection()
+        try:
+            placeholders = ",".join("?" * len(exclude_classes))
+            students = [r[0] for r in conn.execute(f"SELECT DISTINCT student_id FROM class_members WHERE class_id IN ({placeholders})",
+                                                   list(exclude_classes))]
+            return seen_question_ids(conn, students, seen_since)
         finally:
             conn.close()
 
-    def update_exam(self, exam_id: int, name: str, duration: int, questions: List[Question], start_date: str = None, end_date: str = None):
+    def _blueprint_sections(self, index, blueprint: str) -> List[Section]:
+        sections = parse_blueprint(blueprint)
+        unknown = sorted({t for sec in sections for t in sec.tags if t.lower() not in index.tag_ids})
+        if unknown: raise ValueError(f"Unknown tags: {', '.join(unknown)}")
+        return sections
+
+    def check_blueprint(self, subject_id: int, blueprint: str, exclude_classes: List[int] = None,
+                        seen_since: str = None) -> List[tuple]:
+        # (section, questions available to it) per line, ignoring overlap with other sections
+        index = question_indexes.get()
+        sections = self._blueprint_sections(index, blueprint)
+        excluded = self._blueprint_exclusions(exclude_classes, seen_since)
+        return [(sec, index.available(sec, subject_id, excluded)) for sec in sections]
+
+    def create_blueprint_exam(self, admin: Admin, subject: Subject, name: str, duration: int, blueprint: str,
+                              exclude_classes: List[int] = None, seen_since: str = None,
+                              start_date: str = None, end_date: str = None) -> int:
+        # Raises blueprint.InfeasibleBlueprint (a ValueError) listing every section that cannot be filled
+        index = question_indexes.get()
+        sections = self._blueprint_sections(index, blueprint)
+        question_ids = index.assemble(sections, subject.subject_id, self._blueprint_exclusions(exclude_classes, seen_since))
+
+        def insert(cursor):
+            cursor.execute("""
+                INSERT INTO exams (subject_id, exam_name, duration, created_by, start_date, end_date, status) 
+                VALUES (?, ?, ?, ?, ?, ?, 'draft')
+            """, (subject.subject_id, name, duration, admin.user_id, start_date, end_date))
+            exam_id = cursor.lastrowid
+            cursor.executemany("INSERT INTO exam_details (exam_id, question_id) VALUES (?, ?)", [(exam_id, qid) for qid in question_ids])
+            return exam_id
+        return writer.run(insert)
+
+    def create_adaptive_exam(self, admin: Admin, subject: Subject, name: str, duration: int, test_length: int,
+                             start_date: str = None, end_date: str = None) -> int:
+        # No fixed question list: each attempt draws test_length questions from the subject (see adaptive.py)
+        if test_length <= 0: raise ValueError("Test length must be > 0")
         conn = get_connection()
         try:
-            conn.execute("""
+            bank = item_banks.get(conn.cursor(), subject.subject_id)
+        finally:
+            conn.close()
+        if len(bank) < test_length:
+            raise ValueError(f"Not enough questions in {subject.subject_name} (Requested: {test_length}, Available: {len(bank)})")
+
+        def insert(cursor):
+            cursor.execute("""
+                INSERT INTO exams (subject_id, exam_name, duration, created_by, start_date, end_date, status, exam_type, test_length)
+                VALUES (?, ?, ?, ?, ?, ?, 'draft', 'adaptive', ?)
+            """, (subject.subject_id, name, duration, admin.user_id, start_date, end_date, test_length))
+            return cursor.lastrowid
+        return writer.run(insert)
+
+    def update_exam(self, exam_id: int, name: str, duration: int, questions: List[Question], start_date: str = None, end_date: str = None,
+                    test_length: int = None):
+        # Adaptive exams keep no question list: `questions` is ignored, test_length replaces it
+        def update(cursor):
+            cursor.execute("""
                 UPDATE exams 
-                SET exam_name = ?, duration = ?, start_date = ?, end_date = ? 
+                SET exam_name = ?, duration = ?, start_date = ?, end_date = ?, test_length = COALESCE(?, test_length)
                 WHERE exam_id = ?
-            """, (name, duration, start_date, end_date, exam_id))
-            
-            # Update questions: Remove old, Add new (Simplest way)
-            conn.execute("DELETE FROM exam_details WHERE exam_id = ?", (exam_id,))
-            
-            details = [(exam_id, q.question_id) for q in questions]
-            conn.executemany("INSERT INTO exam_details (exam_id, question_id) VALUES (?, ?)", details)
+            """, (name, duration, start_date, end_date, test_length, exam_id))
             
-            conn.commit()
-        except Exception as e:
-            conn.rollback()
-            raise e
+            if cursor.execute("SELECT exam_type FROM exams WHERE exam_id = ?", (exam_id,)).fetchone() != ('adaptive',):
+                # Update questions: Remove old, Add new (Simplest way)
+                cursor.execute("DELETE FROM exam_details WHERE exam_id = ?", (exam_id,))
+                
+                details = [(exam_id, q.question_id) for q in questions]
+                cursor.executemany("INSERT INTO exam_details (exam_id, question_id) VALUES (?, ?)", details)
+                # Pre-created answer sheets have the old questions; the pre-warm job makes new ones
+                _drop_unstarted_attempts(cursor, "r.exam_id = ?", (exam_id,))
+
+        try:
+            writer.run(update)
+        finally:
+            answer_keys.invalidate(exam_id)
+            exam_payloads.invalidate(exam_id)
+
+        # Re-compile straight away if students can already be taking it
+        self._compile_answer_keys_if_published([exam_id])
+
+    def _compile_answer_keys_if_published(self, exam_ids: List[int]):
+        if not exam_ids: return
+        conn = get_connection()
+        try:
+            cursor = conn.cursor()
+            placeholders = ",".join("?" * len(exam_ids))
+            cursor.execute(f"SELECT exam_id FROM exams WHERE status = 'published' AND exam_id IN ({placeholders})", exam_ids)
+            for (exam_id,) in cursor.fetchall():
+                answer_keys.put(compile_answer_key(cursor, exam_id))
         finally:
             conn.close()
 
+    def get_answer_key(self, exam_id: int):
+        return get_answer_key(exam_id)
+
     def update_auto_statuses(self):
         conn = get_connection()
         now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        published_ids = []
+
+        def advance(cursor):
+            cursor.execute("UPDATE exams SET status = 'published' WHERE status = 'draft' AND start_date IS NOT NULL AND start_date <= ?", (now_str,))
+            # Published -> Closed
+            cursor.execute("UPDATE exams SET status = 'closed' WHERE status = 'published' AND end_date IS NOT NULL AND end_date <= ?", (now_str,))
         try:
             # Draft -> Published
-            conn.execute("UPDATE exams SET status = 'published' WHERE status = 'draft' AND start_date IS NOT NULL AND start_date <= ?", (now_str,))
-            # Published -> Closed
-            conn.execute("UPDATE exams SET status = 'closed' WHERE status = 'published' AND end_date IS NOT NULL AND end_date <= ?", (now_str,))
-            conn.commit()
-        except: pass
+            cursor = conn.cursor()
+            cursor.execute("SELECT exam_id FROM exams WHERE status = 'draft' AND start_date IS NOT NULL AND start_date <= ?", (now_str,))
+            published_ids = [r[0] for r in cursor.fetchall()]
+            cursor.execute("SELECT 1 FROM exams WHERE status = 'published' AND end_date IS NOT NULL AND end_date <= ? LIMIT 1", (now_str,))
+            # Nothing due (the usual case, e.g. every student loading the dashboard at once): stay a reader
+            due = bool(published_ids or cursor.fetchone())
+            conn.close()
+            if due: writer.run(advance)
+        except: published_ids = []
         finally: conn.close()
+        self._compile_answer_keys_if_published(published_ids)
 
     def get_exams_by_subject(self, subject_id: int) -> List[Exam]:
         self.update_auto_statuses()
@@ -319,7 +764,7 @@ class ExamService:
         # AND (end_date IS NULL OR end_date >= now)
         
         query = """
-            SELECT exam_id, subject_id, exam_name, duration, created_by, start_date, end_date, status 
+            SELECT exam_id, subject_id, exam_name, duration, created_by, start_date, end_date, status, exam_type, test_length
             FROM exams 
             WHERE subject_id = ? 
               AND status = 'published'
@@ -330,31 +775,62 @@ class ExamService:
         cursor.execute(query, (subject_id, now_str, now_str))
         exam_rows = cursor.fetchall()
         
+        # Questions come from the shared payload cache (one query for all misses)
+        payloads = get_exam_payloads(cursor, [r[0] for r in exam_rows])
         exams = []
         for r in exam_rows:
-            e = Exam(r[0], r[1], r[2], r[3], r[4], r[5], r[6], r[7])
-            cursor.execute("""
-                SELECT q.question_id, q.subject_id, q.content, q.option_a, q.option_b, q.option_c, q.option_d, q.correct_answer, q.difficulty_level
-                FROM questions q
-                JOIN exam_details ed ON q.question_id = ed.question_id
-                WHERE ed.exam_id = ?
-            """, (e.exam_id,))
-            q_rows = cursor.fetchall()
-            for qr in q_rows:
-                e.add_question(Question(qr[0], qr[1], qr[2], qr[3], qr[4], qr[5], qr[6], qr[7], qr[8]))
+            e = Exam(r[0], r[1], r[2], r[3], r[4], r[5], r[6], r[7], r[8], r[9])
+            e.questions = list(payloads[e.exam_id])
             exams.append(e)
             
         conn.close()
         return exams
 
-    def get_all_exams_for_admin(self) -> List[Exam]:
+    def get_exams_for_student(self, student_id: int) -> List[Exam]:
+        # Everything the student dashboard lists, in one query: open published exams
+        # assigned to one of the student's classes (or to no class at all) that
+        # the student has not completed yet. subject_name is attached.
         self.update_auto_statuses()
+        now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         conn = get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT e.exam_id, e.subject_id, e.exam_name, e.duration, e.created_by, e.start_date, e.end_date, e.status, s.subject_name,
+                       e.exam_type, e.test_length
+                FROM exams e
+                JOIN subjects s ON s.subject_id = e.subject_id
+                WHERE e.status = 'published'
+                  AND (e.start_date IS NULL OR e.start_date <= ?)
+                  AND (e.end_date IS NULL OR e.end_date >= ?)
+                  AND (NOT EXISTS (SELECT 1 FROM exam_assignments a WHERE a.exam_id = e.exam_id)
+                       OR e.exam_id IN (SELECT a.exam_id FROM class_members m
+                                        JOIN exam_assignments a ON a.class_id = m.class_id
+                                        WHERE m.student_id = ?))
+                  AND NOT EXISTS (SELECT 1 FROM {shards.results()} r
+                                  WHERE r.student_id = ? AND r.exam_id = e.exam_id AND r.status = 'completed')
+                ORDER BY s.subject_name, e.exam_id
+            """, (now_str, now_str, student_id, student_id))
+            rows = cursor.fetchall()
+            payloads = get_exam_payloads(cursor, [r[0] for r in rows])
+        finally:
+            conn.close()
+        exams = []
+        for r in rows:
+            e = Exam(r[0], r[1], r[2], r[3], r[4], r[5], r[6], r[7], r[9], r[10])
+            e.subject_name = r[8]
+            e.questions = list(payloads[e.exam_id])
+            exams.append(e)
+        return exams
+
+    def get_all_exams_for_admin(self) -> List[Exam]:
+        self.update_auto_statuses()
+        conn = readpool.connection()
         cursor = conn.cursor()
         
         cursor.execute("""
             SELECT e.exam_id, e.subject_id, e.exam_name, e.duration, e.created_by, 
-                   e.start_date, e.end_date, e.status, s.subject_name
+                   e.start_date, e.end_date, e.status, s.subject_name, e.exam_type, e.test_length
             FROM exams e
             JOIN subjects s ON e.subject_id = s.subject_id
             ORDER BY e.exam_id DESC
@@ -366,7 +842,7 @@ class ExamService:
             # We can attach subject_name dynamically if needed or just rely on IDs, 
             # but for display it's nice to have subject name. 
             # The Model doesn't have it, so we'll tack it on.
-            e = Exam(r[0], r[1], r[2], r[3], r[4], r[5], r[6], r[7])
+            e = Exam(r[0], r[1], r[2], r[3], r[4], r[5], r[6], r[7], r[9], r[10])
             e.subject_name = r[8]
             exams.append(e)
             
@@ -378,146 +854,570 @@ class ExamService:
         if new_status not in valid_statuses:
             raise ValueError(f"Invalid status: {new_status}")
             
-        conn = get_connection()
-        conn.execute("UPDATE exams SET status = ? WHERE exam_id = ?", (new_status, exam_id))
-        conn.commit()
-        conn.close()
+        writer.run(lambda cursor: cursor.execute("UPDATE exams SET status = ? WHERE exam_id = ?", (new_status, exam_id)))
+        if new_status == 'published':
+            self._compile_answer_keys_if_published([exam_id])
         
     def delete_exam(self, exam_id: int):
-        conn = get_connection()
-        try:
-            conn.execute("DELETE FROM exam_details WHERE exam_id = ?", (exam_id,))
-            conn.execute("DELETE FROM results WHERE exam_id = ?", (exam_id,)) # Also delete associated results? Or keep them? User said "chi tiết xóa như cái menu student result luôn", implies deleting exam deletes everything or is capable of it. Let's assume cascade or manual delete.
+        def delete(cursor):
+            cursor.execute("DELETE FROM exam_details WHERE exam_id = ?", (exam_id,))
             # Ideally we shouldn't delete results if we want history, but if the user deletes the exam, it's gone.
             # To be safe and clean:
-            cursor = conn.cursor()
-            cursor.execute("SELECT result_id FROM results WHERE exam_id = ?", (exam_id,))
-            res_rows = cursor.fetchall()
-            for (rid,) in res_rows:
-                conn.execute("DELETE FROM result_details WHERE result_id = ?", (rid,))
-            
-            conn.execute("DELETE FROM results WHERE exam_id = ?", (exam_id,))
-            conn.execute("DELETE FROM exams WHERE exam_id = ?", (exam_id,))
-            conn.commit()
-        except Exception as e:
-            conn.rollback()
-            raise e
+            # Archived term shards are read-only; their attempts stay as history
+            for schema in shards.writable_schemas():
+                cursor.execute(f"SELECT result_id FROM {schema}.results WHERE exam_id = ?", (exam_id,))
+                res_rows = cursor.fetchall()
+                for (rid,) in res_rows:
+                    cursor.execute(f"DELETE FROM {schema}.result_details WHERE result_id = ?", (rid,))
+                    cursor.execute("DELETE FROM answer_journal_sync WHERE result_id = ?", (rid,))
+
+                cursor.execute(f"DELETE FROM {schema}.results WHERE exam_id = ?", (exam_id,))
+            cursor.execute("DELETE FROM exams WHERE exam_id = ?", (exam_id,))
+
+        try:
+            writer.run(delete)
         finally:
-            conn.close()
+            answer_keys.invalidate(exam_id)
+            exam_payloads.invalidate(exam_id)
 
+@instrumented
+@bind_storage
 class ResultService:
+    def _attempt_deadline(self, start_time: datetime, exam: Exam) -> datetime:
+        deadline = start_time + timedelta(minutes=exam.duration)
+        if exam.end_date:
+            try: deadline = min(deadline, datetime.strptime(exam.end_date, "%Y-%m-%d %H:%M:%S"))
+            except ValueError: pass
+        return deadline
+
     def start_exam(self, student: Student, exam: Exam) -> Dict:
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT result_id, start_time, score, status 
-            FROM results 
-            WHERE student_id = ? AND exam_id = ?
-        """, (student.user_id, exam.exam_id))
-        row = cursor.fetchone()
-        
-        if row:
-            if row[3] == 'completed':
-                conn.close()
-                return {"status": "completed", "score": row[2]}
-            else:
-                conn.close()
-                start_time = datetime.fromisoformat(row[1])
-                elapsed = (datetime.now() - start_time).total_seconds()
-                remaining = (exam.duration * 60) - elapsed
-                
+        # Adaptive attempts start with one question, picked for an average student
+        bank = self._item_bank(exam.subject_id) if exam.exam_type == 'adaptive' else None
+
+        # Check-and-insert runs on the writer, so a double click cannot create two attempts
+        def begin(cursor):
+            cursor.execute(f"""
+                SELECT result_id, start_time, score, status, deadline 
+                FROM {shards.results()} 
+                WHERE student_id = ? AND exam_id = ?
+            """, (student.user_id, exam.exam_id))
+            row = cursor.fetchone()
+            
+            if row:
+                if row[3] == 'completed':
+                    return {"status": "completed", "score": row[2]}
+                if row[3] == 'not_started':
+                    # Pre-warmed attempt: the answer sheet exists, the clock starts now
+                    start_time = datetime.now()
+                    deadline = self._attempt_deadline(start_time, exam)
+                    cursor.execute(f"UPDATE {shards.schema_of(row[0])}.results SET status = 'in_progress', start_time = ?, deadline = ? WHERE result_id = ?",
+                                   (start_time.isoformat(), deadline.isoformat(), row[0]))
+                    return {
+                        "status": "new",
+                        "result_id": row[0],
+                        "deadline": deadline.isoformat(),
+                        "remaining_seconds": max(0, (deadline - start_time).total_seconds()),
+                        "saved_answers": {}
+                    }
+                # Resume against the deadline fixed when the attempt started
+                if row[4]:
+                    deadline = datetime.fromisoformat(row[4])
+                else:
+                    deadline = self._attempt_deadline(datetime.fromisoformat(row[1]), exam)
+                    cursor.execute(f"UPDATE {shards.schema_of(row[0])}.results SET deadline = ? WHERE result_id = ?", (deadline.isoformat(), row[0]))
                 return {
                     "status": "in_progress", 
                     "result_id": row[0], 
-                    "remaining_seconds": max(0, remaining),
-                    "saved_answers": self.get_saved_answers(row[0])
+                    "deadline": deadline.isoformat(),
+                    "remaining_seconds": max(0, (deadline - datetime.now()).total_seconds()),
                 }
-        else:
+
             start_time = datetime.now()
-            cursor.execute("""
-                INSERT INTO results (exam_id, student_id, score, submit_time, status, start_time) 
-                VALUES (?, ?, 0, ?, 'in_progress', ?)
-            """, (exam.exam_id, student.user_id, "", start_time.isoformat()))
+            deadline = self._attempt_deadline(start_time, exam)
+            schema = shards.write_schema()
+            cursor.execute(f"""
+                INSERT INTO {schema}.results (exam_id, student_id, score, submit_time, status, start_time, deadline) 
+                VALUES (?, ?, 0, ?, 'in_progress', ?, ?)
+            """, (exam.exam_id, student.user_id, "", start_time.isoformat(), deadline.isoformat()))
             result_id = cursor.lastrowid
-            
-            for q in exam.questions:
-                cursor.execute("INSERT INTO result_details (result_id, question_id, selected_answer, is_correct) VALUES (?, ?, ?, 0)",
-                               (result_id, q.question_id, ""))
-            
-            conn.commit()
-            conn.close()
+            if bank is not None:
+                self._add_adaptive_step(cursor, schema, result_id, bank, 0.0, set())
+            else:
+                cursor.executemany(f"INSERT INTO {schema}.result_details (result_id, question_id, selected_answer, is_correct) VALUES (?, ?, ?, 0)",
+                                   [(result_id, q.question_id, "") for q in exam.questions])
             return {
                 "status": "new",
                 "result_id": result_id,
-                "remaining_seconds": exam.duration * 60,
+                "deadline": deadline.isoformat(),
+                "remaining_seconds": max(0, (deadline - start_time).total_seconds()),
                 "saved_answers": {}
             }
 
+        info = writer.run(begin)
+        if info["status"] == "in_progress":
+            info["saved_answers"] = self.get_saved_answers(info["result_id"])
+            info["journal_seq"] = self.get_journal_seq(info["result_id"])
+        return info
+
     def get_saved_answers(self, result_id) -> Dict[int, str]:
         conn = get_connection()
         cursor = conn.cursor()
-        cursor.execute("SELECT question_id, selected_answer FROM result_details WHERE result_id = ?", (result_id,))
+        cursor.execute(f"SELECT question_id, selected_answer FROM {shards.schema_of(result_id)}.result_details WHERE result_id = ?", (result_id,))
         rows = cursor.fetchall()
         conn.close()
         return {r[0]: r[1] for r in rows}
 
-    def save_answer_progress(self, result_id, question_id, answer):
+    def get_journal_seq(self, result_id) -> int:
+        # Last journal record replayed for the attempt, from any machine; journal.open_journal(synced_seq=...) continues from it
         conn = get_connection()
         try:
-            conn.execute("UPDATE result_details SET selected_answer = ? WHERE result_id = ? AND question_id = ?",
-                         (answer, result_id, question_id))
-            conn.commit()
-        except: pass
-        finally: conn.close()
+            row = conn.execute("SELECT last_seq FROM answer_journal_sync WHERE result_id = ?", (result_id,)).fetchone()
+            return row[0] if row else 0
+        finally:
+            conn.close()
+
+    def save_answer_progress(self, result_id, question_id, answer):
+        # Fire-and-forget: answer clicks are group-committed; finish_exam queues behind them
+        def save(cursor):
+            cursor.execute(f"UPDATE {shards.schema_of(result_id)}.result_details SET selected_answer = ? WHERE result_id = ? AND question_id = ?",
+                           (answer, result_id, question_id))
+        return writer.submit(save)
+
+    def _replay_journal(self, cursor, result_id, records) -> int:
+        # Applies journal records newer than the attempt's last replayed seq, in the
+        # same transaction that advances it, so repeating a replay is harmless
+        row = cursor.execute("SELECT last_seq FROM answer_journal_sync WHERE result_id = ?", (result_id,)).fetchone()
+        last_seq = row[0] if row else 0
+        fresh = [r for r in records if r[0] > last_seq]
+        if not fresh: return last_seq
+        schema = shards.schema_of(result_id)
+        status = cursor.execute(f"SELECT status FROM {schema}.results WHERE result_id = ?", (result_id,)).fetchone()
+        # An attempt already graded (e.g. by the expiry sweeper) keeps its answers
+        if status and status[0] == 'in_progress':
+            latest = {}
+            for _, question_id, answer in fresh: latest[question_id] = answer
+            cursor.executemany(f"UPDATE {schema}.result_details SET selected_answer = ? WHERE result_id = ? AND question_id = ?",
+                               [(answer, result_id, question_id) for question_id, answer in latest.items()])
+        cursor.execute("""
+            INSERT INTO answer_journal_sync (result_id, last_seq, synced_at) VALUES (?, ?, ?)
+            ON CONFLICT(result_id) DO UPDATE SET last_seq = excluded.last_seq, synced_at = excluded.synced_at
+        """, (result_id, fresh[-1][0], datetime.now().isoformat()))
+        return fresh[-1][0]
+
+    def sync_answer_journal(self, journal, wait: bool = True):
+        # Replays unsynced journal records; with wait=False returns the writer Future
+        # (None when nothing is pending). A failed sync leaves the records pending.
+        records = journal.pending()
+        if not records: return journal.synced_seq if wait else None
 
-    def finish_exam(self, result_id, exam: Exam) -> Result:
+        def mark(future):
+            if future.exception() is None: journal.mark_synced(future.result())
+
+        future = writer.submit(self._replay_journal, journal.result_id, records)
+        if not wait:
+            future.add_done_callback(mark)
+            return future
+        journal.mark_synced(future.result())
+        return journal.synced_seq
+
+    def _item_bank(self, subject_id: int):
+        conn = readpool.connection()
+        try:
+            return item_banks.get(conn.cursor(), subject_id)
+        finally:
+            conn.close()
+
+    def _adaptive_steps(self, cursor, schema: str, result_id: int) -> List[tuple]:
+        # (result_detail_id, question_id, selected_answer, is_correct, ability, ability_se) in the order given
+        cursor.execute(f"""
+            SELECT result_detail_id, question_id, selected_answer, is_correct, ability, ability_se
+            FROM {schema}.result_details WHERE result_id = ? ORDER BY result_detail_id
+        """, (result_id,))
+        return cursor.fetchall()
+
+    def _add_adaptive_step(self, cursor, schema: str, result_id: int, bank, theta: float, administered) -> Optional[int]:
+        question_id = bank.select(theta, administered)
+        if question_id is not None:
+            cursor.execute(f"INSERT INTO {schema}.result_details (result_id, question_id, selected_answer, is_correct) VALUES (?, ?, '', 0)",
+                           (result_id, question_id))
+        return question_id
+
+    def adaptive_state(self, result_id: int, exam: Exam) -> Dict:
+        # The question on screen (None once the test is complete) and the estimate so far
         conn = get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT question_id, selected_answer FROM result_details WHERE result_id = ?", (result_id,))
-        rows = cursor.fetchall()
-        answers = {r[0]: r[1] for r in rows}
-        
-        correct_count = 0
-        total = len(exam.questions)
-        
-        for q in exam.questions:
-            user_ans = answers.get(q.question_id, "")
-            is_correct = user_ans == q.correct_answer
-            if is_correct: correct_count += 1
+        try:
+            cursor = conn.cursor()
+            steps = self._adaptive_steps(cursor, shards.schema_of(result_id), result_id)
+            answered = [r for r in steps if r[4] is not None]
+            question = None
+            if steps and steps[-1][4] is None:
+                cursor.execute("""
+                    SELECT question_id, subject_id, content, option_a, option_b, option_c, option_d, correct_answer, difficulty_level
+                    FROM questions WHERE question_id = ?
+                """, (steps[-1][1],))
+                row = cursor.fetchone()
+                if row: question = Question(*row)
+        finally:
+            conn.close()
+        return {
+            "question": question,
+            "answered": len(answered),
+            "test_length": exam.test_length,
+            "ability": answered[-1][4] if answered else 0.0,
+            "ability_se": answered[-1][5] if answered else 1.0,
+        }
+
+    def answer_adaptive(self, result_id: int, exam: Exam, question_id: int, answer: str) -> Dict:
+        # Grades the answer, logs the new estimate on its row and adds the next question,
+        # all in one writer transaction. Answers to anything but the open question are ignored.
+        bank = self._item_bank(exam.subject_id)
+        schema = shards.schema_of(result_id)
+
+        def step(cursor):
+            # Only while the attempt is open and in time (deadline, or start + duration before deadlines were stored)
+            now_str = datetime.now().isoformat()
+            cursor.execute(f"""
+                SELECT e.test_length FROM {schema}.results r JOIN exams e ON e.exam_id = r.exam_id
+                WHERE r.result_id = ? AND r.status = 'in_progress'
+                  AND COALESCE(r.deadline > ?, julianday(r.start_time) + e.duration / 1440.0 > julianday(?))
+            """, (result_id, now_str, now_str))
+            row = cursor.fetchone()
+            if not row: return
+            steps = self._adaptive_steps(cursor, schema, result_id)
+            if not steps or steps[-1][1] != question_id or steps[-1][4] is not None: return
+            cursor.execute(f"SELECT {ANSWER_MATCH_SQL.format(selected='?', correct='correct_answer')} FROM questions WHERE question_id = ?", (answer, question_id))
+            correct = bool((cursor.fetchone() or (0,))[0])
+            theta, se = bank.estimate([(r[1], bool(r[3])) for r in steps[:-1]] + [(question_id, correct)])
+            cursor.execute(f"UPDATE {schema}.result_details SET selected_answer = ?, is_correct = ?, ability = ?, ability_se = ? WHERE result_detail_id = ?",
+                           (answer, correct, theta, se, steps[-1][0]))
+            if len(steps) < (row[0] or 0):
+                self._add_adaptive_step(cursor, schema, result_id, bank, theta, {r[1] for r in steps})
+
+        writer.run(step)
+        return self.adaptive_state(result_id, exam)
+
+    def _closed_attempt(self, cursor, schema: str, result_id) -> Optional[tuple]:
+        # (score, submit_time) of an attempt already completed, e.g. by the expiry sweeper; None while in progress
+        row = cursor.execute(f"SELECT status, score, submit_time FROM {schema}.results WHERE result_id = ?", (result_id,)).fetchone()
+        return (row[1], row[2]) if row and row[0] != 'in_progress' else None
+
+    def _finish_adaptive(self, result_id, exam: Exam) -> Result:
+        bank = self._item_bank(exam.subject_id)
+        schema = shards.schema_of(result_id)
+
+        def grade(cursor):
+            closed = self._closed_attempt(cursor, schema, result_id)
+            if closed: return closed
+            # Answers were graded step by step (none after the deadline); a question left on screen just stays unanswered
+            steps = self._adaptive_steps(cursor, schema, result_id)
+            score = adaptive.attempt_score(bank, [(r[1], bool(r[3])) for r in steps if r[4] is not None], exam.test_length)
+            now_str = datetime.now().isoformat()
+            cursor.execute(f"UPDATE {schema}.results SET score = ?, status = 'completed', submit_time = ? WHERE result_id = ?",
+                           (score, now_str, result_id))
+            return score, now_str
+
+        score, now_str = writer.run(grade)
+        return Result(result_id, exam.exam_id, 0, score, now_str)
+
+    def finish_exam(self, result_id, exam: Exam, journal=None) -> Result:
+        if exam.exam_type == 'adaptive': return self._finish_adaptive(result_id, exam)
+        # Grade against the compiled key, not the client's copy of exam.questions
+        key = get_answer_key(exam.exam_id)
+        schema = shards.schema_of(result_id)
+        records = journal.pending() if journal is not None else []
+
+        def grade(cursor):
+            # Submitting twice, or after the sweeper graded the attempt, keeps the first grade
+            closed = self._closed_attempt(cursor, schema, result_id)
+            if closed: return closed
+            # Reconcile the local answer journal first, in the grading transaction
+            if records: self._replay_journal(cursor, result_id, records)
+            cursor.execute(f"SELECT question_id, selected_answer FROM {schema}.result_details WHERE result_id = ?", (result_id,))
+            answers = {r[0]: r[1] for r in cursor.fetchall()}
+            # Graded on the questions this attempt was given, even if the exam was edited since
+            sheet_key = key if key.covers(answers.keys()) else compile_sheet_key(cursor, exam.exam_id, answers)
+
+            correct_count, flags = sheet_key.grade(sheet_key.answer_sheet(answers))
+            correct_ids = sheet_key.correct_question_ids(flags)
             
-            cursor.execute("UPDATE result_details SET is_correct = ? WHERE result_id = ? AND question_id = ?",
-                           (1 if is_correct else 0, result_id, q.question_id))
-        
-        score = (correct_count / total * 10.0) if total > 0 else 0
-        now_str = datetime.now().isoformat()
-        
-        cursor.execute("UPDATE results SET score = ?, status = 'completed', submit_time = ? WHERE result_id = ?",
-                       (score, now_str, result_id))
-        conn.commit()
-        conn.close()
-        
+            placeholders = ",".join("?" * len(correct_ids))
+            cursor.execute(f"UPDATE {schema}.result_details SET is_correct = (question_id IN ({placeholders})) WHERE result_id = ?",
+                           (*correct_ids, result_id))
+            
+            score = sheet_key.score(correct_count)
+            now_str = datetime.now().isoformat()
+            
+            cursor.execute(f"UPDATE {schema}.results SET score = ?, status = 'completed', submit_time = ? WHERE result_id = ?",
+                           (score, now_str, result_id))
+            return score, now_str
+
+        score, now_str = writer.run(grade)
+        if journal is not None: journal.discard()
         return Result(result_id, exam.exam_id, 0, score, now_str)
 
-    def delete_result(self, result_id):
+    def regrade_questions(self, question_ids: List[int], batch_size: int = 500, progress=None) -> Dict:
+        report = {"questions": len(set(question_ids)), "attempts": 0, "answers_changed": 0, "scores_changed": 0}
+        if not question_ids: return report
+        question_ids = sorted(set(question_ids))
+
         conn = get_connection()
+        cursor = conn.cursor()
         try:
-            conn.execute("DELETE FROM result_details WHERE result_id = ?", (result_id,))
-            conn.execute("DELETE FROM results WHERE result_id = ?", (result_id,))
+            cursor.execute("CREATE TEMP TABLE IF NOT EXISTS regrade_questions (question_id INTEGER PRIMARY KEY)")
+            cursor.execute("DELETE FROM regrade_questions")
+            cursor.executemany("INSERT OR IGNORE INTO regrade_questions (question_id) VALUES (?)", [(q,) for q in question_ids])
+
+            # Cached keys of exams using these questions are stale now
+            cursor.execute("SELECT DISTINCT exam_id FROM exam_details WHERE question_id IN (SELECT question_id FROM regrade_questions)")
+            for (exam_id,) in cursor.fetchall():
+                answer_keys.invalidate(exam_id)
+
+            # idx_result_details_question drives this lookup (once per schema; archived shards are not regraded)
+            result_ids = []
+            for schema in shards.writable_schemas():
+                cursor.execute(f"""
+                    SELECT DISTINCT rd.result_id
+                    FROM {schema}.result_details rd
+                    JOIN {schema}.results r ON r.result_id = rd.result_id
+                    WHERE rd.question_id IN (SELECT question_id FROM regrade_questions)
+                      AND r.status = 'completed'
+                    ORDER BY rd.result_id
+                """)
+                result_ids.extend(r[0] for r in cursor.fetchall())
             conn.commit()
-        except Exception as e:
-            conn.rollback()
-            raise e
         finally:
             conn.close()
+        report["attempts"] = len(result_ids)
+
+        def regrade(cursor, schema, batch):
+            # One batch per writer operation; the temp tables are the writer connection's and refilled each time
+            cursor.execute("CREATE TEMP TABLE IF NOT EXISTS regrade_questions (question_id INTEGER PRIMARY KEY)")
+            cursor.execute("CREATE TEMP TABLE IF NOT EXISTS regrade_batch (result_id INTEGER PRIMARY KEY, old_score REAL)")
+            cursor.execute("DELETE FROM regrade_questions")
+            cursor.executemany("INSERT INTO regrade_questions (question_id) VALUES (?)", [(q,) for q in question_ids])
+            cursor.execute("DELETE FROM regrade_batch")
+            cursor.executemany(f"INSERT INTO regrade_batch (result_id, old_score) SELECT result_id, score FROM {schema}.results WHERE result_id = ?",
+                               [(rid,) for rid in batch])
+            cursor.execute(f"""
+                UPDATE {schema}.result_details
+                SET is_correct = {_DETAIL_IS_CORRECT_SQL}
+                WHERE result_id IN (SELECT result_id FROM regrade_batch)
+                  AND question_id IN (SELECT question_id FROM regrade_questions)
+                  AND is_correct IS NOT {_DETAIL_IS_CORRECT_SQL}
+            """)
+            answers_changed = cursor.rowcount
+            self._rescore_batch(cursor, "regrade_batch", schema=schema)
+            cursor.execute(f"""
+                SELECT COUNT(*) FROM {schema}.results r
+                JOIN regrade_batch b ON b.result_id = r.result_id
+                WHERE abs(r.score - b.old_score) > 1e-9
+            """)
+            return answers_changed, cursor.fetchone()[0]
+
+        # Ids are grouped by schema, so batches only split at shard boundaries
+        batches = []
+        for start in range(0, len(result_ids), batch_size):
+            for schema, ids in groupby(result_ids[start:start + batch_size], key=shards.schema_of):
+                batches.append((start, schema, list(ids)))
+        for start, schema, batch in batches:
+            answers_changed, scores_changed = writer.run(regrade, schema, batch)
+            report["answers_changed"] += answers_changed
+            report["scores_changed"] += scores_changed
+            if progress and progress(min(start + batch_size, len(result_ids)), len(result_ids)) is False:
+                break
+        return report
+
+    def _rescore_batch(self, cursor, batch_table: str, complete_at: str = None, schema: str = "main") -> int:
+        # Score = correct / questions on the sheet * 10 (grading.SCORE_SQL, as in finish_exam)
+        extra = ", status = 'completed', submit_time = ?" if complete_at else ""
+        cursor.execute(f"""
+            UPDATE {schema}.results
+            SET score = (
+                SELECT {SCORE_SQL.format(is_correct="rd.is_correct")}
+                FROM {schema}.result_details rd WHERE rd.result_id = results.result_id
+            ){extra}
+            WHERE result_id IN (SELECT result_id FROM {batch_table})
+        """, (complete_at,) if complete_at else ())
+        rescored = cursor.rowcount
+        # Adaptive attempts are scored from the ability estimate instead (see _finish_adaptive)
+        cursor.execute(f"""
+            SELECT r.result_id, e.subject_id, e.test_length FROM {schema}.results r JOIN exams e ON e.exam_id = r.exam_id
+            WHERE r.result_id IN (SELECT result_id FROM {batch_table}) AND e.exam_type = 'adaptive'
+        """)
+        scores = []
+        for result_id, subject_id, test_length in cursor.fetchall():
+            steps = self._adaptive_steps(cursor, schema, result_id)
+            responses = [(r[1], bool(r[3])) for r in steps if r[4] is not None]
+            scores.append((adaptive.attempt_score(item_banks.get(cursor, subject_id), responses, test_length), result_id))
+        cursor.executemany(f"UPDATE {schema}.results SET score = ? WHERE result_id = ?", scores)
+        return rescored
+
+    def regrade_in_background(self, question_ids: List[int], batch_size: int = 500, on_progress=None) -> BackgroundJob:
+        return BackgroundJob(self.regrade_questions, list(question_ids), batch_size=batch_size,
+                             name="regrade", on_progress=on_progress).start()
+
+    def find_expired_attempts(self, now: datetime = None) -> List[int]:
+        now = now or datetime.now()
+        conn = get_connection()
+        cursor = conn.cursor()
+        try:
+            # Range scan on idx_results_status_deadline: deadline is fixed when the
+            # attempt starts (start_time + duration, capped by the exam's end_date)
+            cursor.execute(f"""
+                SELECT result_id FROM {shards.results()}
+                WHERE status = 'in_progress' AND deadline <= ?
+            """, (now.isoformat(),))
+            expired = {r[0] for r in cursor.fetchall()}
+
+            # Attempts started before deadlines were stored fall back to start_time + duration
+            cursor.execute(f"""
+                SELECT r.result_id
+                FROM {shards.results()} r
+                JOIN exams e ON e.exam_id = r.exam_id
+                WHERE r.status = 'in_progress' AND r.deadline IS NULL
+                  AND julianday(r.start_time) + e.duration / 1440.0 <= julianday(?)
+            """, (now.isoformat(),))
+            expired.update(r[0] for r in cursor.fetchall())
+
+            # Exams whose end_date has passed close every attempt still open
+            cursor.execute(f"""
+                SELECT r.result_id
+                FROM exams e
+                JOIN {shards.results()} r ON r.exam_id = e.exam_id AND r.status = 'in_progress'
+                WHERE e.end_date IS NOT NULL AND e.end_date <= ?
+            """, (now.strftime("%Y-%m-%d %H:%M:%S"),))
+            expired.update(r[0] for r in cursor.fetchall())
+            return sorted(expired)
+        finally:
+            conn.close()
+
+    def sweep_expired_attempts(self, now: datetime = None, batch_size: int = 500, progress=None) -> int:
+        self.release_unstarted_attempts(now)
+        result_ids = self.find_expired_attempts(now)
+        if not result_ids: return 0
+
+        now_str = (now or datetime.now()).isoformat()
+
+        def sweep(cursor, schema, batch):
+            cursor.execute("CREATE TEMP TABLE IF NOT EXISTS sweep_batch (result_id INTEGER PRIMARY KEY)")
+            cursor.execute("DELETE FROM sweep_batch")
+            # Re-check status inside the transaction: the student may have just submitted
+            cursor.executemany(f"INSERT INTO sweep_batch (result_id) SELECT result_id FROM {schema}.results WHERE result_id = ? AND status = 'in_progress'",
+                               [(rid,) for rid in batch])
+            cursor.execute(f"""
+                UPDATE {schema}.result_details
+                SET is_correct = {_DETAIL_IS_CORRECT_SQL}
+                WHERE result_id IN (SELECT result_id FROM sweep_batch)
+            """)
+            return self._rescore_batch(cursor, "sweep_batch", complete_at=now_str, schema=schema)
+
+        # One writer operation per batch, so student writes interleave with a long sweep
+        swept = 0
+        batches = []
+        for start in range(0, len(result_ids), batch_size):
+            for schema, ids in groupby(result_ids[start:start + batch_size], key=shards.schema_of):
+                batches.append((start, schema, list(ids)))
+        for start, schema, batch in batches:
+            swept += writer.run(sweep, schema, batch)
+            if progress and progress(min(start + batch_size, len(result_ids)), len(result_ids)) is False:
+                break
+        return swept
+
+    def start_expiry_sweeper(self, interval: float = 60) -> PeriodicJob:
+        return PeriodicJob(interval, self.sweep_expired_attempts, name="expiry-sweeper").start()
+
+    def prewarm_exam(self, exam_id: int, batch_size: int = 200) -> int:
+        # Creates a 'not_started' attempt with a blank answer sheet for every enrolled
+        # student who has none, and loads the exam payload and answer key into their
+        # caches, so Start at the exam's opening is one small update per student
+        conn = get_connection()
+        try:
+            cursor = conn.cursor()
+            exam = cursor.execute("SELECT subject_id, exam_type FROM exams WHERE exam_id = ?", (exam_id,)).fetchone()
+            if not exam: return 0
+            bank = payload = None
+            if exam[1] == 'adaptive':
+                # No shared sheet: every attempt gets its own first question
+                bank = item_banks.get(cursor, exam[0])
+            else:
+                payload = get_exam_payloads(cursor, [exam_id])[exam_id]
+                answer_keys.put(compile_answer_key(cursor, exam_id))
+            cursor.execute(f"""
+                SELECT DISTINCT m.student_id
+                FROM exam_assignments a JOIN class_members m ON m.class_id = a.class_id
+                WHERE a.exam_id = ?
+                  AND NOT EXISTS (SELECT 1 FROM {shards.results()} r WHERE r.student_id = m.student_id AND r.exam_id = a.exam_id)
+            """, (exam_id,))
+            students = [r[0] for r in cursor.fetchall()]
+        finally:
+            conn.close()
+        if not students or not (bank if bank is not None else payload): return 0
+        question_ids = [q.question_id for q in payload] if payload else []
+
+        def create(cursor, batch):
+            schema = shards.write_schema()
+            created = 0
+            for student_id in batch:
+                # Re-check on the writer: the student may have pressed Start meanwhile
+                cursor.execute(f"SELECT 1 FROM {shards.results()} WHERE student_id = ? AND exam_id = ?", (student_id, exam_id))
+                if cursor.fetchone(): continue
+                cursor.execute(f"""
+                    INSERT INTO {schema}.results (exam_id, student_id, score, submit_time, status, start_time, deadline)
+                    VALUES (?, ?, 0, '', 'not_started', NULL, NULL)
+                """, (exam_id, student_id))
+                result_id = cursor.lastrowid
+                if bank is not None:
+                    self._add_adaptive_step(cursor, schema, result_id, bank, 0.0, set())
+                else:
+                    cursor.executemany(f"INSERT INTO {schema}.result_details (result_id, question_id, selected_answer, is_correct) VALUES (?, ?, '', 0)",
+                                       [(result_id, qid) for qid in question_ids])
+                created += 1
+            return created
+
+        # Several short writer transactions, so answer saves of running exams are not held up
+        return sum(writer.run(create, students[i:i + batch_size]) for i in range(0, len(students), batch_size))
+
+    def prewarm_due_exams(self, lead_minutes: float = 10, now: datetime = None) -> Dict[int, int]:
+        # Exams assigned to classes that open within the next lead_minutes
+        now = now or datetime.now()
+        fmt = "%Y-%m-%d %H:%M:%S"
+        conn = get_connection()
+        try:
+            exam_ids = [r[0] for r in conn.execute("""
+                SELECT e.exam_id FROM exams e
+                WHERE e.status IN ('draft', 'published') AND e.start_date > ? AND e.start_date <= ?
+                  AND EXISTS (SELECT 1 FROM exam_assignments a WHERE a.exam_id = e.exam_id)
+            """, (now.strftime(fmt), (now + timedelta(minutes=lead_minutes)).strftime(fmt))).fetchall()]
+        finally:
+            conn.close()
+        return {exam_id: self.prewarm_exam(exam_id) for exam_id in exam_ids}
+
+    def start_prewarmer(self, interval: float = 60, lead_minutes: float = 10) -> PeriodicJob:
+        return PeriodicJob(interval, lambda: self.prewarm_due_exams(lead_minutes), name="exam-prewarm").start()
+
+    def release_unstarted_attempts(self, now: datetime = None) -> int:
+        # Pre-warmed attempts of students who never started a now closed exam
+        now_str = (now or datetime.now()).strftime("%Y-%m-%d %H:%M:%S")
+
+        def release(cursor):
+            return _drop_unstarted_attempts(cursor, "(e.status = 'closed' OR (e.end_date IS NOT NULL AND e.end_date <= ?))", (now_str,))
+        return writer.run(release)
+
+    def delete_result(self, result_id):
+        schema = shards.schema_of(result_id)
+
+        def delete(cursor):
+            cursor.execute(f"DELETE FROM {schema}.result_details WHERE result_id = ?", (result_id,))
+            cursor.execute(f"DELETE FROM {schema}.results WHERE result_id = ?", (result_id,))
+            cursor.execute("DELETE FROM answer_journal_sync WHERE result_id = ?", (result_id,))
+        writer.run(delete)
     
     def get_student_history(self, student_id: int) -> List[Result]:
         conn = get_connection()
         cursor = conn.cursor()
-        cursor.execute("""
+        cursor.execute(f"""
             SELECT r.result_id, r.exam_id, r.score, r.submit_time, e.exam_name, s.subject_name
-            FROM results r
+            FROM {shards.results()} r
             JOIN exams e ON r.exam_id = e.exam_id
             JOIN subjects s ON e.subject_id = s.subject_id
             WHERE r.student_id = ? AND r.status = 'completed'
@@ -534,13 +1434,58 @@ class ResultService:
             history.append(res)
         return history
 
+    def last_change_id(self) -> int:
+        conn = readpool.connection()
+        try:
+            return conn.execute("SELECT COALESCE(MAX(change_id), 0) FROM changelog").fetchone()[0]
+        finally:
+            conn.close()
+
+    def get_exam_changes(self, exam_id: int, after_change_id: int, limit: int = 5000) -> List[tuple]:
+        # Attempt changes (change_id, result_id, entity, kind, changed_at) above the caller's last seen id, oldest first
+        conn = readpool.connection()
+        try:
+            return conn.execute("""
+                SELECT change_id, result_id, entity, kind, changed_at FROM changelog
+                WHERE exam_id = ? AND change_id > ? AND result_id IS NOT NULL ORDER BY change_id LIMIT ?
+            """, (exam_id, after_change_id, limit)).fetchall()
+        finally:
+            conn.close()
+
+    def get_live_attempts(self, exam_id: int, result_ids: List[int] = None) -> List[Dict]:
+        # Open attempts of an exam, or just the given attempts (whatever their status).
+        # last_activity is only looked up for the full list; pollers take it from the changes.
+        if result_ids is not None and not result_ids: return []
+        if result_ids is None:
+            where, params = "r.exam_id = ? AND r.status = 'in_progress'", (exam_id,)
+        else:
+            where, params = f"r.result_id IN ({','.join('?' * len(result_ids))})", tuple(result_ids)
+        conn = readpool.connection()
+        try:
+            rows = conn.execute(f"""
+                SELECT r.result_id, u.full_name, r.status, r.deadline, r.score,
+                       (SELECT COUNT(*) FROM {shards.details()} d WHERE d.result_id = r.result_id),
+                       (SELECT COUNT(*) FROM {shards.details()} d WHERE d.result_id = r.result_id AND d.selected_answer <> '')
+                FROM {shards.results()} r JOIN users u ON u.user_id = r.student_id
+                WHERE {where}
+            """, params).fetchall()
+            activity = {}
+            if result_ids is None:
+                activity = dict(conn.execute("SELECT result_id, MAX(changed_at) FROM changelog WHERE exam_id = ? GROUP BY result_id",
+                                             (exam_id,)).fetchall())
+        finally:
+            conn.close()
+        return [{"result_id": r[0], "student_name": r[1], "status": r[2], "deadline": r[3], "score": r[4],
+                 "questions": r[5], "answered": r[6], "last_activity": activity.get(r[0])} for r in rows]
+
     def get_results_by_exam_id(self, exam_id: int) -> List[Result]:
-        conn = get_connection()
+        # Admin screen: read live, so deletions and new submissions show at once
+        conn = readpool.connection()
         cursor = conn.cursor()
-        cursor.execute("""
+        cursor.execute(f"""
             SELECT r.result_id, r.exam_id, r.student_id, r.score, r.submit_time, 
                    e.exam_name, s.subject_name, u.full_name, r.status
-            FROM results r
+            FROM {shards.results()} r
             JOIN exams e ON r.exam_id = e.exam_id
             JOIN subjects s ON e.subject_id = s.subject_id
             JOIN users u ON r.student_id = u.user_id
@@ -559,13 +1504,35 @@ class ResultService:
             history.append(res)
         return history
 
+    def iter_result_rows(self, exam_id: int = None, batch_size: int = 1000):
+        # Streams (result_id, exam_name, subject_name, student, score, submit_time) without building Result objects
+        conn = readpool.connection(stale_ok=True)
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT r.result_id, e.exam_name, s.subject_name, u.full_name, r.score, r.submit_time
+                FROM {shards.results()} r
+                JOIN exams e ON r.exam_id = e.exam_id
+                JOIN subjects s ON e.subject_id = s.subject_id
+                JOIN users u ON r.student_id = u.user_id
+                WHERE r.status = 'completed' AND (? IS NULL OR r.exam_id = ?)
+                ORDER BY r.exam_id, r.submit_time
+            """, (exam_id, exam_id))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows: break
+                yield from rows
+        finally:
+            conn.close()
+
     def get_all_results(self) -> List[Result]:
-        conn = get_connection()
+        # Admin screen: read live, so deletions and new submissions show at once
+        conn = readpool.connection()
         cursor = conn.cursor()
-        cursor.execute("""
+        cursor.execute(f"""
             SELECT r.result_id, r.exam_id, r.student_id, r.score, r.submit_time, 
                    e.exam_name, s.subject_name, u.full_name, r.status
-            FROM results r
+            FROM {shards.results()} r
             JOIN exams e ON r.exam_id = e.exam_id
             JOIN subjects s ON e.subject_id = s.subject_id
             JOIN users u ON r.student_id = u.user_id
@@ -588,9 +1555,10 @@ class ResultService:
         conn = get_connection()
         cursor = conn.cursor()
         
-        cursor.execute("""
+        schema = shards.schema_of(result_id)
+        cursor.execute(f"""
             SELECT r.result_id, r.exam_id, r.student_id, r.score, r.submit_time, e.exam_name, s.subject_name
-            FROM results r
+            FROM {schema}.results r
             JOIN exams e ON r.exam_id = e.exam_id
             JOIN subjects s ON e.subject_id = s.subject_id
             WHERE r.result_id = ?
@@ -604,18 +1572,19 @@ class ResultService:
         result.exam_name = row[5]
         result.subject_name = row[6]
         
-        cursor.execute("""
+        cursor.execute(f"""
             SELECT rd.result_detail_id, rd.question_id, rd.selected_answer, rd.is_correct,
-                   q.content, q.option_a, q.option_b, q.option_c, q.option_d, q.correct_answer
-            FROM result_details rd
+                   q.content, q.option_a, q.option_b, q.option_c, q.option_d, q.correct_answer, rd.ability, rd.ability_se
+            FROM {schema}.result_details rd
             JOIN questions q ON rd.question_id = q.question_id
             WHERE rd.result_id = ?
+            ORDER BY rd.result_detail_id
         """, (result_id,))
         rows = cursor.fetchall()
         conn.close()
 
         for r in rows:
-             rd = ResultDetail(r[0], result_id, r[1], r[2], r[3])
+             rd = ResultDetail(r[0], result_id, r[1], r[2], r[3], r[10], r[11])
              rd.question_content = r[4]
              rd.options = {'a': r[5], 'b': r[6], 'c': r[7], 'd': r[8]}
              rd.correct_answer = r[9]
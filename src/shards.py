@@ -0,0 +1,253 @@
+import os
+import sqlite3
+import threading
+from datetime import date
+from typing import Dict, List, NamedTuple
+
+import changelog
+
+# Optional time sharding for attempts. With no shards registered everything
+# stays in main.results / main.result_details and none of this costs anything.
+# Once a term shard exists:
+#   - every connection ATTACHes the shard files (archived ones read-only) and
+#     gets TEMP views all_results / all_result_details (UNION ALL over main and
+#     every shard) for history reads, plus all_answers, which joins each attempt
+#     to its answers inside every schema before the UNION (joining two UNION
+#     views instead would scan every result_details table);
+#   - new attempts are written to the newest open shard whose term has started;
+#   - result_id encodes the shard: shard N allocates ids from N * SHARD_SPAN, so
+#     any id routes to its schema without a lookup.
+# Services build their SQL with results()/details() for reads and
+# schema_of()/write_schema()/writable_schemas() for writes.
+# Note: SQLite allows 10 attached databases by default, and a transaction that
+# spans several WAL files is atomic per file only.
+
+SHARD_SPAN = 10 ** 9
+
+RESULTS_COLUMNS = "result_id, exam_id, student_id, score, submit_time, status, start_time, deadline"
+DETAILS_COLUMNS = "result_detail_id, result_id, question_id, selected_answer, is_correct, ability, ability_se"
+# One row per answer (or one row with NULL answer columns for an attempt without any)
+ANSWERS_SELECT = """SELECT r.result_id, r.exam_id, r.student_id, r.score, r.submit_time, r.status,
+    rd.question_id, rd.selected_answer, rd.is_correct
+    FROM {schema}.results r LEFT JOIN {schema}.result_details rd ON rd.result_id = r.result_id"""
+
+
+class Shard(NamedTuple):
+    shard_id: int
+    name: str
+    path: str
+    starts_on: str
+    archived: bool
+
+    @property
+    def schema(self) -> str:
+        return f"shard_{self.shard_id}"
+
+
+_lock = threading.Lock()
+_registry: Dict[str, List[Shard]] = {}  # storage name -> shards, loaded on first connection
+generation = 0  # bumped whenever shards are added or archived; long-lived connections reconnect
+
+
+def _db_name() -> str:
+    import database
+    return database.current_storage().name
+
+
+def _load(conn) -> List[Shard]:
+    try:
+        rows = conn.execute("SELECT shard_id, name, path, starts_on, archived FROM result_shards ORDER BY shard_id").fetchall()
+    except sqlite3.OperationalError:
+        return []  # before init_db created the registry
+    return [Shard(r[0], r[1], r[2], r[3], bool(r[4])) for r in rows]
+
+
+def shards() -> List[Shard]:
+    return _registry.get(_db_name(), [])
+
+
+def is_active() -> bool:
+    return bool(shards())
+
+
+def _details_columns(conn, schema: str) -> str:
+    # Shards archived before schema 9 are read-only and lack the adaptive ability columns
+    if schema == "main" or any(r[1] == "ability" for r in conn.execute(f"PRAGMA {schema}.table_info(result_details)")):
+        return DETAILS_COLUMNS
+    return DETAILS_COLUMNS.replace("ability, ability_se", "NULL AS ability, NULL AS ability_se")
+
+
+def attach(conn, db_name: str):
+    # Called by database.get_connection for every new connection
+    with _lock:
+        registered = _registry.get(db_name)
+        if registered is None:
+            registered = _registry[db_name] = _load(conn)
+    if not registered: return
+    for shard in registered:
+        if shard.archived:
+            conn.execute("ATTACH DATABASE ? AS " + shard.schema, (f"file:{shard.path}?mode=ro",))
+        else:
+            conn.execute("ATTACH DATABASE ? AS " + shard.schema, (shard.path,))
+    schemas = ["main"] + [s.schema for s in registered]
+    conn.execute("CREATE TEMP VIEW IF NOT EXISTS all_results AS " +
+                 " UNION ALL ".join(f"SELECT {RESULTS_COLUMNS} FROM {s}.results" for s in schemas))
+    conn.execute("CREATE TEMP VIEW IF NOT EXISTS all_result_details AS " +
+                 " UNION ALL ".join(f"SELECT {_details_columns(conn, s)} FROM {s}.result_details" for s in schemas))
+    conn.execute("CREATE TEMP VIEW IF NOT EXISTS all_answers AS " +
+                 " UNION ALL ".join(ANSWERS_SELECT.format(schema=s) for s in schemas))
+    # Triggers stored in a shard file cannot write to main.changelog (see changelog.py)
+    changelog.attach_triggers(conn, [s.schema for s in registered if not s.archived])
+
+
+def results() -> str:
+    return "all_results" if is_active() else "results"
+
+
+def details() -> str:
+    return "all_result_details" if is_active() else "result_details"
+
+
+def answers() -> str:
+    return "all_answers" if is_active() else "(" + ANSWERS_SELECT.format(schema="main") + ")"
+
+
+def schema_of(result_id: int) -> str:
+    shard_id = result_id // SHARD_SPAN
+    return f"shard_{shard_id}" if shard_id else "main"
+
+
+def write_schema(today: str = None) -> str:
+    # Newest open shard whose term has started; main before any term shard
+    today = today or date.today().isoformat()
+    current = [s for s in shards() if not s.archived and s.starts_on <= today]
+    return current[-1].schema if current else "main"
+
+
+def writable_schemas() -> List[str]:
+    return ["main"] + [s.schema for s in shards() if not s.archived]
+
+
+def _reload():
+    global generation
+    import database
+    storage = database.current_storage()
+    conn = sqlite3.connect(storage.uri, uri=True)
+    try:
+        with _lock:
+            _registry[storage.name] = _load(conn)
+            generation += 1
+    finally:
+        conn.close()
+
+
+def _init_shard_file(path: str, shard_id: int):
+    # Same tables as main minus the foreign keys (they cannot cross database files)
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS results (
+            result_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            exam_id INTEGER NOT NULL,
+            student_id INTEGER NOT NULL,
+            score REAL NOT NULL,
+            submit_time TEXT,
+            status TEXT DEFAULT 'completed',
+            start_time TEXT,
+            deadline TEXT
+        )
+        """)
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS result_details (
+            result_detail_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            result_id INTEGER NOT NULL,
+            question_id INTEGER NOT NULL,
+            selected_answer TEXT,
+            is_correct BOOLEAN NOT NULL,
+            ability REAL,
+            ability_se REAL
+        )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_result_details_result ON result_details (result_id, question_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_result_details_question ON result_details (question_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_results_status_deadline ON results (status, deadline)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_results_exam_status ON results (exam_id, status)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_results_student_exam ON results (student_id, exam_id)")
+        # Ids in this file start above shard_id * SHARD_SPAN
+        if conn.execute("SELECT COUNT(*) FROM sqlite_sequence WHERE name = 'results'").fetchone()[0] == 0:
+            conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('results', ?)", (shard_id * SHARD_SPAN,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def create_shard(name: str, starts_on: str = None, path: str = None) -> Shard:
+    import database
+    storage = database.current_storage()
+    if storage.path is None: raise ValueError("Term shards need a database file")
+    starts_on = starts_on or date.today().isoformat()
+    if path is None:
+        stem = os.path.splitext(storage.path)[0]
+        path = f"{stem}_{name}.db"
+    path = os.path.abspath(path)
+    conn = database.get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO result_shards (name, path, starts_on) VALUES (?, ?, ?)", (name, path, starts_on))
+        shard_id = cursor.lastrowid
+        try:
+            _init_shard_file(path, shard_id)
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+    finally:
+        conn.close()
+    _reload()
+    return next(s for s in shards() if s.shard_id == shard_id)
+
+
+def archive_shard(shard_id: int) -> Shard:
+    # Closed terms become read-only: no attempts may still be open in them
+    shard = next((s for s in shards() if s.shard_id == shard_id), None)
+    if shard is None: raise ValueError(f"Shard {shard_id} not found")
+    if shard.archived: return shard
+    import database
+    import writer
+    writer.shutdown()  # the writer's connection has the shard attached read-write
+    conn = sqlite3.connect(shard.path)
+    try:
+        open_attempts = conn.execute("SELECT COUNT(*) FROM results WHERE status IN ('in_progress', 'not_started')").fetchone()[0]
+        if open_attempts: raise ValueError(f"Shard {shard.name} still has {open_attempts} attempts in progress or not started")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        try:
+            # A single self-contained file is easier to copy away; needs every other
+            # connection to let go, otherwise the shard stays in WAL (still opens read-only)
+            conn.execute("PRAGMA journal_mode=DELETE")
+        except sqlite3.OperationalError:
+            pass
+    finally:
+        conn.close()
+    conn = database.get_connection()
+    try:
+        conn.execute("UPDATE result_shards SET archived = 1 WHERE shard_id = ?", (shard_id,))
+        conn.commit()
+    finally:
+        conn.close()
+    _reload()
+    return next(s for s in shards() if s.shard_id == shard_id)
+
+
+def shard_stats() -> List[Dict]:
+    stats = []
+    import database
+    conn = database.get_connection()
+    try:
+        for s in shards():
+            count = conn.execute(f"SELECT COUNT(*) FROM {s.schema}.results").fetchone()[0]
+            stats.append({**s._asdict(), "results": count,
+                          "file_bytes": os.path.getsize(s.path) if os.path.exists(s.path) else 0})
+    finally:
+        conn.close()
+    return stats
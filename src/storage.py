@@ -0,0 +1,69 @@
+import itertools
+import os
+import sqlite3
+import threading
+
+# Where a database lives. database.get_connection() opens every connection
+# through the active storage: the one a service was constructed with (see
+# services.bind_storage), otherwise the process default, a FileStorage at
+# database.DB_NAME. Writer queues, read pools, shard registries and the
+# answer-key cache are all kept per storage name, so several storages can be
+# used side by side in one process.
+
+
+class FileStorage:
+    is_memory = False
+
+    _wal_enabled = set()  # journal_mode=WAL persists in the file, so set it once per path
+    _wal_lock = threading.Lock()
+
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+        self.name = self.path
+
+    @property
+    def uri(self) -> str:
+        return self.path
+
+    def configure(self, conn: sqlite3.Connection):
+        if self.path not in self._wal_enabled:
+            conn.execute("PRAGMA journal_mode=WAL;")  # Enable Write-Ahead Logging for concurrency
+            with self._wal_lock: self._wal_enabled.add(self.path)
+
+    def close(self):
+        pass
+
+    def __repr__(self):
+        return f"FileStorage({self.path!r})"
+
+
+class MemoryStorage:
+    # A private in-memory database (shared cache, so every connection of this
+    # storage sees the same data) for tests and load simulations. It lives
+    # until close(); each instance is isolated from every other one and from
+    # the real file. Readers use read_uncommitted so they never wait on the
+    # writer queue's table locks. Shared-cache writers do not honour
+    # busy_timeout, so concurrent writes should go through the writer queue.
+    is_memory = True
+    path = None
+
+    _ids = itertools.count(1)
+
+    def __init__(self, label: str = "quiz"):
+        self.name = f"file:{label}-{os.getpid()}-{next(self._ids)}?mode=memory&cache=shared"
+        self._keeper = sqlite3.connect(self.name, uri=True, check_same_thread=False)  # holds the database open
+
+    @property
+    def uri(self) -> str:
+        return self.name
+
+    def configure(self, conn: sqlite3.Connection):
+        conn.execute("PRAGMA read_uncommitted = 1")
+
+    def close(self):
+        if self._keeper is not None:
+            self._keeper.close()
+            self._keeper = None
+
+    def __repr__(self):
+        return f"MemoryStorage({self.name!r})"
@@ -0,0 +1,228 @@
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict
+
+import database
+import instrumentation
+import querylog
+import shards
+
+# Single-writer queue. One thread owns one connection and applies submitted
+# write operations in order; whatever has queued up while the previous commit
+# was running goes into the next transaction (group commit). Each operation
+# runs in its own SAVEPOINT, so a failing operation is rolled back and reported
+# through its future without affecting the rest of the batch.
+#
+# An operation is fn(cursor, *args, **kwargs). It must not commit or roll back
+# itself; the return value becomes the future's result once the batch commits.
+# It runs with the submitting thread's instrumentation calls and querylog caller
+# restored, so its SQL is attributed to the service method that submitted it.
+# A batch that fails outside its operations (BEGIN, ROLLBACK TO, COMMIT) fails
+# all of its futures and the thread carries on with the next one.
+
+_STOP = object()
+RUN_TIMEOUT = 120.0  # seconds run() waits; the operation may still commit after a timeout
+
+
+class WriteQueue:
+    def __init__(self, storage=None, max_batch: int = 256, max_delay: float = 0.0):
+        self.storage = storage or database.current_storage()
+        self.shard_generation = shards.generation  # the connection below attached the shards known now
+        self._conn = database.get_connection(self.storage)
+        self._conn.isolation_level = None  # explicit BEGIN/SAVEPOINT/COMMIT in _apply
+        self._cursor = self._conn.cursor()
+        self.max_batch = max_batch
+        self.max_delay = max_delay  # optional wait for more work before starting a batch
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="db-writer", daemon=True)
+        self._lock = threading.Lock()
+        self._metrics = {
+            "operations": 0,
+            "failed_operations": 0,
+            "batches": 0,
+            "max_batch": 0,
+            "failed_batches": 0,
+            "lock_wait_seconds_total": 0.0,
+            "lock_wait_seconds_max": 0.0,
+            "queue_wait_seconds_total": 0.0,
+            "queue_wait_seconds_max": 0.0,
+            "commit_seconds_total": 0.0,
+        }
+
+    def start(self) -> "WriteQueue":
+        self._thread.start()
+        return self
+
+    def is_alive(self) -> bool:
+        return self._thread.is_alive()
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        future = Future()
+        if threading.current_thread() is self._thread:
+            # Called from inside an operation: already in the writer's transaction
+            try:
+                future.set_result(fn(self._cursor, *args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+            return future
+        if not self._thread.is_alive(): raise RuntimeError("Writer thread is not running")
+        context = None
+        if instrumentation.is_enabled() or querylog.is_enabled():
+            context = instrumentation.capture(querylog.caller(skip=(__name__,)) if querylog.is_enabled() else None)
+        self._queue.put((future, fn, args, kwargs, time.perf_counter(), context))
+        return future
+
+    def run(self, fn: Callable, *args, **kwargs):
+        # submit() and wait; re-raises the operation's exception (TimeoutError after RUN_TIMEOUT)
+        return self.submit(fn, *args, **kwargs).result(timeout=RUN_TIMEOUT)
+
+    def stop(self, timeout: float = None):
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            if self._thread is not threading.current_thread(): self._thread.join(timeout)
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def metrics(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._metrics)
+        stats["pending"] = self.pending()
+        return stats
+
+    def _next_batch(self, first):
+        batch = [first]
+        deadline = time.perf_counter() + self.max_delay
+        while len(batch) < self.max_batch:
+            try:
+                wait = deadline - time.perf_counter()
+                item = self._queue.get(timeout=wait) if wait > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)  # finish this batch, then stop
+                break
+            batch.append(item)
+        return batch
+
+    def _loop(self):
+        try:
+            with database.use_storage(self.storage):  # operations run against the queue's storage
+                while True:
+                    first = self._queue.get()
+                    if first is _STOP: break
+                    batch = self._next_batch(first)
+                    try:
+                        self._apply(self._conn, self._cursor, batch)
+                    except BaseException as e:
+                        self._fail_batch(batch, e)
+        finally:
+            self._conn.close()
+
+    def _fail_batch(self, batch, error):
+        # Nothing of the batch is kept: roll back what is left and fail every unanswered future
+        try:
+            if self._conn.in_transaction: self._cursor.execute("ROLLBACK")
+        except sqlite3.Error:
+            pass
+        for future, *_ in batch:
+            if future.done(): continue
+            if future.running() or future.set_running_or_notify_cancel(): future.set_exception(error)
+        with self._lock: self._metrics["failed_batches"] += 1
+
+    def _apply(self, conn, cursor, batch):
+        started = time.perf_counter()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+        except sqlite3.Error as e:
+            for future, *_ in batch:
+                if future.set_running_or_notify_cancel(): future.set_exception(e)
+            with self._lock: self._metrics["failed_batches"] += 1
+            return
+        lock_wait = time.perf_counter() - started
+
+        outcomes = []
+        queue_waits = []
+        for future, fn, args, kwargs, submitted, context in batch:
+            if not future.set_running_or_notify_cancel(): continue
+            queue_waits.append(started - submitted)
+            cursor.execute("SAVEPOINT op")
+            try:
+                if context is None:
+                    value = fn(cursor, *args, **kwargs)
+                else:
+                    with instrumentation.attributed(context): value = fn(cursor, *args, **kwargs)
+                outcomes.append((future, value, None))
+                cursor.execute("RELEASE op")
+            except BaseException as e:
+                cursor.execute("ROLLBACK TO op")
+                cursor.execute("RELEASE op")
+                outcomes.append((future, None, e))
+
+        t_commit = time.perf_counter()
+        try:
+            cursor.execute("COMMIT")
+        except sqlite3.Error as e:
+            if conn.in_transaction: cursor.execute("ROLLBACK")
+            outcomes = [(future, None, e) for future, _, _ in outcomes]
+        commit_time = time.perf_counter() - t_commit
+
+        failed = 0
+        for future, value, error in outcomes:
+            if error is not None:
+                failed += 1
+                future.set_exception(error)
+            else:
+                future.set_result(value)
+
+        with self._lock:
+            m = self._metrics
+            m["operations"] += len(outcomes)
+            m["failed_operations"] += failed
+            m["batches"] += 1
+            m["max_batch"] = max(m["max_batch"], len(outcomes))
+            m["lock_wait_seconds_total"] += lock_wait
+            m["lock_wait_seconds_max"] = max(m["lock_wait_seconds_max"], lock_wait)
+            m["queue_wait_seconds_total"] += sum(queue_waits)
+            m["queue_wait_seconds_max"] = max([m["queue_wait_seconds_max"]] + queue_waits)
+            m["commit_seconds_total"] += commit_time
+
+
+_writers: Dict[str, WriteQueue] = {}
+_writer_lock = threading.Lock()
+
+
+def get_writer() -> WriteQueue:
+    # One writer per storage (see database.current_storage); a new or archived shard gets a new one
+    storage = database.current_storage()
+    with _writer_lock:
+        w = _writers.get(storage.name)
+        if w is None or not w.is_alive() or w.shard_generation != shards.generation:
+            if w is not None: w.stop()
+            w = _writers[storage.name] = WriteQueue(storage).start()
+        return w
+
+
+def submit(fn: Callable, *args, **kwargs) -> Future:
+    return get_writer().submit(fn, *args, **kwargs)
+
+
+def run(fn: Callable, *args, **kwargs):
+    return get_writer().run(fn, *args, **kwargs)
+
+
+def metrics() -> Dict[str, float]:
+    w = _writers.get(database.current_storage().name)
+    return w.metrics() if w is not None else {}
+
+
+def shutdown(timeout: float = None, storage=None):
+    # Stops the writer of one storage, or all of them
+    with _writer_lock:
+        names = [storage.name] if storage is not None else list(_writers)
+        for name in names:
+            w = _writers.pop(name, None)
+            if w is not None: w.stop(timeout)
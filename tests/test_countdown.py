@@ -0,0 +1,76 @@
+import math
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from countdown import Countdown
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+class CountdownTest(unittest.TestCase):
+    def test_slow_ticks_do_not_drift(self):
+        clock = FakeClock()
+        countdown = Countdown(120, clock=clock)
+        start = clock.now
+        displayed = []
+        ticks = 0
+        while not countdown.expired():
+            # A busy UI thread: each callback is 250 ms late, every fifth one 1.7 s late
+            clock.advance((countdown.ms_until_next_tick() + (1700 if ticks % 5 == 4 else 250)) / 1000.0)
+            ticks += 1
+            elapsed = clock.now - start
+            self.assertAlmostEqual(countdown.remaining(), max(0.0, 120 - elapsed), places=9)
+            displayed.append(countdown.display())
+            self.assertEqual(countdown.display(), self.expected_display(max(0.0, 120 - elapsed)))
+        # Expires when 120 s of clock time have passed, not after 120 callbacks
+        self.assertLess(ticks, 120)
+        self.assertLess(clock.now - start - 120, 2.0)
+        self.assertEqual(displayed[-1], "00:00")
+
+    def test_on_time_ticks_show_every_second(self):
+        clock = FakeClock()
+        countdown = Countdown(65, clock=clock)
+        seen = [countdown.display()]
+        while not countdown.expired():
+            clock.advance(countdown.ms_until_next_tick() / 1000.0)
+            seen.append(countdown.display())
+        self.assertEqual(seen[0], "01:05")
+        self.assertEqual(seen[1], "01:04")
+        self.assertEqual(len(seen), len(set(seen)))  # no second shown twice
+        self.assertEqual(len(seen), 66)              # and none skipped
+
+    def test_tick_lands_just_after_the_second_changes(self):
+        clock = FakeClock()
+        countdown = Countdown(10.5, clock=clock)
+        self.assertEqual(countdown.display(), "00:11")
+        self.assertEqual(countdown.ms_until_next_tick(slack_ms=5), 505)
+        clock.advance(0.505)
+        self.assertEqual(countdown.display(), "00:10")
+        # The next second boundary is again about a second away, not 1000 ms after the late tick
+        self.assertAlmostEqual(countdown.ms_until_next_tick(slack_ms=5), 1000, delta=1)
+
+    def test_negative_remaining_is_expired(self):
+        countdown = Countdown(-5, clock=FakeClock())
+        self.assertTrue(countdown.expired())
+        self.assertEqual(countdown.display(), "00:00")
+
+    @staticmethod
+    def expected_display(remaining: float) -> str:
+        m, s = divmod(int(math.ceil(remaining)), 60)
+        return f"{m:02d}:{s:02d}"
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from journal import AnswerJournal
+
+
+class AnswerJournalRecoveryTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "attempt.journal")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def write_records(self, answers):
+        journal = AnswerJournal(self.path, result_id=1)
+        for question_id, answer in answers:
+            journal.append(question_id, answer)
+        journal.close()
+        return os.path.getsize(self.path)
+
+    def test_reopen_keeps_every_record(self):
+        self.write_records([(10, "a"), (11, "b"), (10, "c")])
+        journal = AnswerJournal(self.path, result_id=1)
+        try:
+            self.assertEqual(journal.records, [(1, 10, "a"), (2, 11, "b"), (3, 10, "c")])
+            self.assertEqual(journal.latest_answers(), {10: "c", 11: "b"})
+            self.assertEqual(journal.seq, 3)
+        finally:
+            journal.close()
+
+    def test_torn_tail_is_dropped_and_cut(self):
+        good = self.write_records([(10, "a"), (11, "b")])
+        with open(self.path, "ab") as f:
+            f.write(b"3\t12\t\"d")  # crash in the middle of the third line
+        journal = AnswerJournal(self.path, result_id=1)
+        try:
+            self.assertEqual(journal.records, [(1, 10, "a"), (2, 11, "b")])
+            self.assertEqual(os.path.getsize(self.path), good)
+            # New appends continue the sequence on a clean line
+            self.assertEqual(journal.append(12, "d"), 3)
+        finally:
+            journal.close()
+        reopened = AnswerJournal(self.path, result_id=1)
+        try:
+            self.assertEqual(reopened.records, [(1, 10, "a"), (2, 11, "b"), (3, 12, "d")])
+        finally:
+            reopened.close()
+
+    def test_corrupt_line_ends_the_journal(self):
+        self.write_records([(10, "a"), (11, "b"), (12, "c")])
+        with open(self.path, "rb") as f:
+            lines = f.read().split(b"\n")
+        lines[1] = lines[1].replace(b'"b"', b'"x"')  # CRC no longer matches
+        with open(self.path, "wb") as f:
+            f.write(b"\n".join(lines))
+        journal = AnswerJournal(self.path, result_id=1)
+        try:
+            # Nothing after a bad record is trusted
+            self.assertEqual(journal.records, [(1, 10, "a")])
+            self.assertEqual(os.path.getsize(self.path), len(lines[0]) + 1)
+        finally:
+            journal.close()
+
+    def test_synced_seq_from_elsewhere_numbers_new_records_above_it(self):
+        journal = AnswerJournal(self.path, result_id=1, synced_seq=7)
+        try:
+            self.assertEqual(journal.append(10, "a"), 8)
+            self.assertEqual(journal.pending(), [(8, 10, "a")])
+            journal.mark_synced(8)
+            self.assertEqual(journal.pending(), [])
+        finally:
+            journal.close()
+
+    def test_discard_removes_the_file(self):
+        self.write_records([(10, "a")])
+        journal = AnswerJournal(self.path, result_id=1)
+        journal.discard()
+        self.assertFalse(os.path.exists(self.path))
+
+
+if __name__ == "__main__":
+    unittest.main()